@@ -1,28 +1,573 @@
 import pandas as pd
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, make_response, copy_current_request_context
 import re
 import math
-from itertools import combinations, product
+import heapq
+import bisect
 import numpy as np
 import io  
+import os
+import time
+import json
+import hashlib
+import secrets
+import sqlite3
+import tempfile
+import csv
+import zipfile
+import shutil
+import threading
+import queue
+import functools
+import contextvars
+import cProfile
+from collections import OrderedDict, Counter, ChainMap
+from collections.abc import Mapping
+from contextlib import contextmanager
+import urllib.request
+import click
+import openpyxl
+from openpyxl.utils import get_column_letter
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from flask import g, has_request_context
+from flask.json.provider import DefaultJSONProvider
 
 app = Flask(__name__)
 
 # --- Configuration & Global Variables ---
 STUDENTS_CSV_PATH = 'students1.csv'
 TIMETABLE_CSV_PATH = 'timetable1.csv'
+ROOMS_CSV_PATH = 'rooms1.csv' # optional Room,Capacity list of bookable rooms; without it AVAILABLE_ROOMS, size unknown
 LUNCH_SLOT = '12:30-01:30'
 AVAILABLE_ROOMS = [f"NC{i:02d}" for i in range(1, 15)] # NC01 to NC14
 MAX_BATCH_OPTIONS = 5
 TOP_N_SOLUTIONS_TO_SHOW = 10
-TOP_N_SLOTS_HEURISTIC = 30
+TOP_N_SLOTS_HEURISTIC = 30 # Only used by the greedy solver
+GROUP_MATRIX_BLOCK = 256 # groups per matrix product when group_slot_free_counts is built
+SOLVER_OPTIONS = ['flow', 'greedy'] # 'flow' = exact balanced split, 'greedy' = original heuristic (?solver=greedy)
+DEFAULT_SOLVER = 'flow'
+# How many ranked options a search keeps. One page by default, since every extra option costs search work and
+# stored rows; raise it to let callers page further (/solutions/<token>?page=N)
+MAX_RANKED_SOLUTIONS = int(os.environ.get('MAX_RANKED_SOLUTIONS', TOP_N_SOLUTIONS_TO_SHOW))
+# The SQLite files the workers share (paging handles, result cache, jobs) and profiles go in STATE_DIR, created
+# readable by this user only: never the shared temp dir, where anyone could plant the file first
+STATE_DIR = os.environ.get('STATE_DIR', os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'freestudents'))
+# Paging handles live in SQLite (RESULT_HANDLE_DB_PATH), so the next page can come from any worker
+RESULT_HANDLE_TTL_SECONDS = 30 * 60
+MAX_RESULT_HANDLES = 1000 # shared by all workers on the host
+RESULT_HANDLE_DB_PATH = os.environ.get('RESULT_HANDLE_DB_PATH', os.path.join(STATE_DIR, 'result_handles.sqlite3'))
+# Result cache for repeated searches: 'memory' (per worker), 'sqlite' (one file shared by all workers on the box) or 'off'
+RESULT_CACHE_BACKEND = os.environ.get('RESULT_CACHE_BACKEND', 'memory')
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', os.path.join(STATE_DIR, 'result_cache.sqlite3'))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', 10 * 60))
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', 4)) # threads running the groups of one /bulk_schedule request side by side
+# Process-parallel search: the combination space is split by first slot index across SEARCH_WORKERS processes
+# (0/1 = search in-process). Spaces smaller than PARALLEL_MIN_COMBINATIONS are not worth the round trip.
+SEARCH_WORKERS = int(os.environ.get('SEARCH_WORKERS', 0))
+PARALLEL_MIN_COMBINATIONS = int(os.environ.get('PARALLEL_MIN_COMBINATIONS', 20000))
+# Per-request search budget; past it the best options found so far are returned (marked 'partial'),
+# well before gunicorn's 120s worker timeout. 0 = no deadline.
+SEARCH_DEADLINE_SECONDS = float(os.environ.get('SEARCH_DEADLINE_SECONDS', 90))
+# Hot reload: each worker polls the CSVs every DATA_WATCH_INTERVAL_SECONDS (0 = off); POST /reload_data
+# reloads at once (send X-Reload-Token when RELOAD_TOKEN is set)
+# Binary snapshot of the cleaned CSVs (flask --app app build-snapshot); workers boot from it while its
+# content hash matches the CSVs, otherwise they parse the CSVs as before. '' = never use a snapshot.
+DATA_SNAPSHOT_DIR = os.environ.get('DATA_SNAPSHOT_DIR', 'data_snapshot')
+SNAPSHOT_FORMAT = 3
+DATA_WATCH_INTERVAL_SECONDS = float(os.environ.get('DATA_WATCH_INTERVAL_SECONDS', 5))
+RELOAD_TOKEN = os.environ.get('RELOAD_TOKEN')
+EXPORT_FORMATS = ['xlsx', 'csv'] # downloads: a workbook, or CSV (a ZIP of CSVs when there are several sheets)
+EXPORT_CHUNK_ROWS = 1000 # CSV rows per streamed chunk
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+SOLUTION_EXPORT_HEADERS = ['Batch', 'Day', 'Time', 'Room', 'MIS', 'Name', 'Branch']
+PROGRESS_INTERVAL_SECONDS = 0.25 # how often a streamed search (?stream=1) reports the options it has so far
+# Instrumentation: phase timings and search counters go to /metrics and the Server-Timing header.
+# A request whose X-Profile header matches PROFILE_TOKEN (unset = profiling off) also runs under PROFILER
+# ('cprofile', or 'pyinstrument' if installed); only the request thread is profiled (suggestion/bulk
+# threads and search processes show up as waiting). The file lands in PROFILE_DIR, named in X-Profile-File.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILER = os.environ.get('PROFILER', 'cprofile')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(STATE_DIR, 'profiles'))
+# Background jobs: a search route called with async=1 answers with a job id at once and the search runs on
+# JOB_WORKERS threads of the worker that took it, with a JOB_DEADLINE_SECONDS budget instead of the request's.
+# Job state lives in SQLite (JOB_DB_PATH) so GET /jobs/<id> and DELETE /jobs/<id> work from any worker;
+# finished jobs are kept for JOB_TTL_SECONDS. A job does not hold up reloads: one that overlaps a reload fails with
+# 409 and is to be run again. DELETE /jobs/<id> stops searches on the job's own threads; a walk handed to the
+# SEARCH_WORKERS processes cannot see the cancellation and runs on until the job's deadline.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join(STATE_DIR, 'jobs.sqlite3'))
+JOB_DEADLINE_SECONDS = float(os.environ.get('JOB_DEADLINE_SECONDS', 600))
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 60 * 60))
+JOB_POLL_SECONDS = 0.5 # how often a worker saves the progress of its running jobs and picks up cancellations
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120) # histogram bounds, seconds
 
 students_df_global, timetable_clash_global, room_occupancy = None, None, {}
+room_capacity = {} # bookable room -> seats (None = unknown), in rooms1.csv (or AVAILABLE_ROOMS) order
+room_index = None # RoomIntervalIndex over the full timetable
+DATA_VERSION = None # content hash of the two CSVs; part of every cache key
 all_possible_slots, SUBJECT_OPTIONS, DIVISION_OPTIONS, DAYS_OPTIONS, TIMES_OPTIONS_FORMATTED, TIMES_OPTIONS_FULL, ALL_DAYS_OPTIONS = [], [], [], [], [], [], []
 TIMES_OPTIONS_FORMATTED_END = []
 student_schedule_map = {}
 subject_division_map = {} 
 
+# ## --- BITSET AVAILABILITY INDEX (built once in load_and_prepare_data) --- ##
+# Students are numbered in order of first appearance in students1.csv; every (Day, Time)
+# slot of the full timetable (lunch + Saturday included) gets one boolean row.
+STUDENT_MIS_LIST, INDEX_SLOTS = [], []
+student_index_map, slot_index_map = {}, {}
+slot_free_matrix = np.zeros((0, 0), dtype=bool) # [slot, student] -> True if the student has no class
+slot_class_matrix = np.zeros((0, 0), dtype=np.int16) # [slot, student] -> their first class (index into slot_classes_map[slot]), -1 = free
+extra_clashes = {} # slot row -> {student id: [further class indices]}, for the few students with two classes at once
+group_mask_map = {} # (Subject, Division) -> boolean mask over STUDENT_MIS_LIST
+GROUP_KEYS = [] # every (Subject, Division) of students1.csv, in group_members_map order
+group_row_map = {} # (Subject, Division) -> row of group_slot_free_counts
+group_signature_map = {} # (smallest student id, size) -> groups with that signature, to recognise a whole group from its MIS list
+group_slot_free_counts = np.zeros((0, 0), dtype=np.int32) # [group, slot] -> members with no class in INDEX_SLOTS[slot]
+
+# ## --- COLUMNAR DATA LAYER (interned ids, built once in load_and_prepare_data) --- ##
+# Strings are interned to small ints (SUBJECT_TABLE[subject_id] == subject name, etc.);
+# student ids are the same ones the availability index uses (STUDENT_MIS_LIST).
+SUBJECT_TABLE, DIVISION_TABLE, DAY_TABLE, TIME_TABLE = [], [], [], []
+enrollment_columns = {} # 'student'/'subject'/'division' -> int32 array, one entry per students1.csv row
+timetable_columns = {} # 'subject'/'division'/'day'/'time' -> int32 array, 'room' -> list, one entry per timetable1.csv row
+group_members_map = {} # (Subject, Division) -> sorted int32 array of student ids
+student_records = {} # MIS -> {'MIS', 'Branch', 'Subject', 'Division', 'Name'} (first row per MIS, like drop_duplicates)
+slot_classes_map = {} # (Day, Time) -> [(Subject, Division, Room)] in timetable order
+
+class ResultCache:
+    """
+    Bounded LRU + TTL cache: normalized request key -> ranked (lean) result.
+    Keys embed DATA_VERSION, and invalidate() drops entries built from older data.
+    The sqlite backend stores the results as JSON (see _lean_result_to_json), never as pickles.
+    """
+    def __init__(self, backend, path, max_entries, ttl_seconds):
+        self.backend, self.path, self.max_entries, self.ttl_seconds = backend, path, max_entries, ttl_seconds
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # memory backend: key -> (stored_at, data_version, value)
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.local = threading.local()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A preloaded master may have opened a connection already; SQLite handles must not cross a fork
+        self.lock, self.local = threading.Lock(), threading.local()
+
+    def _db(self):
+        # One connection per thread; WAL lets every worker read while one writes
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS lean_results (key TEXT PRIMARY KEY, version TEXT, stored_at REAL, used_at REAL, value TEXT)')
+            db.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)')
+            self.local.db = db
+        return db
+
+    def _count(self, name, amount=1):
+        if not amount: return
+        with self.lock: self.counters[name] += amount
+        if self.backend == 'sqlite':
+            self._db().execute('INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value', (name, amount))
+
+    def get(self, key):
+        if self.backend not in ('memory', 'sqlite'): return None
+        now, value, expired = time.time(), None, False
+        if self.backend == 'memory':
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry and entry[0] >= now - self.ttl_seconds:
+                    self.entries.move_to_end(key)
+                    value = entry[2]
+                elif entry:
+                    del self.entries[key]
+                    expired = True
+        else:
+            db = self._db()
+            row = db.execute('SELECT stored_at, value FROM lean_results WHERE key = ?', (key,)).fetchone()
+            if row and row[0] >= now - self.ttl_seconds:
+                db.execute('UPDATE lean_results SET used_at = ? WHERE key = ?', (now, key))
+                value = _lean_result_from_json(row[1])
+            elif row:
+                expired = db.execute('DELETE FROM lean_results WHERE key = ?', (key,)).rowcount > 0
+        self._count('evictions', int(expired))
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, key, value):
+        if self.backend not in ('memory', 'sqlite'): return
+        now, evicted = time.time(), 0
+        if self.backend == 'memory':
+            with self.lock:
+                self.entries[key] = (now, DATA_VERSION, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    evicted += 1
+        else:
+            db = self._db()
+            db.execute('INSERT OR REPLACE INTO lean_results VALUES (?, ?, ?, ?, ?)', (key, DATA_VERSION, now, now, _lean_result_to_json(value)))
+            evicted = db.execute('DELETE FROM lean_results WHERE key IN (SELECT key FROM lean_results ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,)).rowcount
+        self._count('evictions', evicted)
+
+    def invalidate(self, data_version):
+        # Called after a data (re)load; entries from other versions could never be hit again anyway
+        if self.backend == 'memory':
+            with self.lock: self.entries = OrderedDict((k, v) for k, v in self.entries.items() if v[1] == data_version)
+        elif self.backend == 'sqlite':
+            self._db().execute('DELETE FROM lean_results WHERE version IS NOT ?', (data_version,))
+
+    def stats(self):
+        stats = {'backend': self.backend, 'max_entries': self.max_entries, 'ttl_seconds': self.ttl_seconds, **self.counters, 'entries': len(self.entries)}
+        if self.backend == 'sqlite':
+            db = self._db()
+            stats.update({name: value for name, value in db.execute('SELECT name, value FROM counters')}) # shared by all workers
+            stats['entries'] = db.execute('SELECT COUNT(*) FROM lean_results').fetchone()[0]
+        return stats
+
+class Metrics:
+    """
+    Counters and latency histograms of this process, rendered in the Prometheus text format by /metrics.
+    Every gunicorn worker keeps its own, so a scrape reports the worker that answered it.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {} # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> [count per bucket..., count above the last one, sum]
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A worker starts from zero, not from what the preloaded master counted
+        self.lock, self.counters, self.histograms = threading.Lock(), {}, {}
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock: self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key) or self.histograms.setdefault(key, [0] * (len(self.buckets) + 2))
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[-1] += seconds
+
+    @staticmethod
+    def _series(name, labels, value):
+        escape = lambda text: str(text).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        label_text = ','.join(f'{key}="{escape(text)}"' for key, text in labels)
+        return f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}"
+
+    def render(self, extra=()):
+        # extra: [(name, type, labels dict, value)], values read at scrape time
+        with self.lock: counters, histograms = dict(self.counters), {key: list(histogram) for key, histogram in self.histograms.items()}
+        lines, declared = [], set()
+        def declare(name, kind):
+            if name not in declared: declared.add(name); lines.append(f"# TYPE {name} {kind}")
+        for (name, labels), value in sorted(counters.items()):
+            declare(name, 'counter')
+            lines.append(self._series(name, labels, value))
+        for (name, labels), histogram in sorted(histograms.items()):
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                cumulative += count
+                lines.append(self._series(f"{name}_bucket", labels + (('le', bound),), cumulative))
+            lines.append(self._series(f"{name}_sum", labels, round(histogram[-1], 6)))
+            lines.append(self._series(f"{name}_count", labels, cumulative))
+        for name, kind, labels, value in extra:
+            declare(name, kind)
+            lines.append(self._series(name, tuple(sorted(labels.items())), value))
+        return '\n'.join(lines) + '\n'
+
+class JobStore:
+    """
+    Background search jobs in SQLite, shared by every worker on the host: status ('queued', 'running',
+    'cancelling', then 'done', 'failed' or 'cancelled'), progress and the final response, as JSON.
+    A unique index over the key of the queued and running jobs makes deduplication atomic across workers.
+    """
+    FIELDS = ('id', 'key', 'endpoint', 'status', 'pid', 'created_at', 'started_at', 'finished_at', 'progress', 'result')
+
+    def __init__(self, path, ttl_seconds):
+        self.path, self.ttl_seconds = path, ttl_seconds
+        self.local = threading.local()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.local = threading.local()
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, key TEXT, endpoint TEXT, status TEXT, pid INTEGER, created_at REAL, started_at REAL, finished_at REAL, progress TEXT, result TEXT)')
+            db.execute("CREATE UNIQUE INDEX IF NOT EXISTS active_jobs ON jobs (key) WHERE status IN ('queued', 'running')")
+            self.local.db = db
+        return db
+
+    def create(self, key, endpoint):
+        # (job id, True) for a new job, or (id of the identical job already queued or running, False)
+        db, now = self._db(), time.time()
+        db.execute('DELETE FROM jobs WHERE finished_at < ?', (now - self.ttl_seconds,))
+        for _ in range(2):
+            job_id = secrets.token_urlsafe(12)
+            try:
+                db.execute("INSERT INTO jobs (id, key, endpoint, status, pid, created_at, progress) VALUES (?, ?, ?, 'queued', ?, ?, '{}')", (job_id, key, endpoint, os.getpid(), now))
+                return job_id, True
+            except sqlite3.IntegrityError: pass
+            row = db.execute("SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running')", (key,)).fetchone()
+            if row and self._alive(self.get(row[0])): return row[0], False
+        raise RuntimeError('Could not queue the job.')
+
+    def get(self, job_id):
+        row = self._db().execute(f"SELECT {', '.join(self.FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None: return None
+        job = dict(zip(self.FIELDS, row))
+        job['progress'], job['result'] = json.loads(job['progress'] or '{}'), job['result'] and json.loads(job['result'])
+        return job
+
+    def _alive(self, job):
+        # A job whose worker died (restarted, killed by a timeout) would stay 'running' forever: fail it
+        if job['status'] not in ('queued', 'running', 'cancelling'): return True
+        try: os.kill(job['pid'], 0)
+        except ProcessLookupError:
+            self.update(job['id'], status='failed', finished_at=time.time(), result={'error': 'The worker running this job exited.'})
+            job.update(self.get(job['id']))
+            return False
+        except PermissionError: pass
+        return True
+
+    def refresh(self, job_id):
+        job = self.get(job_id)
+        if job: self._alive(job)
+        return job
+
+    def update(self, job_id, **fields):
+        for name in ('progress', 'result'):
+            if name in fields: fields[name] = json.dumps(fields[name])
+        self._db().execute(f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?", (*fields.values(), job_id))
+
+    def start(self, job_id):
+        # False if the job was cancelled while it was queued
+        return self._db().execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'", (time.time(), job_id)).rowcount > 0
+
+    def cancel(self, job_id):
+        # A queued job is cancelled at once; a running one is asked to stop (see _watch_jobs)
+        db, now = self._db(), time.time()
+        db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'", (now, job_id))
+        db.execute("UPDATE jobs SET status = 'cancelling' WHERE id = ? AND status = 'running'", (job_id,))
+        return self.refresh(job_id)
+
+    def cancelling(self, job_ids):
+        if not job_ids: return set()
+        rows = self._db().execute(f"SELECT id FROM jobs WHERE status = 'cancelling' AND id IN ({', '.join('?' * len(job_ids))})", list(job_ids))
+        return {row[0] for row in rows}
+
+class ResultHandleStore:
+    """
+    Server-side result handles for paging through ranked options (/solutions/<token>): token -> the lean result
+    of the search (from _rank_balanced_combinations / Mode 4) as JSON, in SQLite so that any worker can serve
+    the pages of a search another one ran. Keeps the newest max_entries handles, each for ttl_seconds.
+    """
+    def __init__(self, path, max_entries, ttl_seconds):
+        self.path, self.max_entries, self.ttl_seconds = path, max_entries, ttl_seconds
+        self.local = threading.local()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.local = threading.local()
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS handles (token TEXT PRIMARY KEY, version TEXT, created_at REAL, result TEXT)')
+            self.local.db = db
+        return db
+
+    def add(self, result):
+        db, now, token = self._db(), time.time(), secrets.token_urlsafe(12)
+        db.execute('DELETE FROM handles WHERE created_at < ?', (now - self.ttl_seconds,))
+        db.execute('INSERT INTO handles VALUES (?, ?, ?, ?)', (token, DATA_VERSION, now, _lean_result_to_json(result)))
+        db.execute('DELETE FROM handles WHERE token IN (SELECT token FROM handles ORDER BY created_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+        return token
+
+    def get(self, token):
+        # (data version, lean result), or None for an unknown or expired token
+        row = self._db().execute('SELECT version, created_at, result FROM handles WHERE token = ?', (token,)).fetchone()
+        if row is None or row[1] < time.time() - self.ttl_seconds: return None
+        return row[0], _lean_result_from_json(row[2])
+
+class StudentScheduleView(Mapping):
+    """
+    MIS -> set of busy (Day, Time) slots, read straight off the availability index instead of being
+    stored as one Python set of tuples per student. Those ~20k sets were the bulk of the per-worker heap,
+    and unlike the numpy buffers every read wrote to their refcounts, so they could not stay shared
+    between preloaded gunicorn workers (see gunicorn.conf.py).
+    """
+    def __init__(self, free_matrix, index_map, slots):
+        self.free_matrix, self.index_map, self.slots = free_matrix, index_map, slots
+
+    def __getitem__(self, mis):
+        return {self.slots[i] for i in np.flatnonzero(~self.free_matrix[:, self.index_map[mis]])}
+
+    def __iter__(self): return iter(self.index_map)
+
+    def __len__(self): return len(self.index_map)
+
+class RoomIntervalIndex:
+    """
+    (Room, Day) -> sorted busy intervals in minutes (overlapping classes merged), so whether a room is free
+    for a time range is one bisect, O(log n), instead of a scan over the timetable rows.
+    Times that do not parse as 'hh:mm-hh:mm' are only matched exactly.
+    """
+    def __init__(self, bookings=()):
+        spans, self.unparsed = {}, set()
+        for room, day, time_str in bookings:
+            interval = _time_range_minutes(time_str)
+            if interval is None: self.unparsed.add((room, day, time_str))
+            else: spans.setdefault((room, day), []).append(interval)
+        self.starts, self.ends = {}, {}
+        for key, intervals in spans.items(): self._merge(key, intervals)
+
+    def _merge(self, key, intervals):
+        starts, ends = [], []
+        for start, end in sorted(intervals):
+            if ends and start < ends[-1]: ends[-1] = max(ends[-1], end)
+            else: starts.append(start); ends.append(end)
+        self.starts[key], self.ends[key] = starts, ends
+
+    def book(self, room, day, time_str):
+        # Marks the room busy for time_str as well (an index of its own holds the rooms claimed while planning)
+        interval = _time_range_minutes(time_str)
+        if interval is None: self.unparsed.add((room, day, time_str)); return
+        key = (room, day)
+        self._merge(key, list(zip(self.starts.get(key, []), self.ends.get(key, []))) + [interval])
+
+    def overlay(self, rebooked):
+        """
+        Copy-on-write view with the bookings of some (Room, Day) keys replaced: `rebooked` maps each of them to
+        its full new list of time strings. Every other key reads through to this index; nothing is copied.
+        """
+        view = RoomIntervalIndex()
+        view.starts, view.ends = ChainMap({}, self.starts), ChainMap({}, self.ends)
+        view.unparsed = {booking for booking in self.unparsed if booking[:2] not in rebooked}
+        for (room, day), times in rebooked.items():
+            intervals = []
+            for time_str in times:
+                interval = _time_range_minutes(time_str)
+                if interval is None: view.unparsed.add((room, day, time_str))
+                else: intervals.append(interval)
+            view._merge((room, day), intervals)
+        return view
+
+    def is_free(self, room, day, time_str):
+        interval = _time_range_minutes(time_str)
+        if interval is None: return (room, day, time_str) not in self.unparsed
+        starts = self.starts.get((room, day))
+        if not starts: return True
+        start, end = interval
+        i = bisect.bisect_right(starts, start) - 1 # the last busy interval starting at or before `start`
+        if i >= 0 and self.ends[(room, day)][i] > start: return False
+        return i + 1 == len(starts) or starts[i + 1] >= end
+
+    def free_rooms(self, rooms, day, time_str):
+        return [room for room in rooms if self.is_free(room, day, time_str)]
+
+class ReadWriteLock:
+    """
+    Requests hold it for reading while they use the loaded data; a reload holds it for writing only
+    for the moment it swaps the new data in. Readers are never held up by a reload that is still building.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers, self.writing = 0, False
+
+    def acquire_read(self):
+        with self.cond:
+            while self.writing: self.cond.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.cond:
+            self.readers -= 1
+            if not self.readers: self.cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.cond:
+            while self.writing or self.readers: self.cond.wait()
+            self.writing = True
+        try: yield
+        finally:
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+data_lock = ReadWriteLock()
+reload_lock = threading.Lock() # one reload at a time
+data_watcher_pid = None
+data_state = None # the state dict _install_state swapped in last; a background job checks it has not changed
+os.makedirs(STATE_DIR, mode=0o700, exist_ok=True)
+result_cache = ResultCache(RESULT_CACHE_BACKEND, RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS)
+result_handles = ResultHandleStore(RESULT_HANDLE_DB_PATH, MAX_RESULT_HANDLES, RESULT_HANDLE_TTL_SECONDS)
+search_pool = None # ProcessPoolExecutor, see _start_search_pool
+search_pool_pid = None # the process search_pool belongs to
+search_pool_lock = threading.Lock()
+bulk_executor = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix='bulk')
+metrics = Metrics(METRICS_BUCKETS)
+job_store = JobStore(JOB_DB_PATH, JOB_TTL_SECONDS)
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='jobs')
+running_jobs = {} # job id -> {'deadline', 'trace', 'progress'}, for the jobs this process runs
+cancelled_deadlines = set() # deadlines of cancelled jobs: every search running under one stops as if it had passed
+job_watcher_pid = None
+job_watcher_lock = threading.Lock()
+
+class RequestTrace:
+    """
+    What one request (or background job) has done so far: its timed phases, and the live
+    [evaluated, feasible, pruned] counters of every search walk it started (see _run_partitioned).
+    """
+    def __init__(self):
+        self.phases, self.searches = [], [] # [(phase, seconds)], [[evaluated, feasible, pruned]]
+
+    def combinations(self): return sum(stats[0] for stats in self.searches)
+
+request_trace = contextvars.ContextVar('request_trace', default=None) # RequestTrace of the current request
+
+def _record_phase(phase, seconds):
+    metrics.observe('freestudents_phase_seconds', seconds, phase=phase)
+    trace = request_trace.get()
+    if trace is not None: trace.phases.append((phase, seconds))
+
+@contextmanager
+def _span(phase):
+    # Times one phase (availability, search, materialize, serialize, export) for /metrics and the
+    # request's Server-Timing header. Also works as a decorator.
+    started = time.perf_counter()
+    try: yield
+    finally: _record_phase(phase, time.perf_counter() - started)
+
+def _with_request_trace(fn):
+    # For executor threads, which have no request context: what they do still counts towards the request
+    trace = request_trace.get()
+    def run(*args):
+        token = request_trace.set(trace)
+        try: return fn(*args)
+        finally: request_trace.reset(token)
+    return run
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    # jsonify goes through dumps, so serializing a response is a phase of its own
+    def dumps(self, obj, **kwargs):
+        with _span('serialize'): return super().dumps(obj, **kwargs)
+
+app.json = _TimedJSONProvider(app)
+
 # ## --- NEW LISTS TO EXCLUDE SATURDAY BY DEFAULT --- ##
 all_possible_slots_NO_SATURDAY = []
 ALL_DAYS_OPTIONS_NO_SATURDAY = []
@@ -38,98 +583,335 @@ def to_float_time(time_str):
         return hour + (minute / 60.0)
     except Exception: return 0
 
-def load_and_prepare_data():
+def _data_file_paths():
+    # The rooms CSV is optional, so it only counts (for the data version and the watcher) when it exists
+    return (STUDENTS_CSV_PATH, TIMETABLE_CSV_PATH) + ((ROOMS_CSV_PATH,) if os.path.exists(ROOMS_CSV_PATH) else ())
+
+def _data_files_hash():
+    digest = hashlib.sha256()
+    for path in _data_file_paths():
+        with open(path, 'rb') as f: digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+def _time_range_minutes(time_str):
+    # '01:30-02:30' -> (810, 870), with to_float_time's rule that hours before 8 are in the afternoon
+    try:
+        minutes = []
+        for part in time_str.split('-'):
+            hour, minute = (int(value) for value in part.strip().split(':'))
+            minutes.append((hour + 12 if hour < 8 else hour) * 60 + minute)
+        start, end = minutes
+    except (AttributeError, ValueError): return None
+    return (start, end) if start < end else None
+
+def _slots_overlap(slot_a, slot_b):
+    if slot_a[0] != slot_b[0]: return False
+    range_a, range_b = _time_range_minutes(slot_a[1]), _time_range_minutes(slot_b[1])
+    if range_a is None or range_b is None: return slot_a[1] == slot_b[1]
+    return range_a[0] < range_b[1] and range_b[0] < range_a[1]
+
+def _intern(values, table=None):
+    # String column -> int32 ids into `table` (-1 for missing); without a table the ids follow first appearance
+    if table is None:
+        codes, uniques = pd.factorize(values)
+        return codes.astype(np.int32), uniques.tolist()
+    return pd.Index(table).get_indexer(values).astype(np.int32)
+
+def _read_data_files():
     """
-    Loads all data, performs cleaning, and pre-computes schedules for maximum speed.
+    Reads and cleans the CSVs (steps 1-2 of the load). The bytes are read once, so the returned data
+    version is the hash of exactly what was parsed. Returns (students_df, timetable_df, rooms_df, data_version);
+    rooms_df is None when there is no rooms CSV.
+    """
+    raw = {}
+    for path in _data_file_paths():
+        with open(path, 'rb') as f: raw[path] = f.read()
+    students_df = pd.read_csv(io.BytesIO(raw[STUDENTS_CSV_PATH]), encoding='latin1', dtype={'MIS': str})
+    timetable_df = pd.read_csv(io.BytesIO(raw[TIMETABLE_CSV_PATH]), encoding='latin1')
+    rooms_df = pd.read_csv(io.BytesIO(raw[ROOMS_CSV_PATH]), encoding='latin1') if ROOMS_CSV_PATH in raw else None
+    data_version = hashlib.sha256(b''.join(raw.values())).hexdigest()[:16]
+
+    # 1. Aggressive Cleaning
+    for df in [students_df, timetable_df] + ([rooms_df] if rooms_df is not None else []):
+        for col in df.select_dtypes(include=['object']).columns:
+            df[col] = df[col].str.replace(r'\s+', ' ', regex=True).str.strip()
+
+    # 2. Create 'Name' Column
+    name_cols = ['FirstName', 'MiddleName', 'LastName']
+    for col in name_cols: students_df[col] = students_df[col].fillna('')
+    students_df['Name'] = (students_df['FirstName'] + ' ' + students_df['MiddleName'] + ' ' + students_df['LastName']).str.strip()
+    students_df.drop(columns=name_cols, inplace=True)
+
+    # 2.B Rooms: one row per room, Capacity as a number (blank = unknown size)
+    if rooms_df is not None:
+        rooms_df = rooms_df.dropna(subset=['Room']).drop_duplicates(subset=['Room']).reset_index(drop=True)[['Room', 'Capacity']]
+        rooms_df['Capacity'] = pd.to_numeric(rooms_df['Capacity'], errors='coerce')
+    return students_df, timetable_df, rooms_df, data_version
+
+def build_data_snapshot(path=DATA_SNAPSHOT_DIR):
+    """
+    Compiles both CSVs into a snapshot directory: one code array per cleaned column (.npy, so it can be
+    memory-mapped; in the integer width pandas gives categorical codes over that many values) plus meta.json with the string tables, the rooms list and the CSV content hash. It is written
+    next to `path` and renamed into place, so a booting worker never sees half a snapshot.
+    """
+    students_df, timetable_df, rooms_df, data_version = _read_data_files()
+    path = os.path.abspath(path)
+    staging = tempfile.mkdtemp(prefix='.snapshot-', dir=os.path.dirname(path))
+    meta = {'format': SNAPSHOT_FORMAT, 'data_version': data_version, 'frames': {}}
+    for name, df in (('students', students_df), ('timetable', timetable_df)):
+        tables = {}
+        for i, column in enumerate(df.columns):
+            codes, tables[column] = _intern(df[column])
+            np.save(os.path.join(staging, f'{name}.{i}.npy'), pd.Categorical.from_codes(codes, tables[column]).codes)
+        meta['frames'][name] = {'columns': list(df.columns), 'rows': len(df), 'tables': tables}
+    meta['rooms'] = None if rooms_df is None else rooms_df.to_dict('list') # a few rows, kept as they are
+    with open(os.path.join(staging, 'meta.json'), 'w') as f: json.dump(meta, f)
+    if os.path.isdir(path):
+        retired = tempfile.mkdtemp(prefix='.snapshot-old-', dir=os.path.dirname(path))
+        os.replace(path, os.path.join(retired, 'snapshot'))
+        os.replace(staging, path)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, path)
+    return {'path': path, 'data_version': data_version, 'students': len(students_df), 'timetable': len(timetable_df)}
+
+def _read_data_snapshot(path=DATA_SNAPSHOT_DIR):
+    """
+    The frames _read_data_files would return, with every column a categorical whose codes are the snapshot's
+    memory-mapped array itself (no per-row strings are built). Returns (result or None, why not): no snapshot, another format, or stale (the CSVs changed since).
     """
-    global students_df_global, timetable_clash_global, room_occupancy, all_possible_slots, all_possible_slots_NO_SATURDAY, SUBJECT_OPTIONS, DIVISION_OPTIONS, DAYS_OPTIONS, ALL_DAYS_OPTIONS_NO_SATURDAY, TIMES_OPTIONS_FORMATTED, TIMES_OPTIONS_FORMATTED_END, TIMES_OPTIONS_FULL, ALL_DAYS_OPTIONS, student_schedule_map, subject_division_map
+    if not path: return None, 'disabled'
     try:
-        students_df = pd.read_csv(STUDENTS_CSV_PATH, encoding='latin1', dtype={'MIS': str})
-        timetable_df = pd.read_csv(TIMETABLE_CSV_PATH, encoding='latin1')
-
-        # 1. Aggressive Cleaning
-        for df in [students_df, timetable_df]:
-            for col in df.select_dtypes(include=['object']).columns:
-                df[col] = df[col].str.replace(r'\s+', ' ', regex=True).str.strip()
-
-        # 2. Create 'Name' Column
-        name_cols = ['FirstName', 'MiddleName', 'LastName']
-        for col in name_cols: students_df[col] = students_df[col].fillna('')
-        students_df['Name'] = students_df[name_cols].apply(lambda x: ' '.join(x), axis=1).str.strip()
-        students_df.drop(columns=name_cols, inplace=True)
-        
-        # 3. Store Unfiltered Student Data
-        students_df_global = students_df.copy()
-        
-        # 4. Create Filtered Dropdown Lists
-        unwanted_subjects_for_dropdown = ["LAB", "-CS- Communication Skills"]
-        filtered_student_df = students_df_global[~students_df_global['Subject'].str.contains('|'.join(unwanted_subjects_for_dropdown), case=False, na=False)]
-        SUBJECT_OPTIONS = sorted(filtered_student_df['Subject'].unique().tolist())
-        DIVISION_OPTIONS = sorted(students_df_global['Division'].unique().tolist())
-        
-        # 5. Create the Subject-Division Map
-        for subject in SUBJECT_OPTIONS:
-            subject_divisions = students_df_global[students_df_global['Subject'] == subject]['Division'].unique()
-            subject_division_map[subject] = sorted(list(subject_divisions))
-        
-        # 6. Create Full Timetable (for Mode 1 and Busy Map)
-        timetable_clash_global = timetable_df.copy() # Includes Saturday
-        ALL_DAYS_OPTIONS = sorted(timetable_clash_global['Day'].unique().tolist())
-        DAYS_OPTIONS = sorted(timetable_clash_global['Day'].unique().tolist())
-        
-        # ## --- NEW "NO SATURDAY" LIST --- ##
-        ALL_DAYS_OPTIONS_NO_SATURDAY = [day for day in ALL_DAYS_OPTIONS if day.lower() != 'saturday']
+        with open(os.path.join(path, 'meta.json')) as f: meta = json.load(f)
+    except (OSError, ValueError): return None, 'missing'
+    if meta.get('format') != SNAPSHOT_FORMAT: return None, 'built by another version'
+    if meta.get('data_version') != _data_files_hash(): return None, 'stale'
+    frames = []
+    for name in ('students', 'timetable'):
+        spec = meta['frames'][name]
+        columns = {}
+        for i, column in enumerate(spec['columns']):
+            codes = np.load(os.path.join(path, f'{name}.{i}.npy'), mmap_mode='r')
+            columns[column] = pd.Categorical.from_codes(codes, spec['tables'][column]) # code -1 is a missing value
+        frames.append(pd.DataFrame(columns, copy=False))
+    rooms_df = None if meta['rooms'] is None else pd.DataFrame(meta['rooms'])
+    return (frames[0], frames[1], rooms_df, meta['data_version']), None
 
+def _room_capacities(rooms_df):
+    # Bookable room -> seats (None = unknown). Without a rooms CSV: AVAILABLE_ROOMS, size unknown
+    if rooms_df is None: return {room: None for room in AVAILABLE_ROOMS}
+    return {room: None if pd.isna(capacity) else int(capacity) for room, capacity in zip(rooms_df['Room'], rooms_df['Capacity'])}
 
-        # 7. Build Global Lookups
-        # List 2: For Modes 1, 2 (Display & Value: "08:30 - 09:30")
-        unique_times_full = timetable_clash_global['Time'].unique().tolist()
-        TIMES_OPTIONS_FULL = sorted(unique_times_full, key=to_float_time)
-        
-        # 8. Build Performance Map (uses full timetable to know all busy slots)
-        all_students_mis = students_df_global['MIS'].unique()
-        for mis in all_students_mis: student_schedule_map[mis] = set()
-        enrollments = pd.merge(students_df_global, timetable_clash_global, on=['Subject', 'Division'], how='inner')
-        for _, row in enrollments.iterrows():
-            student_schedule_map[row['MIS']].add((row['Day'], row['Time']))
-
-        # 9. Create "Schedulable" data (FOR MODES 2-5) by removing lunch
-        timetable_schedulable = timetable_clash_global[timetable_clash_global['Time'] != LUNCH_SLOT].copy()
-        
-        # 10. Build Schedulable-Only Lists (for Modes 2-5)
-        # List 1: For "FROM" dropdowns (Modes 3, 4, 5) - NO LUNCH
-        unique_times_schedulable = timetable_schedulable['Time'].unique().tolist()
-        sorted_times_schedulable = sorted(unique_times_schedulable, key=to_float_time)
-        TIMES_OPTIONS_FORMATTED = [(t.split('-')[0].strip(), t) for t in sorted_times_schedulable]
-        
-        # List 1.B: For "TO" dropdowns (Modes 3, 4, 5) - NO LUNCH
-        TIMES_OPTIONS_FORMATTED_END = [(t.split('-')[1].strip(), t) for t in sorted_times_schedulable]
-        
-        # 11. Build Schedulable Slots Pool (FOR MODES 2-5)
-        records_list = timetable_schedulable[['Day', 'Time']].drop_duplicates().to_records(index=False).tolist()
-        # This is the MASTER list that INCLUDES Saturday for "opt-in"
-        all_possible_slots = sorted(list(set(records_list)), key=lambda x: (ALL_DAYS_OPTIONS.index(x[0]), to_float_time(x[1])))
-
-        # ## --- NEW "NO SATURDAY" LIST --- ##
-        # This is the DEFAULT list for suggestions and Mode 2
-        all_possible_slots_NO_SATURDAY = [slot for slot in all_possible_slots if slot[0].lower() != 'saturday']
-
-        # Build room occupancy based on SCHEDULABLE slots only
-        for slot in all_possible_slots:
-            busy_rooms = set(timetable_schedulable[(timetable_schedulable['Day'] == slot[0]) & (timetable_schedulable['Time'] == slot[1])]['Room'])
-            room_occupancy[slot] = [room for room in AVAILABLE_ROOMS if room not in busy_rooms]
-        
+def _build_state(students_df, timetable_df, rooms_df, data_version):
+    """
+    Steps 3-11 of the load: everything the routes read, as {global name: new value}. Never touches the
+    live globals, so it runs while requests are still served from the old data.
+    """
+    # 3. Store Unfiltered Student Data
+    students_df_global = students_df.copy(deep=False) # nothing changes it in place; a deep copy would also copy a snapshot's mapped columns
+    
+    # 4. Create Filtered Dropdown Lists
+    unwanted_subjects_for_dropdown = ["LAB", "-CS- Communication Skills"]
+    filtered_student_df = students_df_global[~students_df_global['Subject'].str.contains('|'.join(unwanted_subjects_for_dropdown), case=False, na=False)]
+    SUBJECT_OPTIONS = sorted(filtered_student_df['Subject'].unique().tolist())
+    DIVISION_OPTIONS = sorted(students_df_global['Division'].unique().tolist())
+    
+    # 5. Create the Subject-Division Map
+    subject_division_map = {}
+    divisions_by_subject = {}
+    for subject, division in zip(students_df_global['Subject'], students_df_global['Division']):
+        divisions_by_subject.setdefault(subject, {})[division] = None
+    for subject in SUBJECT_OPTIONS:
+        subject_division_map[subject] = sorted(divisions_by_subject.get(subject, {}))
+    
+    # 6. Create Full Timetable (for Mode 1 and Busy Map)
+    timetable_clash_global = timetable_df.copy(deep=False) # Includes Saturday
+    ALL_DAYS_OPTIONS = sorted(timetable_clash_global['Day'].unique().tolist())
+    DAYS_OPTIONS = sorted(timetable_clash_global['Day'].unique().tolist())
+    
+    # ## --- NEW "NO SATURDAY" LIST --- ##
+    ALL_DAYS_OPTIONS_NO_SATURDAY = [day for day in ALL_DAYS_OPTIONS if day.lower() != 'saturday']
+
+    # 7. Build Global Lookups
+    # List 2: For Modes 1, 2 (Display & Value: "08:30 - 09:30")
+    unique_times_full = timetable_clash_global['Time'].unique().tolist()
+    TIMES_OPTIONS_FULL = sorted(unique_times_full, key=to_float_time)
+    
+    # 8.B Build the Columnar Data Layer (every request resolves through this, not through pandas)
+    student_codes, STUDENT_MIS_LIST = _intern(students_df_global['MIS'])
+    student_index_map = {mis: i for i, mis in enumerate(STUDENT_MIS_LIST)}
+    SUBJECT_TABLE = sorted(set(students_df_global['Subject'].dropna()) | set(timetable_clash_global['Subject'].dropna()))
+    DIVISION_TABLE = sorted(set(students_df_global['Division'].dropna()) | set(timetable_clash_global['Division'].dropna()))
+    DAY_TABLE = list(ALL_DAYS_OPTIONS)
+    TIME_TABLE = list(TIMES_OPTIONS_FULL)
+    enrollment_columns = {
+        'student': student_codes,
+        'subject': _intern(students_df_global['Subject'], SUBJECT_TABLE),
+        'division': _intern(students_df_global['Division'], DIVISION_TABLE)
+    }
+    timetable_columns = {
+        'subject': _intern(timetable_clash_global['Subject'], SUBJECT_TABLE),
+        'division': _intern(timetable_clash_global['Division'], DIVISION_TABLE),
+        'day': _intern(timetable_clash_global['Day'], DAY_TABLE),
+        'time': _intern(timetable_clash_global['Time'], TIME_TABLE),
+        'room': timetable_clash_global['Room'].tolist()
+    }
+    student_records = {record['MIS']: record for record in students_df_global.drop_duplicates(subset=['MIS']).to_dict('records')}
+    group_members_map = {}
+    group_keys = enrollment_columns['subject'].astype(np.int64) * len(DIVISION_TABLE) + enrollment_columns['division']
+    for key in np.unique(group_keys[(enrollment_columns['subject'] >= 0) & (enrollment_columns['division'] >= 0)]):
+        subject_id, division_id = divmod(int(key), len(DIVISION_TABLE))
+        group_members_map[(SUBJECT_TABLE[subject_id], DIVISION_TABLE[division_id])] = np.unique(student_codes[group_keys == key])
+    slot_classes_map = {}
+    for subject_id, division_id, day_id, time_id, room in zip(*(timetable_columns[c] for c in ('subject', 'division', 'day', 'time', 'room'))):
+        slot_classes_map.setdefault((DAY_TABLE[day_id], TIME_TABLE[time_id]), []).append((SUBJECT_TABLE[subject_id], DIVISION_TABLE[division_id], room))
+
+    # 8.C Build the Bitset Availability Index (uses full timetable to know all busy slots)
+    INDEX_SLOTS = sorted(slot_classes_map, key=lambda x: (ALL_DAYS_OPTIONS.index(x[0]), to_float_time(x[1])))
+    slot_index_map = {slot: i for i, slot in enumerate(INDEX_SLOTS)}
+    slot_class_matrix = np.full((len(INDEX_SLOTS), len(STUDENT_MIS_LIST)), -1, dtype=np.int16)
+    extra_clashes = {}
+    for slot, classes in slot_classes_map.items():
+        row = slot_index_map[slot]
+        for k, (subject, division, _) in enumerate(classes):
+            members = group_members_map.get((subject, division))
+            if members is None: continue
+            first = slot_class_matrix[row, members] < 0
+            for student in members[~first]: extra_clashes.setdefault(row, {}).setdefault(int(student), []).append(k)
+            slot_class_matrix[row, members[first]] = k
+    slot_free_matrix = slot_class_matrix < 0
+    group_mask_map = {}
+    for group, members in group_members_map.items():
+        mask = np.zeros(len(STUDENT_MIS_LIST), dtype=bool)
+        mask[members] = True
+        group_mask_map[group] = mask
+    GROUP_KEYS = list(group_members_map)
+    group_row_map = {group: i for i, group in enumerate(GROUP_KEYS)}
+    group_signature_map = {}
+    for group, members in group_members_map.items():
+        group_signature_map.setdefault((int(members[0]), len(members)), []).append(group)
+    # Membership [group, student] @ free [student, slot], a block of groups at a time so the float copy stays small
+    group_slot_free_counts = np.zeros((len(GROUP_KEYS), len(INDEX_SLOTS)), dtype=np.int32)
+    free_columns = slot_free_matrix.T.astype(np.float32)
+    for start in range(0, len(GROUP_KEYS), GROUP_MATRIX_BLOCK):
+        membership = np.array([group_mask_map[group] for group in GROUP_KEYS[start:start + GROUP_MATRIX_BLOCK]], dtype=np.float32)
+        group_slot_free_counts[start:start + len(membership)] = membership.reshape(-1, len(STUDENT_MIS_LIST)) @ free_columns
+
+    # 8. Build Performance Map (a view over the index above, see StudentScheduleView)
+    student_schedule_map = StudentScheduleView(slot_free_matrix, student_index_map, INDEX_SLOTS)
+
+    # 9. Create "Schedulable" data (FOR MODES 2-5) by removing lunch
+    timetable_schedulable = timetable_clash_global[timetable_clash_global['Time'] != LUNCH_SLOT].copy()
+    
+    # 10. Build Schedulable-Only Lists (for Modes 2-5)
+    # List 1: For "FROM" dropdowns (Modes 3, 4, 5) - NO LUNCH
+    unique_times_schedulable = timetable_schedulable['Time'].unique().tolist()
+    sorted_times_schedulable = sorted(unique_times_schedulable, key=to_float_time)
+    TIMES_OPTIONS_FORMATTED = [(t.split('-')[0].strip(), t) for t in sorted_times_schedulable]
+    
+    # List 1.B: For "TO" dropdowns (Modes 3, 4, 5) - NO LUNCH
+    TIMES_OPTIONS_FORMATTED_END = [(t.split('-')[1].strip(), t) for t in sorted_times_schedulable]
+    
+    # 11. Build Schedulable Slots Pool (FOR MODES 2-5)
+    records_list = timetable_schedulable[['Day', 'Time']].drop_duplicates().to_records(index=False).tolist()
+    # This is the MASTER list that INCLUDES Saturday for "opt-in"
+    all_possible_slots = sorted(list(set(records_list)), key=lambda x: (ALL_DAYS_OPTIONS.index(x[0]), to_float_time(x[1])))
+
+    # ## --- NEW "NO SATURDAY" LIST --- ##
+    # This is the DEFAULT list for suggestions and Mode 2
+    all_possible_slots_NO_SATURDAY = [slot for slot in all_possible_slots if slot[0].lower() != 'saturday']
+
+    # Build room occupancy: the bookable rooms no class (lunch included) uses at any point of the slot
+    room_capacity = _room_capacities(rooms_df)
+    room_index = RoomIntervalIndex(zip(timetable_clash_global['Room'], timetable_clash_global['Day'], timetable_clash_global['Time']))
+    room_occupancy = {}
+    for slot in all_possible_slots:
+        room_occupancy[slot] = room_index.free_rooms(room_capacity, *slot)
+
+    return {
+        'DATA_VERSION': data_version, 'students_df_global': students_df_global, 'timetable_clash_global': timetable_clash_global,
+        'SUBJECT_OPTIONS': SUBJECT_OPTIONS, 'DIVISION_OPTIONS': DIVISION_OPTIONS, 'subject_division_map': subject_division_map,
+        'ALL_DAYS_OPTIONS': ALL_DAYS_OPTIONS, 'DAYS_OPTIONS': DAYS_OPTIONS, 'ALL_DAYS_OPTIONS_NO_SATURDAY': ALL_DAYS_OPTIONS_NO_SATURDAY,
+        'TIMES_OPTIONS_FULL': TIMES_OPTIONS_FULL, 'TIMES_OPTIONS_FORMATTED': TIMES_OPTIONS_FORMATTED, 'TIMES_OPTIONS_FORMATTED_END': TIMES_OPTIONS_FORMATTED_END,
+        'student_schedule_map': student_schedule_map, 'room_occupancy': room_occupancy, 'room_capacity': room_capacity, 'room_index': room_index,
+        'all_possible_slots': all_possible_slots, 'all_possible_slots_NO_SATURDAY': all_possible_slots_NO_SATURDAY,
+        'STUDENT_MIS_LIST': STUDENT_MIS_LIST, 'student_index_map': student_index_map,
+        'SUBJECT_TABLE': SUBJECT_TABLE, 'DIVISION_TABLE': DIVISION_TABLE, 'DAY_TABLE': DAY_TABLE, 'TIME_TABLE': TIME_TABLE,
+        'enrollment_columns': enrollment_columns, 'timetable_columns': timetable_columns, 'student_records': student_records,
+        'group_members_map': group_members_map, 'slot_classes_map': slot_classes_map,
+        'INDEX_SLOTS': INDEX_SLOTS, 'slot_index_map': slot_index_map, 'slot_free_matrix': slot_free_matrix, 'group_mask_map': group_mask_map,
+        'slot_class_matrix': slot_class_matrix, 'extra_clashes': extra_clashes, 'GROUP_KEYS': GROUP_KEYS, 'group_row_map': group_row_map,
+        'group_signature_map': group_signature_map, 'group_slot_free_counts': group_slot_free_counts
+    }
+
+def _install_state(state):
+    # Swaps every derived structure in at once; requests pin the data (data_lock) so none sees a mix
+    with data_lock.write(): globals().update(state, data_state=state)
+
+def load_and_prepare_data():
+    """
+    Loads all data, performs cleaning, and pre-computes schedules for maximum speed.
+    """
+    try:
+        snapshot, reason = _read_data_snapshot()
+        if snapshot: print(f"📦 Booting from the data snapshot in {DATA_SNAPSHOT_DIR}.")
+        elif reason == 'stale': print(f"Data snapshot in {DATA_SNAPSHOT_DIR} is stale, loading the CSVs instead.")
+        students_df, timetable_df, rooms_df, data_version = snapshot or _read_data_files()
+        _install_state(_build_state(students_df, timetable_df, rooms_df, data_version))
+        result_cache.invalidate(DATA_VERSION)
         print(f"✅ Final {len(list(app.url_map.iter_rules()))}-Mode build loaded (Balanced, Fast, v5.18_FINAL).")
 
     except Exception as e: print(f"FATAL ERROR: {e}")
 
+def reload_data_files(force=False):
+    """
+    Re-reads the CSVs, builds the new state beside the live one (see _build_state) and swaps it in.
+    Returns a summary of the reload. A CSV that fails to load raises, and the loaded data stays in place.
+    """
+    with reload_lock:
+        started = time.time()
+        if not force and _data_files_hash() == DATA_VERSION: return {'status': 'unchanged', 'data_version': DATA_VERSION}
+        students_df, timetable_df, rooms_df, data_version = _read_data_files()
+        _install_state(_build_state(students_df, timetable_df, rooms_df, data_version))
+        result_cache.invalidate(data_version)
+        return {'status': 'reloaded', 'data_version': data_version, 'seconds': round(time.time() - started, 3)}
+
+def _data_files_stamp():
+    return tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size) for path in _data_file_paths())
+
+def _watch_data_files():
+    # Reloads once the CSVs changed and then stayed put for a whole interval (so half-copied files are skipped)
+    loaded_stamp, seen_stamp = None, None
+    while True:
+        time.sleep(DATA_WATCH_INTERVAL_SECONDS)
+        try: stamp = _data_files_stamp()
+        except OSError: continue
+        if stamp != seen_stamp:
+            seen_stamp = stamp
+            continue
+        if stamp == loaded_stamp: continue
+        loaded_stamp = stamp
+        try:
+            summary = reload_data_files()
+            if summary['status'] != 'unchanged': print(f"🔄 Data reloaded: {summary}")
+        except Exception as e: print(f"Reload failed, keeping the loaded data: {e}")
+
+def _start_data_watcher():
+    # One watcher per process, started on its first request (so after gunicorn forks the workers)
+    global data_watcher_pid
+    if not DATA_WATCH_INTERVAL_SECONDS or data_watcher_pid == os.getpid(): return
+    with reload_lock:
+        if data_watcher_pid == os.getpid(): return
+        data_watcher_pid = os.getpid()
+        threading.Thread(target=_watch_data_files, name='data-watcher', daemon=True).start()
+
 load_and_prepare_data()
 
 # --- (All helper functions and all 5 Mode routes are 100% correct) ---
 def _get_target_students(form_data):
     if form_data.get('student_mode') == 'by_group':
         subject, division = form_data.get('subject'), form_data.get('division')
-        target_mis_set = set(students_df_global[(students_df_global['Subject'] == subject) & (students_df_global['Division'] == division)]['MIS'].unique())
+        target_mis_set = {STUDENT_MIS_LIST[i] for i in group_members_map.get((subject, division), [])}
     else: # by_mis
         target_mis_set = {mis for mis in re.split(r'[\s,]+', form_data.get('mis_numbers', '').strip()) if mis}
     return target_mis_set
@@ -145,54 +927,799 @@ def _get_student_availability_map(target_mis_set, slot_pool):
             availability_map[slot] = {'free_students': free_students_in_slot, 'available_rooms': free_rooms}
     return availability_map
 
-def _find_balanced_solutions(students_to_schedule, num_batches, availability_map):
+@_span('availability')
+def _get_student_availability_index(target_mis_set, slot_pool):
+    """
+    Bitset version of _get_student_availability_map (which stays as the reference).
+    Returns the same dict, plus 'free_mask' (int bitset over sorted(target_mis_set)) and 'free_count' per slot.
+    """
+    target_order = sorted(target_mis_set)
+    known_positions = [j for j, mis in enumerate(target_order) if mis in student_index_map]
+    known_columns = [student_index_map[target_order[j]] for j in known_positions]
+    
+    pool = [slot for slot in slot_pool if room_occupancy.get(slot)]
+    # Unknown MIS numbers (and slots with no classes at all) have nothing scheduled, so they stay free
+    free_local = np.ones((len(pool), len(target_order)), dtype=bool)
+    indexed = [(p, slot_index_map[slot]) for p, slot in enumerate(pool) if slot in slot_index_map]
+    if indexed and known_positions:
+        rows = [p for p, _ in indexed]
+        free_local[np.ix_(rows, known_positions)] = slot_free_matrix[np.ix_([r for _, r in indexed], known_columns)]
+    
+    free_counts = free_local.sum(axis=1)
+    packed_rows = np.packbits(free_local, axis=1, bitorder='little')
+    availability_map = {}
+    for p, slot in enumerate(pool):
+        if not free_counts[p]: continue
+        availability_map[slot] = {
+            'free_students': {target_order[j] for j in np.flatnonzero(free_local[p])},
+            'free_mask': int.from_bytes(packed_rows[p].tobytes(), 'little'),
+            'free_count': int(free_counts[p]),
+            'available_rooms': room_occupancy[slot]
+        }
+    return availability_map
+
+def _check_availability_index(target_mis_set, slot_pool):
+    # Cross-check of the bitset index against the reference set-based map
+    reference = _get_student_availability_map(target_mis_set, slot_pool)
+    indexed = _get_student_availability_index(target_mis_set, slot_pool)
+    if reference.keys() != indexed.keys(): return False
+    return all(reference[slot]['free_students'] == indexed[slot]['free_students'] for slot in reference)
+
+def _get_slot_masks(target_order, availability_map, slot_keys):
+    # Maps built by the reference helper carry no bitsets, so derive them from the sets
+    position = None
+    masks = []
+    for slot in slot_keys:
+        entry = availability_map[slot]
+        if 'free_mask' in entry:
+            masks.append(entry['free_mask'])
+            continue
+        if position is None: position = {mis: j for j, mis in enumerate(target_order)}
+        masks.append(sum(1 << position[mis] for mis in entry['free_students'] if mis in position))
+    return masks
+
+def _slot_free_count(availability_map, slot):
+    entry = availability_map[slot]
+    return entry['free_count'] if 'free_count' in entry else len(entry['free_students'])
+
+def _group_row(target_mis_set):
+    # Row of group_slot_free_counts when the students are exactly one (Subject, Division) group, else None
+    student_ids = {student_index_map.get(mis) for mis in target_mis_set}
+    if not student_ids or None in student_ids: return None
+    for group in group_signature_map.get((min(student_ids), len(student_ids)), []):
+        if student_ids.issuperset(group_members_map[group].tolist()): return group_row_map[group]
+    return None
+
+def _slot_free_counts(target_mis_set, slot_keys, availability_map):
+    # Free students per slot as an array: the precomputed row for a whole group, else the availability map's counts
+    row = _group_row(target_mis_set)
+    rows = [slot_index_map.get(slot) for slot in slot_keys]
+    if row is None or None in rows: return np.array([_slot_free_count(availability_map, slot) for slot in slot_keys], dtype=np.int64)
+    return group_slot_free_counts[row, rows].astype(np.int64)
+
+def _rank_slots(slot_keys, counts):
+    # Most free students first; stable, so ties keep their order (same as sorted(..., reverse=True))
+    order = np.argsort(-counts, kind='stable')
+    return [slot_keys[i] for i in order], counts[order]
+
+def _prune_slots(slot_keys, counts, num_students, num_batches):
+    """
+    Drops the slots no option can use. The k slots of an option must between them seat every student, so a
+    slot stays only if its free count plus the k-1 largest counts among the other slots reaches num_students.
+    Order is kept, so the search visits the survivors exactly as before and finds the same options.
+    """
+    if num_batches < 1 or len(slot_keys) < num_batches: return list(slot_keys)
+    top = np.sort(counts)[::-1][:num_batches]
+    if num_batches == 1: bound = counts
+    else: bound = np.where(counts >= top[num_batches - 2], top.sum(), counts + top[:num_batches - 1].sum())
+    return [slot for slot, keep in zip(slot_keys, bound >= num_students) if keep]
+
+def _prune_slot_pools(slot_pools, pool_counts, num_students):
+    # Same bound for one slot per pool: a slot stays if it plus the best slot of every other pool can seat everyone
+    best = [int(counts.max()) if len(counts) else 0 for counts in pool_counts]
+    return [[slot for slot, count in zip(pool, counts) if count + sum(best) - best[i] >= num_students]
+            for i, (pool, counts) in enumerate(zip(slot_pools, pool_counts))]
+
+def _greedy_assign(target_order, combo_masks):
+    # Students with the fewest options go first, each into the smallest batch it can attend
+    batches = [[] for _ in combo_masks]
+    student_options = []
+    for j, student in enumerate(target_order):
+        options = [i for i, mask in enumerate(combo_masks) if mask >> j & 1]
+        student_options.append((student, options))
+    for student, options in sorted(student_options, key=lambda item: len(item[1])):
+        smallest_batch_index = min(options, key=lambda i: len(batches[i]))
+        batches[smallest_batch_index].append(student)
+    return batches
+
+def _split_by_pattern(combo_masks, full_mask):
+    # Groups the students by which batches of the combination they could join:
+    # {pattern (bit i = batch i): student bitset}. Pattern 0 holds the students nobody can take.
+    groups = {0: full_mask}
+    for i, mask in enumerate(combo_masks):
+        next_groups = {}
+        for pattern, students in groups.items():
+            inside, outside = students & mask, students & ~mask
+            if inside: next_groups[pattern | (1 << i)] = inside
+            if outside: next_groups[pattern] = outside
+        groups = next_groups
+    return groups
+
+def _water_fill(sizes, options, count):
+    # Same result as adding `count` students one by one to the smallest option (lowest index on ties)
+    added = [0] * len(sizes)
+    group = sorted(options, key=lambda i: (sizes[i], i))
+    level, filled = sizes[group[0]], 0
+    while count:
+        while filled < len(group) and sizes[group[filled]] == level: filled += 1
+        lowest = sorted(group[:filled])
+        next_level = sizes[group[filled]] if filled < len(group) else None
+        if next_level is not None and (next_level - level) * filled <= count:
+            for i in lowest: added[i] += next_level - level; sizes[i] = next_level
+            count -= (next_level - level) * filled
+            level = next_level
+        else:
+            rounds, extra = divmod(count, filled)
+            for n, i in enumerate(lowest):
+                step = rounds + (1 if n < extra else 0)
+                added[i] += step; sizes[i] += step
+            count = 0
+    return added
+
+def _balanced_flow_split(pattern_groups, num_batches, capacities=None):
+    """
+    Exact minimum std-dev split for one slot combination.
+    Students only differ by their pattern, so this is a flow on the small pattern -> batch network
+    with an x^2 cost on every batch. capacities (seats per batch, None = any size) bound the batch -> sink
+    arcs. An even fill gives a flow; each batch over its capacity then sends students along residual paths to
+    batches with seats left, and if one cannot, no split fits. After that one student keeps being pushed
+    along a residual path from a batch to one at least two smaller with a seat left. Once no such path exists
+    there is no negative cycle left, so the sum of squares (and the std-dev) is minimal.
+    Returns ({pattern: [students per batch]}, batch sizes), or None when the students fit no split.
+    """
+    sizes = [0] * num_batches
+    limits = [math.inf if capacity is None else capacity for capacity in capacities] if capacities else [math.inf] * num_batches
+    alloc = {}
+    for pattern in sorted(pattern_groups, key=lambda p: (p.bit_count(), p)):
+        options = [i for i in range(num_batches) if pattern >> i & 1]
+        alloc[pattern] = _water_fill(sizes, options, pattern_groups[pattern].bit_count())
+    
+    def push(source, accepts):
+        # Moves one student along the first residual path found from batch `source` to a batch that accepts() it
+        parent, queue, sink = {source: None}, [source], None
+        for a in queue:
+            for pattern, counts in alloc.items():
+                if not counts[a]: continue
+                for b in range(num_batches):
+                    if b in parent or not pattern >> b & 1: continue
+                    parent[b] = (a, pattern)
+                    if accepts(b): sink = b; break
+                    queue.append(b)
+                if sink is not None: break
+            if sink is not None: break
+        if sink is None: return False
+        node = sink
+        while parent[node]:
+            a, pattern = parent[node]
+            alloc[pattern][a] -= 1
+            alloc[pattern][node] += 1
+            node = a
+        sizes[source] -= 1
+        sizes[sink] += 1
+        return True
+    
+    for batch in range(num_batches):
+        while sizes[batch] > limits[batch]:
+            if not push(batch, lambda b: sizes[b] < limits[b]): return None
+    
+    improved = True
+    while improved:
+        improved = False
+        for source in sorted(range(num_batches), key=lambda i: -sizes[i]):
+            if push(source, lambda b: sizes[b] <= sizes[source] - 2 and sizes[b] < limits[b]):
+                improved = True
+                break
+    return alloc, sizes
+
+def _flow_assign(target_order, combo_masks, capacities=None):
+    pattern_groups = _split_by_pattern(combo_masks, (1 << len(target_order)) - 1)
+    split = _balanced_flow_split(pattern_groups, len(combo_masks), capacities)
+    if split is None: return None
+    batches = [[] for _ in combo_masks]
+    for pattern, counts in split[0].items():
+        members = [target_order[j] for j in range(len(target_order)) if pattern_groups[pattern] >> j & 1]
+        start = 0
+        for i, count in enumerate(counts):
+            batches[i].extend(members[start:start + count])
+            start += count
+    return batches
+
+def _fits(sizes, capacities):
+    return not capacities or all(capacity is None or size <= capacity for size, capacity in zip(sizes, capacities))
+
+def _assign_combination(target_order, combo_masks, solver, capacities=None):
+    # Batches (lists of MIS) for a combination that is already known to cover every student, or None when no split
+    # fits the capacities (seats per batch, None = any size). A greedy split too big for its rooms gives way to the flow one.
+    if solver == 'greedy':
+        batches = _greedy_assign(target_order, combo_masks)
+        if _fits([len(batch) for batch in batches], capacities): return batches
+    return _flow_assign(target_order, combo_masks, capacities)
+
+def _combination_sizes(num_students, combo_masks, solver, capacities=None):
+    # Batch sizes of the split _assign_combination would make, without building the member lists
+    if solver == 'greedy':
+        sizes = [len(b) for b in _greedy_assign(range(num_students), combo_masks)]
+        if _fits(sizes, capacities): return sizes
+    split = _balanced_flow_split(_split_by_pattern(combo_masks, (1 << num_students) - 1), len(combo_masks), capacities)
+    return split and split[1]
+
+def _score_combination(num_students, combo_masks, solver, capacities=None):
+    """
+    Sum of squared batch sizes (same ranking as the std-dev) of the best split whose batches fit the largest free
+    room of their slots (capacities: seats per batch, None = any size fits), or None when no split does.
+    """
+    sizes = _combination_sizes(num_students, combo_masks, solver, capacities)
+    return None if sizes is None else sum(size ** 2 for size in sizes)
+
+def _deadline_passed(deadline):
+    return deadline is not None and (time.time() > deadline or deadline in cancelled_deadlines)
+
+def _combinations_partition(num_students, slot_keys, masks, num_batches, solver, top_n, capacities, first_indices, deadline, on_improve=None, stats=None):
+    """
+    Depth-first walk over combinations(slot_keys, num_batches), in the same order, restricted to the
+    combinations whose first slot index is in first_indices. Skips whole subtrees which can no longer
+    cover every student:
+      - the remaining slots together still miss someone, or
+      - (set-cover bound) even the best remaining slot, picked every time, cannot cover what is left.
+    Keeps the top_n different-day and same-day combinations (ranked by score, then order) and stops
+    early once top_n different-day combinations have a perfectly even split, since nothing can beat them.
+    Batches are split to fit the largest free room of their slot (capacities, per slot); combinations no split fits are dropped.
+    on_improve(ranked) is called whenever the kept options change (in-process walks only).
+    Returns ({different days?: [(-sum_sq, -index_tuple)]}, timed_out, stats), stats being [evaluated, feasible, pruned]:
+    the combinations scored, the ones of those that fit their rooms, and the branches the bounds cut off.
+    Module level so the search pool can run it.
+    """
+    full_mask = (1 << num_students) - 1
+    num_slots = len(masks)
+    suffix_union = [0] * (num_slots + 1)
+    for i in range(num_slots - 1, -1, -1): suffix_union[i] = suffix_union[i + 1] | masks[i]
+    
+    even, extra = divmod(num_students, num_batches)
+    best_possible = extra * (even + 1) ** 2 + (num_batches - extra) * even ** 2 # sum of squares of an even split
+    ranked = {True: [], False: []} # different days? -> max-heap of (-sum_sq, -index_tuple)
+    timed_out = False
+    if stats is None: stats = [0, 0, 0] # evaluated, feasible, pruned (a list passed in is updated as the walk goes)
+    
+    def worst(heap): return -heap[0][0] if len(heap) >= top_n else None
+    
+    def visit(chosen, candidates, covered):
+        nonlocal timed_out
+        if _deadline_passed(deadline): timed_out = True
+        if timed_out: return
+        remaining = num_batches - len(chosen)
+        if remaining == 0:
+            diff_days = len({slot_keys[i][0] for i in chosen}) == num_batches
+            heap = ranked[diff_days]
+            if not diff_days and len(ranked[True]) >= top_n: return # same-day options would never be shown
+            if worst(heap) == best_possible: return
+            stats[0] += 1
+            sum_sq = _score_combination(num_students, [masks[i] for i in chosen], solver, capacities and [capacities[i] for i in chosen])
+            if sum_sq is None: return
+            stats[1] += 1
+            entry = (-sum_sq, tuple(-i for i in chosen))
+            if len(heap) < top_n: heapq.heappush(heap, entry)
+            elif sum_sq < worst(heap): heapq.heapreplace(heap, entry)
+            else: return
+            if on_improve: on_improve(ranked)
+            return
+        uncovered = full_mask & ~covered
+        start = candidates[0] if candidates else num_slots
+        if remaining >= 2 and uncovered:
+            best_gain = max((masks[i] & uncovered).bit_count() for i in range(start, num_slots))
+            if best_gain * remaining < uncovered.bit_count(): stats[2] += 1; return
+        for i in candidates:
+            if i > num_slots - remaining: break
+            if (covered | suffix_union[i]) != full_mask: stats[2] += 1; return
+            if remaining == 1 and (covered | masks[i]) != full_mask: stats[2] += 1; continue
+            chosen.append(i)
+            visit(chosen, range(i + 1, num_slots), covered | masks[i])
+            chosen.pop()
+            if timed_out or worst(ranked[True]) == best_possible: return
+    
+    if num_slots >= num_batches: visit([], sorted(first_indices), 0)
+    return ranked, timed_out, stats
+
+def _product_partition(num_students, batch_slot_pools, pool_masks, solver, top_n, pool_capacities, first_indices, deadline, on_improve=None, stats=None):
+    """
+    Branch-and-bound walk over product(*batch_slot_pools) in Mode 4, restricted to the combinations
+    whose first-batch slot index is in first_indices.
+    Batch slots are fixed one at a time (in product order, never reusing a slot); a branch is dropped
+    as soon as the slots picked so far plus everything the later pools could offer miss a student,
+    or the best slot of each later pool is still not enough to cover who is left.
+    Only a top_n heap is kept (ranked by score, then product order), and the walk stops once
+    it is full of perfectly even splits; on_improve(heap) is called whenever the heap changes.
+    As in _combinations_partition, batches are split to fit the largest free room of their slot (pool_capacities).
+    Returns ([(-sum_sq, -index_tuple)], timed_out, stats), stats as in _combinations_partition.
+    """
+    num_batches = len(batch_slot_pools)
+    full_mask = (1 << num_students) - 1
+    suffix_union = [0] * (num_batches + 1)
+    for depth in range(num_batches - 1, -1, -1):
+        suffix_union[depth] = suffix_union[depth + 1]
+        for mask in pool_masks[depth]: suffix_union[depth] |= mask
+    
+    even, extra = divmod(num_students, num_batches)
+    best_possible = extra * (even + 1) ** 2 + (num_batches - extra) * even ** 2
+    heap = [] # max-heap of (-sum_sq, -index_tuple)
+    timed_out = False
+    if stats is None: stats = [0, 0, 0] # evaluated, feasible, pruned (a list passed in is updated as the walk goes)
+    
+    def full_of_best(): return len(heap) >= top_n and -heap[0][0] == best_possible
+    
+    def visit(chosen, used, covered):
+        nonlocal timed_out
+        if _deadline_passed(deadline): timed_out = True
+        if timed_out: return
+        depth = len(chosen)
+        if depth == num_batches:
+            stats[0] += 1
+            sum_sq = _score_combination(num_students, [pool_masks[d][i] for d, i in enumerate(chosen)], solver, pool_capacities and [pool_capacities[d][i] for d, i in enumerate(chosen)])
+            if sum_sq is None: return
+            stats[1] += 1
+            entry = (-sum_sq, tuple(-i for i in chosen))
+            if len(heap) < top_n: heapq.heappush(heap, entry)
+            elif sum_sq < -heap[0][0]: heapq.heapreplace(heap, entry)
+            else: return
+            if on_improve: on_improve(heap)
+            return
+        if (covered | suffix_union[depth]) != full_mask: stats[2] += 1; return
+        uncovered = full_mask & ~covered
+        if depth <= num_batches - 2 and uncovered:
+            best_gains = sum(max((mask & uncovered).bit_count() for mask in pool_masks[d]) for d in range(depth, num_batches))
+            if best_gains < uncovered.bit_count(): stats[2] += 1; return
+        last = depth == num_batches - 1
+        for i in (sorted(first_indices) if depth == 0 else range(len(batch_slot_pools[depth]))):
+            slot = batch_slot_pools[depth][i]
+            if slot in used: continue
+            mask = pool_masks[depth][i]
+            if last and (covered | mask) != full_mask: stats[2] += 1; continue
+            if not last and (covered | mask | suffix_union[depth + 1]) != full_mask: stats[2] += 1; continue
+            chosen.append(i); used.add(slot)
+            visit(chosen, used, covered | mask)
+            chosen.pop(); used.discard(slot)
+            if timed_out or full_of_best(): return
+    
+    visit([], set(), 0)
+    return heap, timed_out, stats
+
+def _start_search_pool(start_method='fork'):
+    """
+    Starts this process's search pool. gunicorn.conf.py calls it from each worker's post_worker_init, while the worker
+    has no threads yet, so the search processes can be forked right away (no re-import, no CSV reload). Started
+    any later (no gunicorn, or after a broken pool), other threads are running, so it uses forkserver; the
+    walkers get everything they need as arguments, so nothing depends on memory inherited through fork.
+    The fork server imports this module (and loads the data) once, and every search process forks from it.
+    """
+    global search_pool, search_pool_pid
+    if SEARCH_WORKERS < 2: return None
+    with search_pool_lock:
+        if search_pool is None or search_pool_pid != os.getpid():
+            context = multiprocessing.get_context(start_method)
+            if start_method == 'forkserver': context.set_forkserver_preload([__name__])
+            search_pool = ProcessPoolExecutor(max_workers=SEARCH_WORKERS, mp_context=context)
+            search_pool_pid = os.getpid()
+            search_pool.submit(int).result() # the processes start on the first task: now, not from a request thread
+        return search_pool
+
+def _get_search_pool():
+    pool = search_pool
+    if pool is not None and search_pool_pid == os.getpid(): return pool
+    return _start_search_pool('forkserver')
+
+def _run_partitioned(partition_search, args, num_first, space_size, deadline, on_improve=None):
+    """
+    Runs partition_search(*args, first_indices, deadline) over every first slot index: in-process for
+    small spaces, otherwise split across the search pool (interleaved, since early first indices carry
+    the biggest subtrees), with each worker getting the compact per-request bitsets once.
+    Progress callbacks cannot cross processes, so a walk with on_improve always stays in-process.
+    Returns ([partition results], timed_out).
+    """
+    started, trace = time.perf_counter(), request_trace.get()
+    if SEARCH_WORKERS < 2 or num_first < 2 or space_size < PARALLEL_MIN_COMBINATIONS or on_improve:
+        stats = [0, 0, 0] # counted live, so a background job can report them while the walk runs
+        if trace is not None: trace.searches.append(stats)
+        results, pending = [partition_search(*args, range(num_first), deadline, on_improve, stats)], ()
+    else:
+        global search_pool
+        num_parts = min(SEARCH_WORKERS, num_first)
+        pool = None
+        try:
+            pool = _get_search_pool()
+            futures = [pool.submit(partition_search, *args, range(part, num_first, num_parts), deadline) for part in range(num_parts)]
+            done, pending = wait(futures, timeout=None if deadline is None else max(deadline - time.time(), 0) + 1)
+            for future in pending: future.cancel()
+            results = [future.result() for future in futures if future in done]
+        except BrokenProcessPool:
+            # A search process died (starting up or mid-walk): drop the pool, unless another thread already
+            # replaced it, and redo the walk in-process
+            with search_pool_lock:
+                if pool is None or search_pool is pool: search_pool = None
+            return _run_partitioned(partition_search, args, num_first, 0, deadline)
+        if trace is not None: trace.searches.append([sum(column) for column in zip(*(stats for _, _, stats in results))] or [0, 0, 0])
+    timed_out = bool(pending) or any(partition_timed_out for _, partition_timed_out, _ in results)
+    _record_search(partition_search, results, timed_out, time.perf_counter() - started)
+    return [found for found, _, _ in results], timed_out
+
+def _record_search(partition_search, results, timed_out, seconds):
+    # The walkers' counters (summed over the partitions) for /metrics, and the walk itself as the 'search' phase
+    search = 'product' if partition_search is _product_partition else 'combinations'
+    totals = [sum(column) for column in zip(*(stats for _, _, stats in results))] or [0, 0, 0]
+    for outcome, amount in zip(('evaluated', 'feasible', 'pruned'), totals):
+        metrics.count('freestudents_combinations_total', amount, search=search, outcome=outcome)
+    if timed_out: metrics.count('freestudents_search_timeouts_total', search=search)
+    _record_phase('search', seconds)
+
+def _throttled(on_progress, to_ranked):
+    # Walker callback -> on_progress(ranked slot combinations), at most every PROGRESS_INTERVAL_SECONDS
+    if on_progress is None: return None
+    last_report = 0.0
+    def on_improve(found):
+        nonlocal last_report
+        now = time.time()
+        if now - last_report < PROGRESS_INTERVAL_SECONDS: return
+        last_report = now
+        on_progress(to_ranked([found]))
+    return on_improve
+
+def _search_slot_combinations(target_order, slot_keys, slot_masks, num_batches, solver, top_n=TOP_N_SOLUTIONS_TO_SHOW, deadline=None, on_progress=None, slot_capacities=None):
+    """
+    Best top_n combinations(slot_keys, num_batches) (see _combinations_partition), different-day ones first.
+    Returns (ranked slot combinations, timed_out); on timeout they are the best found before the deadline.
+    on_progress(ranked so far) is called while the walk runs. Member lists are only built when a page is materialized.
+    slot_capacities (see _slot_capacities) keeps every batch within the largest free room of its slot.
+    """
+    def to_ranked(partitions):
+        results = []
+        for diff_days in (True, False):
+            entries = sorted((entry for ranked in partitions for entry in ranked[diff_days]), key=lambda e: (-e[0], [-i for i in e[1]]))
+            results.extend(entries[:top_n])
+        return [tuple(slot_keys[-i] for i in entry[1]) for entry in results[:top_n]]
+    
+    masks = [slot_masks[slot] for slot in slot_keys]
+    capacities = slot_capacities and [slot_capacities[slot] for slot in slot_keys]
+    args = (len(target_order), slot_keys, masks, num_batches, solver, top_n, capacities)
+    space_size = math.comb(len(slot_keys), num_batches) if num_batches >= 0 else 0
+    partitions, timed_out = _run_partitioned(_combinations_partition, args, len(slot_keys), space_size, deadline, _throttled(on_progress, to_ranked))
+    return to_ranked(partitions), timed_out
+
+def _search_slot_product(target_order, batch_slot_pools, slot_masks, solver, top_n=TOP_N_SOLUTIONS_TO_SHOW, deadline=None, on_progress=None, slot_capacities=None):
+    """
+    Best top_n of product(*batch_slot_pools) without slot reuse (see _product_partition), best first.
+    Returns (ranked slot combinations, timed_out); on_progress and slot_capacities as in _search_slot_combinations.
+    """
+    def to_ranked(partitions):
+        entries = sorted((entry for heap in partitions for entry in heap), key=lambda e: (-e[0], [-i for i in e[1]]))[:top_n]
+        return [tuple(batch_slot_pools[d][-i] for d, i in enumerate(entry[1])) for entry in entries]
+    
+    pool_masks = [[slot_masks[slot] for slot in pool] for pool in batch_slot_pools]
+    pool_capacities = slot_capacities and [[slot_capacities[slot] for slot in pool] for pool in batch_slot_pools]
+    args = (len(target_order), batch_slot_pools, pool_masks, solver, top_n, pool_capacities)
+    space_size = math.prod(len(pool) for pool in batch_slot_pools)
+    partitions, timed_out = _run_partitioned(_product_partition, args, len(batch_slot_pools[0]) if batch_slot_pools else 0, space_size, deadline, _throttled(on_progress, to_ranked))
+    return to_ranked(partitions), timed_out
+
+def _get_student_records(mis_numbers):
+    # Known students only, in students1.csv order (what the old isin + drop_duplicates returned)
+    student_ids = sorted(student_index_map[mis] for mis in set(mis_numbers) if mis in student_index_map)
+    return [student_records[STUDENT_MIS_LIST[i]] for i in student_ids]
+
+def _lean_result(target_order, ranked, slot_masks, availability_map, solver, partial=False):
+    # Everything needed to expand any ranked option later: ids and bitsets only, no student details.
+    # partial: the search hit the request deadline, so ranked is the best found so far.
+    used_slots = {slot for slot_combination in ranked for slot in slot_combination}
+    return {
+        'target_order': target_order, 'solver': solver, 'ranked': ranked, 'partial': partial,
+        'slot_masks': {slot: slot_masks[slot] for slot in used_slots},
+        'available_rooms': {slot: availability_map[slot]['available_rooms'] for slot in used_slots}
+    }
+
+def _lean_result_to_json(result):
+    # Slots are (Day, Time) tuples and key two of the dicts, so they are stored as [day, time] pairs
+    return json.dumps({
+        'target_order': result['target_order'], 'solver': result['solver'], 'partial': result['partial'],
+        'ranked': [[list(slot) for slot in slot_combination] for slot_combination in result['ranked']],
+        'slots': [[*slot, mask, result['available_rooms'][slot]] for slot, mask in result['slot_masks'].items()]
+    })
+
+def _lean_result_from_json(text):
+    data = json.loads(text)
+    return {
+        'target_order': data['target_order'], 'solver': data['solver'], 'partial': data['partial'],
+        'ranked': [tuple(tuple(slot) for slot in slot_combination) for slot_combination in data['ranked']],
+        'slot_masks': {(day, time_str): mask for day, time_str, mask, _ in data['slots']},
+        'available_rooms': {(day, time_str): rooms for day, time_str, _, rooms in data['slots']}
+    }
+
+def _largest_room(rooms):
+    # Seats in the largest of these rooms; None (any size fits) when there are none or one has no known size
+    sizes = [room_capacity.get(room) for room in rooms]
+    return None if not sizes or None in sizes else max(sizes)
+
+def _slot_capacities(availability_map, slots):
+    """
+    Seats in the largest free room of each slot, for the solvers to split the students so that every batch
+    fits a room (see _balanced_flow_split). Returns None when no room size is known at all.
+    """
+    capacities = {slot: _largest_room(availability_map[slot]['available_rooms']) for slot in slots}
+    return capacities if any(capacity is not None for capacity in capacities.values()) else None
+
+def _assign_rooms(slot_combination, batch_sizes, available_rooms, claimed=None):
+    """
+    A concrete room for every batch of one option. The biggest batch chooses first and takes the smallest
+    free room it fits in (rooms of unknown size come after the sized ones), never a room already given to
+    a batch that overlaps it in time, nor one `claimed` (a RoomIntervalIndex) holds for that time.
+    Returns [room or None (no free room is big enough)] per batch.
+    """
+    rooms = [None] * len(slot_combination)
+    for i in sorted(range(len(slot_combination)), key=lambda i: -batch_sizes[i]):
+        slot = slot_combination[i]
+        taken = {rooms[j] for j in range(len(slot_combination)) if rooms[j] and _slots_overlap(slot, slot_combination[j])}
+        fitting = [room for room in available_rooms[slot] if room not in taken and (room_capacity.get(room) is None or room_capacity[room] >= batch_sizes[i])]
+        if claimed is not None: fitting = [room for room in fitting if claimed.is_free(room, *slot)]
+        if fitting: rooms[i] = min(fitting, key=lambda room: (room_capacity.get(room) is None, room_capacity.get(room) or 0))
+    return rooms
+
+@_span('materialize')
+def _materialize_option(result, slot_combination, claimed=None):
+    # The batches of one ranked option, with their rooms (see _assign_rooms) and student details
+    capacities = [_largest_room(result['available_rooms'][slot]) for slot in slot_combination]
+    batches = _assign_combination(result['target_order'], [result['slot_masks'][slot] for slot in slot_combination], result['solver'], capacities)
+    rooms = _assign_rooms(slot_combination, [len(batch) for batch in batches], result['available_rooms'], claimed)
+    return [{
+        'day': slot[0], 'time': slot[1],
+        'students': _get_student_records(batch),
+        'room': room, 'room_capacity': room_capacity.get(room),
+        'available_rooms': result['available_rooms'][slot]
+    } for slot, batch, room in zip(slot_combination, batches, rooms)]
+
+def _materialize_results(result, start=0, stop=TOP_N_SOLUTIONS_TO_SHOW):
+    # Builds the options in ranked[start:stop] only
+    return [_materialize_option(result, slot_combination) for slot_combination in result['ranked'][start:stop]]
+
+def _solutions_payload(result):
+    # First page of options, plus a handle to fetch the rest with /solutions/<token>?page=N
+    payload = {'solutions': _materialize_results(result), 'total_solutions': len(result['ranked'])}
+    if len(result['ranked']) > TOP_N_SOLUTIONS_TO_SHOW: payload['result_token'] = result_handles.add(result)
+    if result.get('partial'): payload['partial'] = True
+    return payload
+
+def _get_solver(form_data):
+    solver = request.args.get('solver') or form_data.get('solver') or DEFAULT_SOLVER
+    return solver if solver in SOLVER_OPTIONS else DEFAULT_SOLVER
+
+def _get_num_batches(form_data):
+    # Raises ValueError unless 'num_batches' (default 1) is a whole number of at least 1
+    try: num_batches = int(form_data.get('num_batches', 1))
+    except (TypeError, ValueError): raise ValueError('num_batches must be a number.')
+    if num_batches < 1: raise ValueError('num_batches must be at least 1.')
+    return num_batches
+
+def _rank_balanced_combinations(students_to_schedule, num_batches, availability_map, solver=DEFAULT_SOLVER, top_n=MAX_RANKED_SOLUTIONS, deadline=None, on_progress=None):
     slot_keys = list(availability_map.keys())
+    counts = _slot_free_counts(students_to_schedule, slot_keys, availability_map)
     
-    # Apply heuristic if pool is too large
-    if len(slot_keys) > TOP_N_SLOTS_HEURISTIC and num_batches > 1:
-        top_slots = sorted(availability_map.keys(), key=lambda s: len(availability_map[s]['free_students']), reverse=True)
-        slot_keys = top_slots[:TOP_N_SLOTS_HEURISTIC]
+    if solver == 'greedy':
+        # Apply heuristic if pool is too large
+        if len(slot_keys) > TOP_N_SLOTS_HEURISTIC and num_batches > 1:
+            slot_keys, counts = _rank_slots(slot_keys, counts)
+            slot_keys, counts = slot_keys[:TOP_N_SLOTS_HEURISTIC], counts[:TOP_N_SLOTS_HEURISTIC]
+    else:
+        # The exact solver prunes instead of truncating; the busiest-free slots go first so good options come early
+        slot_keys, counts = _rank_slots(slot_keys, counts)
+    slot_keys = _prune_slots(slot_keys, counts, len(students_to_schedule), num_batches)
         
-    if len(slot_keys) < num_batches: return []
+    target_order = sorted(students_to_schedule)
+    if len(slot_keys) < num_batches: return _lean_result(target_order, [], {}, availability_map, solver)
 
-    solutions_diff_days = []
-    solutions_same_day = [] 
+    slot_masks = dict(zip(slot_keys, _get_slot_masks(target_order, availability_map, slot_keys)))
+    report = on_progress and (lambda ranked: on_progress(_lean_result(target_order, ranked, slot_masks, availability_map, solver, True)))
+    ranked, timed_out = _search_slot_combinations(target_order, slot_keys, slot_masks, num_batches, solver, top_n, deadline, report, _slot_capacities(availability_map, slot_keys))
+    return _lean_result(target_order, ranked, slot_masks, availability_map, solver, timed_out)
+
+def _find_balanced_solutions(students_to_schedule, num_batches, availability_map, solver=DEFAULT_SOLVER):
+    # Top options, fully materialized
+    return _materialize_results(_rank_balanced_combinations(students_to_schedule, num_batches, availability_map, solver, TOP_N_SOLUTIONS_TO_SHOW))
+
+def _cache_key(kind, target_mis_set, slot_pools, num_batches, solver, top_n):
+    payload = json.dumps([DATA_VERSION, kind, solver, num_batches, top_n, sorted(target_mis_set), slot_pools], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _request_deadline():
+    # One search budget per request, shared by the main search and all of its suggestions.
+    # Callers can ask for a shorter one with time_budget_ms (anytime mode: best options found in that time).
+    if not has_request_context(): return None
+    if 'search_deadline' not in g:
+        budget = g.get('search_budget', SEARCH_DEADLINE_SECONDS) # background jobs get JOB_DEADLINE_SECONDS
+        budgets = [budget] if budget else []
+        try: budgets.append(max(int(request.values.get('time_budget_ms')), 0) / 1000)
+        except (TypeError, ValueError): pass
+        g.search_deadline = time.time() + min(budgets) if budgets else None
+    return g.search_deadline
+
+def _progress_reporter():
+    # For a streamed request (see streamable), the first search it runs reports the options it has so far
+    events = g.pop('progress_events', None) if has_request_context() else None
+    if events is None: return None
+    started = g.get('request_started', time.time())
+    def report(result):
+        events.put({
+            'event': 'progress', 'solutions': _materialize_results(result), 'total_solutions': len(result['ranked']),
+            'elapsed_ms': int((time.time() - started) * 1000)
+        })
+    return report
+
+def _get_request_availability(target_mis_set, slot_pool):
+    # Availability is built at most once per (students, pool) within a request
+    memo = g.setdefault('availability_maps', {})
+    key = (id(target_mis_set), tuple(slot_pool))
+    if key not in memo: memo[key] = _get_student_availability_index(target_mis_set, slot_pool)
+    return memo[key]
+
+def _rank_for_pool(target_mis_set, slot_pool, num_batches, solver=DEFAULT_SOLVER, top_n=MAX_RANKED_SOLUTIONS, availability_map=None, deadline=None):
+    # Cached front door for the Mode 2/3/5 searches: (students, slot pool, batches) -> ranked result
+    key = _cache_key('combinations', target_mis_set, list(slot_pool), num_batches, solver, top_n)
+    on_progress = _progress_reporter() # claimed even on a cache hit, so later fallback searches never stream
+    result = result_cache.get(key)
+    if result is None:
+        if availability_map is None: availability_map = _get_request_availability(target_mis_set, slot_pool)
+        result = _rank_balanced_combinations(target_mis_set, num_batches, availability_map, solver, top_n, deadline or _request_deadline(), on_progress)
+        if not result['partial']: result_cache.set(key, result)
+    return result
+
+def _rank_batch_plan(target_mis_set, batch_slot_pools, solver=DEFAULT_SOLVER, top_n=MAX_RANKED_SOLUTIONS):
+    """
+    Mode 4 search (one slot pool per batch), cached like _rank_for_pool.
+    Returns (ranked result, None), or (None, error message) when a batch has no usable slot.
+    """
+    key = _cache_key('plan', target_mis_set, batch_slot_pools, len(batch_slot_pools), solver, top_n)
+    on_progress = _progress_reporter()
+    result = result_cache.get(key)
+    if result is not None: return result, None
+
+    all_unique_slots_in_plan = set()
+    for pool in batch_slot_pools:
+        all_unique_slots_in_plan.update(pool)
     
-    for slot_combination in combinations(slot_keys, num_batches):
-        batches = [[] for _ in range(num_batches)]
-        student_options = {}
-        for student in students_to_schedule:
-            possible_slots = [i for i, slot in enumerate(slot_combination) if student in availability_map[slot]['free_students']]
-            if possible_slots: student_options[student] = possible_slots
-        
-        for student, options in sorted(student_options.items(), key=lambda item: len(item[1])):
-            smallest_batch_index = min(options, key=lambda i: len(batches[i]))
-            batches[smallest_batch_index].append(student)
-            
-        unscheduled = students_to_schedule - set(s for b in batches for s in b)
-        
-        if not unscheduled: 
-            score = np.std([len(b) for b in batches]) 
-            solution_details = []
-            for i, batch in enumerate(batches):
-                slot = slot_combination[i]
-                solution_details.append({
-                    'day': slot[0], 'time': slot[1],
-                    'students': students_df_global[students_df_global['MIS'].isin(batch)].drop_duplicates(subset=['MIS']).to_dict('records'),
-                    'available_rooms': availability_map[slot]['available_rooms']
-                })
+    availability_map = _get_request_availability(target_mis_set, sorted(all_unique_slots_in_plan))
+
+    cleaned_batch_slot_pools, pool_counts = [], []
+    for i, pool in enumerate(batch_slot_pools):
+        viable_pool = [slot for slot in pool if slot in availability_map]
+        if not viable_pool:
+            return None, f"No students are free for any slot that matches the constraints for Batch {i+1}."
+        counts = _slot_free_counts(target_mis_set, viable_pool, availability_map)
+
+        if len(viable_pool) > TOP_N_SLOTS_HEURISTIC:
+            top_slots, top_counts = _rank_slots(viable_pool, counts)
+            # The greedy solver keeps the old truncation; the exact one only reorders (pruning does the rest)
+            limit = TOP_N_SLOTS_HEURISTIC if solver == 'greedy' else len(top_slots)
+            viable_pool, counts = top_slots[:limit], top_counts[:limit]
             
-            days_in_combo = {slot[0] for slot in slot_combination}
-            if len(days_in_combo) == num_batches:
-                solutions_diff_days.append({'score': score, 'solution': solution_details})
-            else:
-                solutions_same_day.append({'score': score, 'solution': solution_details})
+        cleaned_batch_slot_pools.append(viable_pool)
+        pool_counts.append(counts)
+    cleaned_batch_slot_pools = _prune_slot_pools(cleaned_batch_slot_pools, pool_counts, len(target_mis_set))
 
-    solutions_diff_days.sort(key=lambda x: x['score'])
-    solutions_same_day.sort(key=lambda x: x['score'])
-    all_solutions = solutions_diff_days + solutions_same_day
-    
-    return [s['solution'] for s in all_solutions[:TOP_N_SOLUTIONS_TO_SHOW]]
+    target_order = sorted(target_mis_set)
+    slot_masks = dict(zip(availability_map, _get_slot_masks(target_order, availability_map, list(availability_map))))
+    report = on_progress and (lambda ranked: on_progress(_lean_result(target_order, ranked, slot_masks, availability_map, solver, True)))
+    if all(cleaned_batch_slot_pools):
+        ranked, timed_out = _search_slot_product(target_order, cleaned_batch_slot_pools, slot_masks, solver, top_n, _request_deadline(), report, _slot_capacities(availability_map, availability_map))
+    else: ranked, timed_out = [], False # pruning emptied a batch's pool: no choice of slots can seat everyone
+    result = _lean_result(target_order, ranked, slot_masks, availability_map, solver, timed_out)
+    if not timed_out: result_cache.set(key, result)
+    return result, None
+
+class SuggestionPlanner:
+    """
+    Shared work for the fallback searches of one failed Mode 2/3/5 request.
+    Availability is built once over the union of the suggestion pools and every subproblem
+    (other batch counts, other days, relaxed pools) takes its slice of it. Subproblems whose
+    slots cannot cover every student, or that have fewer usable slots than batches, fail
+    without a search; a student with no free slot anywhere in the union fails all of them.
+    The searches are CPU-bound Python, so they run one at a time in the request's thread: threads would
+    only take turns on the GIL, and the fallbacks after the first feasible one would run for nothing.
+    """
+    def __init__(self, target_mis_set, slot_pools, solver=DEFAULT_SOLVER):
+        self.target_mis_set, self.solver = target_mis_set, solver
+        self.target_order = sorted(target_mis_set)
+        self.full_mask = (1 << len(self.target_order)) - 1
+        superset_pool = list(dict.fromkeys(slot for pool in slot_pools for slot in pool))
+        self.availability_map = _get_request_availability(target_mis_set, superset_pool)
+        self.deadline = _request_deadline() # one budget for the request's main search and all its fallbacks
+        self.coverable = self._covered(self.availability_map) == self.full_mask
+
+    def _covered(self, availability_map):
+        covered = 0
+        for slot in availability_map: covered |= availability_map[slot]['free_mask']
+        return covered
+
+    def _restrict(self, slot_pool):
+        # Same map (and slot order) _get_student_availability_index(students, slot_pool) would build
+        return {slot: self.availability_map[slot] for slot in slot_pool if slot in self.availability_map}
+
+    def rank(self, slot_pool, num_batches, top_n=MAX_RANKED_SOLUTIONS):
+        availability_map = self._restrict(slot_pool)
+        if not self.coverable or len(availability_map) < num_batches or self._covered(availability_map) != self.full_mask:
+            return _lean_result(self.target_order, [], {}, availability_map, self.solver)
+        return _rank_for_pool(self.target_mis_set, slot_pool, num_batches, self.solver, top_n, availability_map, self.deadline)
+
+    def rank_all(self, subproblems):
+        # subproblems: [(slot_pool, num_batches[, top_n])]
+        return [self.rank(*subproblem) for subproblem in subproblems]
+
+    def first_feasible(self, subproblems):
+        # (position, result) of the first subproblem with an option, or (None, None); the ones after it never run
+        for position, subproblem in enumerate(subproblems):
+            result = self.rank(*subproblem)
+            if result['ranked']: return position, result
+        return None, None
+
+def _rank_bulk_group(target_mis_set, slot_pool, num_batches, solver, deadline):
+    """
+    One group of a bulk request (runs on bulk_executor, so the deadline comes in as an argument).
+    Like Mode 2: the requested batch count first, then more batches while there is no option.
+    Returns (batch count used, ranked result).
+    """
+    availability_map = _get_student_availability_index(target_mis_set, slot_pool)
+    covered = 0
+    for entry in availability_map.values(): covered |= entry['free_mask']
+    target_order = sorted(target_mis_set)
+    result = _lean_result(target_order, [], {}, availability_map, solver)
+    if covered != (1 << len(target_order)) - 1: return num_batches, result # someone is never free
+    for batches in range(num_batches, max(num_batches, MAX_BATCH_OPTIONS) + 1):
+        if len(availability_map) < batches: break
+        result = _rank_for_pool(target_mis_set, slot_pool, batches, solver, MAX_RANKED_SOLUTIONS, availability_map, deadline)
+        if result['ranked'] or result['partial']: return batches, result
+    return num_batches, result
+
+def _plan_bulk(groups, slot_pool, num_batches, solver, exclusive_rooms=False):
+    """
+    Searches every (Subject, Division) group side by side (all of them read the same availability index
+    and slot pool) and picks one option per group: its best one, or with exclusive_rooms the best one whose
+    batches all get a room that no group earlier in the list has claimed for an overlapping time.
+    Returns one plan dict per group, in order.
+    """
+    deadline = _request_deadline() # the bulk threads have no request context of their own
+    targets = [{STUDENT_MIS_LIST[i] for i in group_members_map.get(group, [])} for group in groups]
+    rank_group = _with_request_trace(_rank_bulk_group)
+    futures = [bulk_executor.submit(rank_group, target, slot_pool, num_batches, solver, deadline) if target else None for target in targets]
+    claimed = RoomIntervalIndex() if exclusive_rooms else None
+    plans = []
+    for (subject, division), target, future in zip(groups, targets, futures):
+        plan = {'subject': subject, 'division': division, 'num_students': len(target), 'batches': []}
+        plans.append(plan)
+        if future is None:
+            plan['status'] = 'failure_no_students'
+            continue
+        used_batches, result = future.result()
+        plan.update({'num_batches': used_batches, 'total_solutions': len(result['ranked'])})
+        if result['partial']: plan['partial'] = True
+        if not result['ranked']:
+            plan['status'] = 'failure_no_solution'
+            continue
+        plan['status'] = 'success' if used_batches == num_batches else 'failure_with_suggestion'
+        for option, slot_combination in enumerate(result['ranked']):
+            batches = _materialize_option(result, slot_combination, claimed)
+            if claimed is None or all(batch['room'] for batch in batches): break
+        else:
+            # Its best option, without rooms: the ones it could still get are left for the groups after it
+            plan['status'] = 'failure_no_room'
+            option, batches = 0, _materialize_option(result, result['ranked'][0], claimed)
+            for batch in batches: batch['room'] = batch['room_capacity'] = None
+        if claimed is not None and plan['status'] != 'failure_no_room':
+            for batch in batches: claimed.book(batch['room'], batch['day'], batch['time'])
+        plan.update({'option': option + 1, 'batches': batches})
+    return plans
 
 def _parse_slot_filters(form_data, prefix=""):
     days = form_data.getlist(f'{prefix}days')
@@ -212,35 +1739,464 @@ def _parse_slot_filters(form_data, prefix=""):
                 filtered_slots.append(slot)
     return filtered_slots
 
+@app.before_request
+def _start_request_timing():
+    g.request_timer = time.perf_counter()
+    request_trace.set(RequestTrace())
+    if PROFILE_TOKEN and request.headers.get('X-Profile') == PROFILE_TOKEN: g.profiler = _start_profiler()
+
+def _server_timing(trace, elapsed):
+    # Server-Timing value: time per phase (summed, so phases run side by side can add up to more than 'total'),
+    # and the number of combinations the searches scored
+    totals, combinations = {}, trace.combinations()
+    for phase, seconds in trace.phases: totals[phase] = totals.get(phase, 0.0) + seconds
+    timings = [f"{phase};dur={seconds * 1000:.1f}" + (f';desc="{combinations} combinations"' if phase == 'search' else '') for phase, seconds in totals.items()]
+    return ', '.join(timings + [f"total;dur={elapsed * 1000:.1f}"])
+
+@app.after_request
+def _finish_request_timing(response):
+    elapsed = time.perf_counter() - g.pop('request_timer', time.perf_counter())
+    trace = request_trace.get() or RequestTrace()
+    request_trace.set(None)
+    endpoint = request.endpoint or 'none'
+    metrics.observe('freestudents_request_seconds', elapsed, endpoint=endpoint)
+    metrics.count('freestudents_requests_total', endpoint=endpoint, status=str(response.status_code))
+    response.headers['Server-Timing'] = _server_timing(trace, elapsed)
+    profiler = g.pop('profiler', None)
+    if profiler: response.headers['X-Profile-File'] = _stop_profiler(profiler)
+    return response
+
+def _start_profiler():
+    if PROFILER == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+        except ImportError: app.logger.warning('pyinstrument is not installed, profiling with cProfile')
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def _stop_profiler(profiler):
+    # Saves the profile (cProfile: .prof, for pstats or snakeviz; pyinstrument: .html) and returns its path
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{request.endpoint or 'request'}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{secrets.token_hex(3)}")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(path + '.prof')
+        return path + '.prof'
+    profiler.stop()
+    with open(path + '.html', 'w') as f: f.write(profiler.output_html())
+    return path + '.html'
+
+@app.before_request
+def _pin_data():
+    # The data stays the same for the whole request; a reload swaps it in between requests
+    _start_data_watcher()
+    if request.endpoint == 'reload_data': return
+    data_lock.acquire_read()
+    g.data_pinned = True
+
+@app.teardown_request
+def _unpin_data(exc):
+    if g.pop('data_pinned', False): data_lock.release_read()
+
+def streamable(view):
+    """
+    Lets a search route answer as chunked NDJSON when called with ?stream=1: a 'progress' line
+    each time its main search has better options (at most every PROGRESS_INTERVAL_SECONDS), then a
+    'done' line holding the usual JSON response plus 'truncated' (the time budget ran out) and
+    'server_timing' (the Server-Timing header went out before the search ran, so its value comes here).
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.args.get('stream') not in ('1', 'true'): return view(*args, **kwargs)
+        request.form # parse the body now, while the original request is still open
+        events = queue.Queue()
+        outcome = {}
+        trace, started, endpoint = request_trace.get() or RequestTrace(), g.get('request_timer', time.perf_counter()), request.endpoint
+
+        @copy_current_request_context
+        def run():
+            g.progress_events, g.request_started = events, time.time()
+            data_lock.acquire_read() # the original request (and its hold on the data) ends before this thread does
+            try:
+                response = make_response(view(*args, **kwargs))
+                outcome['body'], outcome['status'] = response.get_json(), response.status_code
+                outcome['truncated'] = bool(outcome['body'].get('partial')) or _deadline_passed(g.get('search_deadline'))
+            except Exception:
+                app.logger.exception('Streamed search failed')
+                outcome['body'], outcome['status'], outcome['truncated'] = {'error': 'An unexpected error occurred.'}, 500, False
+            finally: data_lock.release_read()
+            events.put(None)
+
+        # In a copy of this context, so the search's phases and counters still go to the request's trace
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+        def generate():
+            while (event := events.get()) is not None:
+                yield json.dumps(event) + '\n'
+            elapsed = time.perf_counter() - started
+            metrics.observe('freestudents_stream_seconds', elapsed, endpoint=endpoint) # request_seconds stops before the search does
+            yield json.dumps({'event': 'done', 'http_status': outcome['status'], 'truncated': outcome['truncated'],
+                              'server_timing': _server_timing(trace, elapsed), **outcome['body']}) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    return wrapper
+
+def async_job(view):
+    """
+    Lets a search route run as a background job when called with async=1 (query string or form): it answers
+    202 with a job id straight away, the search runs on job_executor, and GET /jobs/<id> reports its progress
+    and then the route's usual response. An identical request (same route, parameters and data) made while
+    such a job is queued or running gets that job instead of a new one. DELETE /jobs/<id> cancels it.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.values.get('async') not in ('1', 'true'): return view(*args, **kwargs)
+        parameters = sorted((name, value) for name, value in [*request.args.items(multi=True), *request.form.items(multi=True)] if name not in ('async', 'stream'))
+        key = hashlib.sha256(json.dumps([DATA_VERSION, request.endpoint, parameters], separators=(',', ':')).encode()).hexdigest()
+        job_id, created = job_store.create(key, request.endpoint)
+        if created:
+            running_jobs[job_id] = {'deadline': None, 'trace': RequestTrace(), 'progress': {}}
+            # Past the streamable layer, if any: a job reports its progress through /jobs/<id>
+            search_view = getattr(view, '__wrapped__', view)
+            job_executor.submit(copy_current_request_context(functools.partial(_run_job, job_id, search_view, args, kwargs)))
+            _start_job_watcher()
+        job = job_store.get(job_id)
+        return jsonify({'job_id': job_id, 'status': job['status'], 'deduplicated': not created, 'status_url': f'/jobs/{job_id}'}), 202
+    return wrapper
+
+class _JobProgress:
+    # Stands in for a streamed request's event queue (see _progress_reporter): keeps the job's best option so far
+    def __init__(self, job): self.job = job
+
+    def put(self, event):
+        best = event['solutions'][0] if event['solutions'] else None
+        self.job['progress'].update({
+            'options_found': event['total_solutions'], 'elapsed_ms': event['elapsed_ms'],
+            # std-dev of the batch sizes of the best option (what the options are ranked by, lower is better)
+            'best_score': best and round(float(np.std([len(batch['students']) for batch in best])), 3)
+        })
+
+def _job_progress(job):
+    return {**job['progress'], 'combinations_evaluated': job['trace'].combinations()}
+
+def _run_job(job_id, view, args, kwargs):
+    # On job_executor, inside a copy of the request's context (the request itself has long been answered)
+    job = running_jobs[job_id]
+    try:
+        if not job_store.start(job_id): return
+        g.search_budget, g.request_started = JOB_DEADLINE_SECONDS, time.time()
+        # Even without a budget a job gets a deadline: cancelling it works through cancelled_deadlines
+        job['deadline'] = g.search_deadline = _request_deadline() or time.time() + 366 * 24 * 60 * 60
+        g.progress_events = _JobProgress(job)
+        request_trace.set(job['trace'])
+        # No data pin: a reload must not wait up to JOB_DEADLINE_SECONDS. A reload rebinds every global
+        # instead of changing the old data, so if the state is the one the job started with, it saw no mix.
+        state = data_state
+        try: response = make_response(view(*args, **kwargs))
+        except Exception:
+            if data_state is state: raise
+            response = None
+        if data_state is not state:
+            job_store.update(job_id, status='failed', finished_at=time.time(), progress=_job_progress(job), result={'http_status': 409, 'error': 'The timetable data was reloaded while this job ran. Please run it again.'})
+            return
+        status = 'cancelled' if job['deadline'] in cancelled_deadlines else 'done'
+        job_store.update(job_id, status=status, finished_at=time.time(), progress=_job_progress(job), result={'http_status': response.status_code, **response.get_json()})
+    except Exception:
+        app.logger.exception('Background job failed')
+        job_store.update(job_id, status='failed', finished_at=time.time(), progress=_job_progress(job), result={'http_status': 500, 'error': 'An unexpected error occurred.'})
+    finally:
+        cancelled_deadlines.discard(job['deadline'])
+        running_jobs.pop(job_id, None)
+
+def _watch_jobs():
+    # Saves the progress of this process's running jobs, and stops the ones another worker was asked to cancel
+    while True:
+        time.sleep(JOB_POLL_SECONDS)
+        jobs = {job_id: job for job_id, job in list(running_jobs.items()) if job['deadline'] is not None}
+        if not jobs: continue
+        try:
+            for job_id in job_store.cancelling(set(jobs)): cancelled_deadlines.add(jobs[job_id]['deadline'])
+            for job_id, job in jobs.items(): job_store.update(job_id, progress=_job_progress(job))
+        except sqlite3.Error as e: print(f"Could not update the background jobs: {e}")
+
+def _start_job_watcher():
+    # One per process, like the data watcher. Its own lock: the request starting it holds the data, so waiting
+    # on reload_lock (held by a reload that waits for the data to be free) would deadlock
+    global job_watcher_pid
+    if job_watcher_pid == os.getpid(): return
+    with job_watcher_lock:
+        if job_watcher_pid == os.getpid(): return
+        job_watcher_pid = os.getpid()
+        threading.Thread(target=_watch_jobs, name='job-watcher', daemon=True).start()
+
+@_span('availability')
+def _slot_clashes(student_ids, slots):
+    """
+    Mode 1 for many slots at once: a single gather from slot_class_matrix (plus extra_clashes for
+    double-booked students) instead of a pass over each slot's classes and their members.
+    Returns ([student][slot] -> indices into slot_classes_map[slot] of their classes then, [] = free,
+    free students per slot).
+    """
+    rows = [slot_index_map.get(slot) for slot in slots]
+    indexed = [j for j, row in enumerate(rows) if row is not None] # a slot with no classes leaves everyone free
+    codes = np.full((len(student_ids), len(slots)), -1, dtype=np.int16)
+    if indexed and student_ids: codes[:, indexed] = slot_class_matrix[np.ix_([rows[j] for j in indexed], student_ids)].T
+    clashes = [[[code] if code >= 0 else [] for code in student_codes] for student_codes in codes.tolist()]
+    position = None
+    for j, row in enumerate(rows):
+        if row not in extra_clashes: continue
+        if position is None: position = {student: i for i, student in enumerate(student_ids)}
+        for student, more in extra_clashes[row].items():
+            if student in position: clashes[position[student]][j].extend(more)
+    return clashes, (codes < 0).sum(axis=0).tolist()
+
 @app.route('/check_availability', methods=['POST'])
 def check_availability():
+    # The form's single 'day' + 'time' answers with free/busy lists; 'slots' ('Day|Time' strings, any number) with the full matrix
+    slots = list(dict.fromkeys(tuple(s.split('|', 1)) for s in request.form.getlist('slots') if '|' in s))
     selected_day, selected_time = request.form.get('day'), request.form.get('time')
+    matrix = bool(slots)
+    if not matrix and selected_day and selected_time: slots = [(selected_day, selected_time)]
     target_mis_set = {mis for mis in re.split(r'[\s,]+', request.form.get('mis_numbers', '').strip()) if mis}
-    if not all([selected_day, selected_time, target_mis_set]): return jsonify({'error': 'All fields are required.'}), 400
-    
-    # This uses timetable_clash_global, which *includes* Saturday, so it's correct.
-    busy_schedule = timetable_clash_global[(timetable_clash_global['Day'] == selected_day) & (timetable_clash_global['Time'] == selected_time)]
-    busy_mis_set, busy_students_details = set(), []
-    for _, busy_class in busy_schedule.iterrows():
-        students_in_class = students_df_global[(students_df_global['Subject'] == busy_class['Subject']) & (students_df_global['Division'] == busy_class['Division'])]
-        conflicted_students = target_mis_set.intersection(set(students_in_class['MIS']))
-        if conflicted_students:
-            busy_mis_set.update(conflicted_students)
-            busy_details = students_df_global[students_df_global['MIS'].isin(conflicted_students)].drop_duplicates(subset=['MIS'])
-            for _, student in busy_details.iterrows():
-                busy_students_details.append({'MIS': student['MIS'], 'Name': student['Name'], 'Branch': student['Branch'], 'Subject': busy_class['Subject'], 'Division': busy_class['Division'], 'Room': busy_class['Room']})
-    free_mis_set = target_mis_set - busy_mis_set
-    free_students_details = []
-    if free_mis_set:
-        result_df = students_df_global[students_df_global['MIS'].isin(free_mis_set)].drop_duplicates(subset=['MIS'])
-        free_students_details = result_df[['MIS', 'Name', 'Branch']].to_dict('records')
+    if not all([slots, target_mis_set]): return jsonify({'error': 'All fields are required.'}), 400
+    
+    # slot_classes_map is built from the full timetable, which *includes* Saturday, so it's correct.
+    student_ids = sorted(student_index_map[mis] for mis in target_mis_set if mis in student_index_map)
+    records = [student_records[STUDENT_MIS_LIST[i]] for i in student_ids]
+    clashes, free_counts = _slot_clashes(student_ids, slots)
+    slot_classes = [slot_classes_map.get(slot, []) for slot in slots]
+    if matrix:
+        return jsonify({
+            'slots': [{
+                'day': day, 'time': time_str, 'free_count': free_count,
+                'classes': [{'Subject': subject, 'Division': division, 'Room': room} for subject, division, room in classes]
+            } for (day, time_str), free_count, classes in zip(slots, free_counts, slot_classes)],
+            # Per student and slot, the classes they have then (indices into slots[j]['classes'], [] = free)
+            'students': [{'MIS': record['MIS'], 'Name': record['Name'], 'Branch': record['Branch'], 'clashes': row} for record, row in zip(records, clashes)],
+            'unknown_mis': sorted(mis for mis in target_mis_set if mis not in student_index_map)
+        })
+
+    # One row per (student, class), in timetable order
+    busy_by_class = {}
+    for record, row in zip(records, clashes):
+        for k in row[0]: busy_by_class.setdefault(k, []).append(record)
+    busy_students_details = [{'MIS': student['MIS'], 'Name': student['Name'], 'Branch': student['Branch'], 'Subject': subject, 'Division': division, 'Room': room}
+                             for k, (subject, division, room) in enumerate(slot_classes[0]) for student in busy_by_class.get(k, [])]
+    free_students_details = [{'MIS': record['MIS'], 'Name': record['Name'], 'Branch': record['Branch']} for record, row in zip(records, clashes) if not row[0]]
     return jsonify({'free_results': free_students_details, 'busy_results': busy_students_details})
 
+@app.route('/heatmap', methods=['GET', 'POST'])
+def heatmap():
+    """
+    Free students per slot of the week, for groups or any list of students. 'group' ('Subject|Division',
+    any number) or 'subject' (+ optional 'division') pick rows of the precomputed group_slot_free_counts,
+    no selection returns every group; 'mis_numbers' gives one row for that list instead.
+    """
+    slots = [{'day': day, 'time': time_str, 'schedulable': time_str != LUNCH_SLOT} for day, time_str in INDEX_SLOTS]
+    mis_text = request.values.get('mis_numbers', '').strip()
+    if mis_text:
+        target_mis_set = {mis for mis in re.split(r'[\s,]+', mis_text) if mis}
+        student_ids = sorted(student_index_map[mis] for mis in target_mis_set if mis in student_index_map)
+        # Indicator vector over all students times the free matrix: one pass, whatever the list's size
+        indicator = np.zeros(len(STUDENT_MIS_LIST), dtype=np.int32)
+        indicator[student_ids] = 1
+        free_counts = slot_free_matrix.astype(np.int32) @ indicator if len(INDEX_SLOTS) else np.zeros(0, dtype=np.int32)
+        return jsonify({
+            'slots': slots, 'rows': [{'size': len(student_ids), 'free_counts': free_counts.tolist()}],
+            'unknown_mis': sorted(mis for mis in target_mis_set if mis not in student_index_map)
+        })
+
+    groups = [tuple(value.split('|', 1)) for value in request.values.getlist('group') if '|' in value]
+    subject, division = request.values.get('subject'), request.values.get('division')
+    if subject: groups += [group for group in GROUP_KEYS if group[0] == subject and division in (None, '', group[1])]
+    if not groups and not subject: groups = list(GROUP_KEYS)
+    groups = list(dict.fromkeys(groups))
+    known = [group for group in groups if group in group_row_map]
+    if not known: return jsonify({'error': 'No students are enrolled in the selected groups.'}), 400
+    free_counts = group_slot_free_counts[[group_row_map[group] for group in known]].tolist()
+    return jsonify({
+        'slots': slots,
+        'rows': [{'subject': s, 'division': d, 'size': len(group_members_map[(s, d)]), 'free_counts': row} for (s, d), row in zip(known, free_counts)],
+        'unknown_groups': ['|'.join(group) for group in groups if group not in group_row_map]
+    })
+
+WHAT_IF_FIELDS = ('Subject', 'Division', 'Day', 'Time', 'Room') # the timetable1.csv columns a what-if edit names
+
+def _timetable_row(i):
+    # Row i of timetable1.csv as a (Subject, Division, Day, Time, Room) tuple
+    return (SUBJECT_TABLE[timetable_columns['subject'][i]], DIVISION_TABLE[timetable_columns['division'][i]],
+            DAY_TABLE[timetable_columns['day'][i]], TIME_TABLE[timetable_columns['time'][i]], timetable_columns['room'][i])
+
+def _match_timetable_rows(source):
+    # Rows an edit's 'from' names: every row with its Subject, Division, Day and Time (and Room, when given)
+    mask = np.ones(len(timetable_columns['room']), dtype=bool)
+    for field, table in zip(WHAT_IF_FIELDS, (SUBJECT_TABLE, DIVISION_TABLE, DAY_TABLE, TIME_TABLE)):
+        code = _intern([source[field]], table)[0]
+        if code < 0: return []
+        mask &= timetable_columns[field.lower()] == code
+    return [i for i in np.flatnonzero(mask).tolist() if source.get('Room') in (None, timetable_columns['room'][i])]
+
+def _parse_what_if_edits(edits):
+    """
+    Turns /what_if edits into (timetable rows taken out, rows put in). An edit has 'from' (the rows to take out,
+    by Subject, Division, Day, Time and optionally Room), 'to' (the row to put in) or both, which moves the
+    'from' rows and needs only the fields that change. Values are cleaned like the CSV's.
+    Raises ValueError for an edit that matches no row or leaves a field out.
+    """
+    if not isinstance(edits, list): raise ValueError("'edits' must be a list.")
+    removed, added = set(), []
+    for n, edit in enumerate(edits, 1):
+        fields = {}
+        for side in ('from', 'to'):
+            values = edit.get(side) if isinstance(edit, dict) else None
+            if values is None: continue
+            if not isinstance(values, dict): raise ValueError(f"Edit {n}: '{side}' must be an object of timetable fields.")
+            fields[side] = {field: re.sub(r'\s+', ' ', str(values[field])).strip() for field in WHAT_IF_FIELDS if values.get(field) not in (None, '')}
+        if not fields: raise ValueError(f"Edit {n} needs 'from', 'to' or both.")
+        rows = []
+        if 'from' in fields:
+            missing = [field for field in WHAT_IF_FIELDS[:4] if field not in fields['from']]
+            if missing: raise ValueError(f"Edit {n}: 'from' is missing {', '.join(missing)}.")
+            rows = _match_timetable_rows(fields['from'])
+            if not rows: raise ValueError(f"Edit {n}: no timetable row matches {fields['from']}.")
+            removed.update(rows)
+        if 'to' in fields:
+            for base in [dict(zip(WHAT_IF_FIELDS, _timetable_row(i))) for i in rows] or [{}]:
+                row = {**base, **fields['to']}
+                missing = [field for field in WHAT_IF_FIELDS if not row.get(field)]
+                if missing: raise ValueError(f"Edit {n}: 'to' is missing {', '.join(missing)}.")
+                added.append(tuple(row[field] for field in WHAT_IF_FIELDS))
+    return sorted(removed), added
+
+class TimetableOverlay:
+    """
+    The loaded timetable with some rows taken out and some put in, leaving the loaded state untouched. Only what
+    the edits touch is recomputed: each touched (Day, Time) slot gets its classes, free row and clashes rebuilt
+    from its classes' members, each touched (Room, Day) its bookings (RoomIntervalIndex.overlay). Every other
+    slot and room reads through to the loaded data.
+    """
+    def __init__(self, removed_rows, added_rows):
+        self.removed, self.added = [_timetable_row(i) for i in removed_rows], list(added_rows)
+        removed_set = set(removed_rows)
+        self.slots = list(dict.fromkeys(row[2:4] for row in self.removed + self.added))
+        self.slot_classes, self.free_rows, self.clashes = {}, {}, {}
+        for slot in self.slots:
+            day_id, time_id = _intern([slot[0]], DAY_TABLE)[0], _intern([slot[1]], TIME_TABLE)[0]
+            rows = np.flatnonzero((timetable_columns['day'] == day_id) & (timetable_columns['time'] == time_id)).tolist() if min(day_id, time_id) >= 0 else []
+            # Same order as slot_classes_map (timetable rows, then the added ones)
+            kept = [_timetable_row(i) for i in rows if i not in removed_set] + [row for row in self.added if row[2:4] == slot]
+            classes = [(subject, division, room) for subject, division, _, _, room in kept]
+            members = [group_members_map.get((subject, division), np.zeros(0, dtype=np.int32)) for subject, division, _ in classes]
+            students, counts = np.unique(np.concatenate(members), return_counts=True) if members else (np.zeros(0, dtype=np.int32), None)
+            free = np.ones(len(STUDENT_MIS_LIST), dtype=bool)
+            free[students] = False
+            clashes = {}
+            if members:
+                clashing = students[counts > 1]
+                for k, class_members in enumerate(members):
+                    for student in np.intersect1d(class_members, clashing).tolist(): clashes.setdefault(student, []).append(k)
+            self.slot_classes[slot], self.free_rows[slot], self.clashes[slot] = classes, free, clashes
+
+        self.rebooked = {(room, day): [] for _, _, day, _, room in self.removed + self.added}
+        days = _intern(sorted({day for _, day in self.rebooked}), DAY_TABLE)
+        for i in np.flatnonzero(np.isin(timetable_columns['day'], days[days >= 0])).tolist():
+            room, day = timetable_columns['room'][i], DAY_TABLE[timetable_columns['day'][i]]
+            if (room, day) in self.rebooked and i not in removed_set: self.rebooked[(room, day)].append(TIME_TABLE[timetable_columns['time'][i]])
+        for _, _, day, time_str, room in self.added: self.rebooked[(room, day)].append(time_str)
+        self.rooms = room_index.overlay(self.rebooked)
+
+    @staticmethod
+    def loaded(slot):
+        # (free row, {student id: class indices}) of a slot in the loaded data, the same shape as free_rows / clashes
+        row = slot_index_map.get(slot)
+        if row is None: return np.ones(len(STUDENT_MIS_LIST), dtype=bool), {}
+        return slot_free_matrix[row], {student: [int(slot_class_matrix[row, student])] + more for student, more in extra_clashes.get(row, {}).items()}
+
+    def room_conflicts(self):
+        # Added rows whose room is already booked at an overlapping time
+        conflicts = []
+        for subject, division, day, time_str, room in self.added:
+            others = list(self.rebooked[(room, day)])
+            others.remove(time_str)
+            overlapping = sorted({other for other in others if _slots_overlap((day, time_str), (day, other))}, key=to_float_time)
+            if overlapping: conflicts.append({'Subject': subject, 'Division': division, 'Day': day, 'Time': time_str, 'Room': room, 'booked_at': overlapping})
+        return conflicts
+
+def _class_dicts(classes):
+    return [{'Subject': subject, 'Division': division, 'Room': room} for subject, division, room in classes]
+
+@app.route('/what_if', methods=['POST'])
+def what_if():
+    """
+    Sandboxed timetable edits: applies JSON {'edits': [...]} (see _parse_what_if_edits) on top of the loaded
+    timetable and reports what would change, without changing anything. The clash report and the free counts of
+    'groups' (['Subject|Division', ...], by default the groups the edits name) cover the touched slots only;
+    every other slot is as /heatmap shows it.
+    """
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict): return jsonify({'error': 'The request body must be a JSON object.'}), 400
+    try: removed_rows, added_rows = _parse_what_if_edits(payload.get('edits') or [])
+    except ValueError as e: return jsonify({'error': str(e)}), 400
+    if not removed_rows and not added_rows: return jsonify({'error': 'No edits given.'}), 400
+    overlay = TimetableOverlay(removed_rows, added_rows)
+
+    clash_report = []
+    for slot in overlay.slots:
+        _, before = overlay.loaded(slot)
+        after, classes_after = overlay.clashes[slot], _class_dicts(overlay.slot_classes[slot])
+        clash_report.append({
+            'day': slot[0], 'time': slot[1],
+            'classes_before': _class_dicts(slot_classes_map.get(slot, [])), 'classes_after': classes_after,
+            'clashing_before': len(before), 'clashing_after': len(after),
+            'new_clashes': [{**{key: student_records[STUDENT_MIS_LIST[student]][key] for key in ('MIS', 'Name', 'Branch')}, 'classes': [classes_after[k] for k in classes]}
+                            for student, classes in after.items() if student not in before],
+            'resolved_clashes': sorted(STUDENT_MIS_LIST[student] for student in before if student not in after)
+        })
+    touched_rows = {slot_index_map[slot] for slot in overlay.slots if slot in slot_index_map}
+    clashing_before = set().union(*extra_clashes.values())
+    clashing_after = set().union(*(students for row, students in extra_clashes.items() if row not in touched_rows), *overlay.clashes.values())
+
+    # Free rooms of every schedulable slot on a day whose bookings changed (plus slots the edits create)
+    room_days = {day for _, day in overlay.rebooked}
+    known_slots = set(all_possible_slots)
+    new_slots = [slot for slot in overlay.slots if slot not in known_slots and slot[1] != LUNCH_SLOT]
+    room_changes = []
+    for slot in all_possible_slots + new_slots:
+        if slot[0] not in room_days: continue
+        before = room_occupancy[slot] if slot in room_occupancy else room_index.free_rooms(room_capacity, *slot)
+        after = overlay.rooms.free_rooms(room_capacity, *slot)
+        if before != after: room_changes.append({'day': slot[0], 'time': slot[1], 'free_rooms_before': before, 'free_rooms_after': after})
+
+    groups = payload.get('groups') if isinstance(payload.get('groups'), list) else []
+    groups = [tuple(str(value).split('|', 1)) for value in groups if '|' in str(value)] or [row[:2] for row in overlay.removed + overlay.added]
+    availability = []
+    for group in dict.fromkeys(groups):
+        if group not in group_row_map: continue
+        members, row = group_members_map[group], group_row_map[group]
+        availability.append({'subject': group[0], 'division': group[1], 'size': len(members), 'slots': [{
+            'day': slot[0], 'time': slot[1],
+            'free_before': int(group_slot_free_counts[row, slot_index_map[slot]]) if slot in slot_index_map else len(members),
+            'free_after': int(np.count_nonzero(overlay.free_rows[slot][members]))
+        } for slot in overlay.slots]})
+
+    return jsonify({
+        'rows_removed': len(overlay.removed), 'rows_added': len(overlay.added),
+        'students_clashing': {'before': len(clashing_before), 'after': len(clashing_after)},
+        'clash_report': clash_report, 'room_conflicts': overlay.room_conflicts(),
+        'room_changes': room_changes, 'availability': availability
+    })
+
 @app.route('/mode_2_batch_finder', methods=['POST'])
+@async_job
+@streamable
 def mode_2_batch_finder():
     if not student_schedule_map: return jsonify({'error': 'Server data not loaded.'}), 500
     target_mis_set = _get_target_students(request.form)
-    requested_batches = int(request.form.get('num_batches', 1))
+    try: requested_batches = _get_num_batches(request.form)
+    except ValueError as e: return jsonify({'error': str(e)}), 400
+    solver = _get_solver(request.form)
     if not target_mis_set: return jsonify({'error': 'No students found.'}), 400
     excluded_slot_strings = request.form.getlist('excluded_slots')
     excluded_slots = {tuple(s.split('|')) for s in excluded_slot_strings}
@@ -249,23 +2205,26 @@ def mode_2_batch_finder():
     # Mode 2 now *only* searches the NO_SATURDAY list
     allowed_slot_pool = [slot for slot in all_possible_slots_NO_SATURDAY if slot not in excluded_slots]
     
-    availability_map = _get_student_availability_map(target_mis_set, allowed_slot_pool)
-    solutions = _find_balanced_solutions(target_mis_set, requested_batches, availability_map)
-    if solutions:
-        return jsonify({'status': 'success', 'solutions': solutions})
+    result = _rank_for_pool(target_mis_set, allowed_slot_pool, requested_batches, solver)
+    if result['ranked']:
+        return jsonify({'status': 'success', **_solutions_payload(result)})
     
-    # The suggestion logic also correctly uses the same (NO_SATURDAY) availability_map
-    for i in range(requested_batches + 1, MAX_BATCH_OPTIONS + 1):
-        suggestion_solutions = _find_balanced_solutions(target_mis_set, i, availability_map)
-        if suggestion_solutions:
-            return jsonify({'status': 'failure_with_suggestion', 'requested_batches': requested_batches, 'suggestion': {'solutions': suggestion_solutions}})
+    # The suggestion logic also correctly uses the same (NO_SATURDAY) pool
+    planner = SuggestionPlanner(target_mis_set, [allowed_slot_pool], solver)
+    _, suggestion = planner.first_feasible([(allowed_slot_pool, i) for i in range(requested_batches + 1, MAX_BATCH_OPTIONS + 1)])
+    if suggestion:
+        return jsonify({'status': 'failure_with_suggestion', 'requested_batches': requested_batches, 'suggestion': _solutions_payload(suggestion)})
     return jsonify({'status': 'failure_no_solution', 'requested_batches': requested_batches})
 
 @app.route('/mode_3_advanced_finder', methods=['POST'])
+@async_job
+@streamable
 def mode_3_advanced_finder():
     if not student_schedule_map: return jsonify({'error': 'Server data not loaded.'}), 500
     target_mis_set = _get_target_students(request.form)
-    requested_batches = int(request.form.get('num_batches', 1))
+    try: requested_batches = _get_num_batches(request.form)
+    except ValueError as e: return jsonify({'error': str(e)}), 400
+    solver = _get_solver(request.form)
     if not target_mis_set: return jsonify({'error': 'No students found.'}), 400
     
     # 1. This is correct: it uses all_possible_slots, so it finds Sat *if checked*
@@ -273,23 +2232,15 @@ def mode_3_advanced_finder():
     if not constrained_slot_pool:
         pass 
 
-    availability_map = _get_student_availability_map(target_mis_set, constrained_slot_pool)
-    solutions = _find_balanced_solutions(target_mis_set, requested_batches, availability_map)
+    result = _rank_for_pool(target_mis_set, constrained_slot_pool, requested_batches, solver)
     
-    if solutions:
-        return jsonify({'status': 'success', 'solutions': solutions})
+    if result['ranked']:
+        return jsonify({'status': 'success', **_solutions_payload(result)})
 
     # 2. Start suggestion logic
     suggestion_more_batches = None
     suggestion_relaxed_slots = None
 
-    # Suggestion 1: Correctly uses the original map (which might have Sat if opted-in)
-    for i in range(requested_batches + 1, MAX_BATCH_OPTIONS + 1):
-        sugg_more = _find_balanced_solutions(target_mis_set, i, availability_map)
-        if sugg_more:
-            suggestion_more_batches = {'solutions': sugg_more, 'batch_count': i}
-            break 
-
     # Suggestion 2: "Relaxed Slots"
     requested_days = request.form.getlist('m3_days')
     
@@ -301,18 +2252,18 @@ def mode_3_advanced_finder():
     # This pool is correct: it searches all slots *only* on the days the user picked
     # (or the NO_SATURDAY default list)
     day_constrained_pool = [slot for slot in all_possible_slots if slot[0] in requested_days]
-    day_constrained_map = _get_student_availability_map(target_mis_set, day_constrained_pool)
-    sugg_relaxed = _find_balanced_solutions(target_mis_set, requested_batches, day_constrained_map)
+
+    # Suggestion 1 correctly uses the original pool (which might have Sat if opted-in);
+    # the relaxed fallback MUST use the NO_SATURDAY list.
+    planner = SuggestionPlanner(target_mis_set, [constrained_slot_pool, day_constrained_pool, all_possible_slots_NO_SATURDAY], solver)
+    more_batch_counts = list(range(requested_batches + 1, MAX_BATCH_OPTIONS + 1))
+    position, sugg_more = planner.first_feasible([(constrained_slot_pool, i) for i in more_batch_counts])
+    if sugg_more:
+        suggestion_more_batches = {**_solutions_payload(sugg_more), 'batch_count': more_batch_counts[position]}
     
+    position, sugg_relaxed = planner.first_feasible([(day_constrained_pool, requested_batches), (all_possible_slots_NO_SATURDAY, requested_batches)])
     if sugg_relaxed:
-        suggestion_relaxed_slots = {'solutions': sugg_relaxed, 'type': 'days'}
-    else:
-        # ## --- THIS IS THE FIX --- ##
-        # Fallback suggestion MUST use the NO_SATURDAY list
-        full_availability_map = _get_student_availability_map(target_mis_set, all_possible_slots_NO_SATURDAY)
-        sugg_full = _find_balanced_solutions(target_mis_set, requested_batches, full_availability_map)
-        if sugg_full:
-            suggestion_relaxed_slots = {'solutions': sugg_full, 'type': 'all'}
+        suggestion_relaxed_slots = {**_solutions_payload(sugg_relaxed), 'type': ['days', 'all'][position]}
 
     # 3. Return both suggestions
     if suggestion_more_batches or suggestion_relaxed_slots:
@@ -326,11 +2277,15 @@ def mode_3_advanced_finder():
     return jsonify({'status': 'failure_no_solution', 'requested_batches': requested_batches})
 
 @app.route('/mode_4_planner', methods=['POST'])
+@async_job
+@streamable
 def mode_4_planner():
     if not student_schedule_map: return jsonify({'error': 'Server data not loaded.'}), 500
     
     target_mis_set = _get_target_students(request.form)
-    requested_batches = int(request.form.get('num_batches', 1))
+    try: requested_batches = _get_num_batches(request.form)
+    except ValueError as e: return jsonify({'error': str(e)}), 400
+    solver = _get_solver(request.form)
     if not target_mis_set: return jsonify({'error': 'No students found.'}), 400
 
     # This is correct: it uses all_possible_slots, so it finds Sat *if checked*
@@ -342,82 +2297,30 @@ def mode_4_planner():
             return jsonify({'error': f"No available time slots were found that match the constraints for Batch {i+1}."})
         batch_slot_pools.append(batch_pool)
 
-    all_unique_slots_in_plan = set()
-    for pool in batch_slot_pools:
-        all_unique_slots_in_plan.update(pool)
-    
-    availability_map = _get_student_availability_map(target_mis_set, list(all_unique_slots_in_plan))
-
-    cleaned_batch_slot_pools = []
-    for i, pool in enumerate(batch_slot_pools):
-        viable_pool = [slot for slot in pool if slot in availability_map]
-        if not viable_pool:
-            return jsonify({'error': f"No students are free for any slot that matches the constraints for Batch {i+1}."})
-
-        if len(viable_pool) > TOP_N_SLOTS_HEURISTIC:
-            top_slots = sorted(viable_pool, key=lambda s: len(availability_map[s]['free_students']), reverse=True)
-            viable_pool = top_slots[:TOP_N_SLOTS_HEURISTIC]
-            
-        cleaned_batch_slot_pools.append(viable_pool)
-
-    all_solutions = []
-    
-    for slot_combination in product(*cleaned_batch_slot_pools):
-        
-        if len(set(slot_combination)) != len(slot_combination):
-            continue
+    result, error = _rank_batch_plan(target_mis_set, batch_slot_pools, solver)
+    if error: return jsonify({'error': error})
             
-        batches = [[] for _ in range(requested_batches)]
-        student_options = {}
-        
-        for student in target_mis_set:
-            possible_slots = []
-            for i, slot in enumerate(slot_combination):
-                if student in availability_map[slot]['free_students']:
-                    possible_slots.append(i)
-            if possible_slots:
-                student_options[student] = possible_slots
-        
-        for student, options in sorted(student_options.items(), key=lambda item: len(item[1])):
-            smallest_batch_index = min(options, key=lambda i: len(batches[i]))
-            batches[smallest_batch_index].append(student)
-            
-        unscheduled = target_mis_set - set(s for b in batches for s in b)
-        
-        if not unscheduled: 
-            score = np.std([len(b) for b in batches]) 
-            solution_details = []
-            for i, batch in enumerate(batches):
-                slot = slot_combination[i]
-                solution_details.append({
-                    'day': slot[0], 'time': slot[1],
-                    'students': students_df_global[students_df_global['MIS'].isin(batch)].drop_duplicates(subset=['MIS']).to_dict('records'),
-                    'available_rooms': availability_map[slot]['available_rooms']
-                })
-            all_solutions.append({'score': score, 'solution': solution_details})
-            
-    if not all_solutions:
+    if not result['ranked']:
         # ## --- THIS IS THE FIX --- ##
         # Fallback suggestion MUST use the NO_SATURDAY list
-        full_availability_map = _get_student_availability_map(target_mis_set, all_possible_slots_NO_SATURDAY)
-        suggestion_solutions = _find_balanced_solutions(target_mis_set, requested_batches, full_availability_map)
+        suggestion = _rank_for_pool(target_mis_set, all_possible_slots_NO_SATURDAY, requested_batches, solver)
         
-        if suggestion_solutions:
-            return jsonify({'status': 'failure_with_suggestion', 'requested_batches': requested_batches, 'suggestion': {'solutions': suggestion_solutions}})
+        if suggestion['ranked']:
+            return jsonify({'status': 'failure_with_suggestion', 'requested_batches': requested_batches, 'suggestion': _solutions_payload(suggestion)})
         
         return jsonify({'status': 'failure_no_solution', 'requested_batches': requested_batches})
 
-    all_solutions.sort(key=lambda x: x['score'])
-    top_solutions = [s['solution'] for s in all_solutions[:TOP_N_SOLUTIONS_TO_SHOW]]
-    
-    return jsonify({'status': 'success', 'solutions': top_solutions})
+    return jsonify({'status': 'success', **_solutions_payload(result)})
 
 
 @app.route('/mode_5_day_finder', methods=['POST'])
+@async_job
 def mode_5_day_finder():
     if not student_schedule_map: return jsonify({'error': 'Server data not loaded.'}), 500
     target_mis_set = _get_target_students(request.form)
-    requested_batches = int(request.form.get('num_batches', 1))
+    try: requested_batches = _get_num_batches(request.form)
+    except ValueError as e: return jsonify({'error': str(e)}), 400
+    solver = _get_solver(request.form)
     required_day = request.form.get('m5_day')
     if not target_mis_set: return jsonify({'error': 'No students found.'}), 400
     
@@ -428,90 +2331,308 @@ def mode_5_day_finder():
              return jsonify({'error': f'{required_day} is not a valid day.'})
         pass 
         
-    availability_map = _get_student_availability_map(target_mis_set, day_specific_pool)
-    solutions = _find_balanced_solutions(target_mis_set, requested_batches, availability_map)
+    result = _rank_for_pool(target_mis_set, day_specific_pool, requested_batches, solver)
     
-    if solutions:
-        return jsonify({'status': 'success', 'solutions': solutions})
+    if result['ranked']:
+        return jsonify({'status': 'success', **_solutions_payload(result)})
         
     # ## --- THIS IS THE FIX --- ##
     # Suggestion Type 1: Mixed-day solutions MUST use the NO_SATURDAY list
     suggestion_pool = [slot for slot in all_possible_slots_NO_SATURDAY if slot[0] != required_day]
-    full_availability_map = _get_student_availability_map(target_mis_set, suggestion_pool)
-    suggestion_solutions_mixed = _find_balanced_solutions(target_mis_set, requested_batches, full_availability_map)
     
     # ## --- THIS IS THE FIX --- ##
     # Suggestion Type 2: Other single-day solutions MUST use the NO_SATURDAY list
     other_days = [day for day in ALL_DAYS_OPTIONS_NO_SATURDAY if day != required_day]
-    suggestion_solutions_days = []
+    day_pools = [(day, [slot for slot in all_possible_slots_NO_SATURDAY if slot[0] == day]) for day in other_days]
+    day_pools = [(day, day_pool) for day, day_pool in day_pools if day_pool]
     
-    for day in other_days:
-        day_pool = [slot for slot in all_possible_slots_NO_SATURDAY if slot[0] == day]
-        if not day_pool: continue
-        
-        day_map = _get_student_availability_map(target_mis_set, day_pool)
-        if not day_map: continue
-        
-        day_solutions = _find_balanced_solutions(target_mis_set, requested_batches, day_map)
-        
-        if day_solutions:
-            suggestion_solutions_days.append(day)
+    # The day pools are slices of the mixed-day pool, so one availability build serves all of them.
+    # Only feasibility matters for the other days, so one option each is enough.
+    planner = SuggestionPlanner(target_mis_set, [suggestion_pool], solver)
+    suggestion_mixed, *day_solutions = planner.rank_all([(suggestion_pool, requested_batches)] + [(day_pool, requested_batches, 1) for _, day_pool in day_pools])
+    suggestion_solutions_days = [day for (day, _), result in zip(day_pools, day_solutions) if result['ranked']]
             
-    if suggestion_solutions_mixed or suggestion_solutions_days:
+    if suggestion_mixed['ranked'] or suggestion_solutions_days:
         return jsonify({
             'status': 'failure_with_suggestion', 
             'requested_day': required_day, 
-            'suggestion_mixed': {'solutions': suggestion_solutions_mixed} if suggestion_solutions_mixed else None,
+            'suggestion_mixed': _solutions_payload(suggestion_mixed) if suggestion_mixed['ranked'] else None,
             'suggestion_days': suggestion_solutions_days
         })
         
     return jsonify({'status': 'failure_no_solution', 'requested_day': required_day})
 
+def _parse_bulk_groups(data):
+    # 'groups' ([subject, division] or 'Subject|Division'), 'subjects' (all their divisions) and/or 'all_groups';
+    # raises ValueError for a field of the wrong type
+    subjects, named_groups = data.get('subjects') or [], data.get('groups') or []
+    if not isinstance(subjects, list) or not all(isinstance(subject, str) for subject in subjects):
+        raise ValueError("'subjects' must be a list of subject names.")
+    if not isinstance(named_groups, list) or not all(
+            isinstance(group, str) or (isinstance(group, list) and len(group) == 2 and all(isinstance(part, str) for part in group)) for group in named_groups):
+        raise ValueError("'groups' must be a list of 'Subject|Division' strings or [subject, division] pairs.")
+    groups = []
+    if data.get('all_groups'): groups += [(subject, division) for subject, divisions in subject_division_map.items() for division in divisions]
+    for subject in subjects: groups += [(subject, division) for division in subject_division_map.get(subject, [])]
+    for group in named_groups: groups.append(tuple(group.split('|', 1)) if isinstance(group, str) else tuple(group))
+    return list(dict.fromkeys(group for group in groups if len(group) == 2))
+
+def _bulk_sheets(plans):
+    # A summary sheet, then one sheet per group (see _export_response)
+    summary = [[plan['subject'], plan['division'], plan['num_students'], plan['status'],
+                '; '.join(f"{batch['day']} {batch['time']} ({batch['room'] or 'no room'}, {len(batch['students'])})" for batch in plan['batches'])] for plan in plans]
+    sheets = [('Summary', ['Subject', 'Division', 'Students', 'Status', 'Sessions'], summary)]
+    for plan in plans:
+        rows = [[_batch_label(i), batch['day'], batch['time'], batch['room'] or '', student['MIS'], student['Name'], student['Branch']]
+                for i, batch in enumerate(plan['batches']) for student in batch['students']]
+        sheets.append((f"{plan['subject']} {plan['division']}", SOLUTION_EXPORT_HEADERS, rows))
+    return sheets
+
+@app.route('/bulk_schedule', methods=['POST'])
+def bulk_schedule():
+    # Mode 2 for many groups in one call; JSON body, see _parse_bulk_groups and _plan_bulk.
+    # 'format': 'xlsx' or 'csv' (or ?format=...) answers with a workbook / ZIP of CSVs instead of JSON.
+    if not student_schedule_map: return jsonify({'error': 'Server data not loaded.'}), 500
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict): return jsonify({'error': 'The request body must be a JSON object.'}), 400
+    try: groups = _parse_bulk_groups(data)
+    except ValueError as e: return jsonify({'error': str(e)}), 400
+    if not groups: return jsonify({'error': 'No groups given.'}), 400
+    try: requested_batches = _get_num_batches(data)
+    except ValueError as e: return jsonify({'error': str(e)}), 400
+    solver = _get_solver(data)
+    excluded = data.get('excluded_slots') or []
+    if not isinstance(excluded, list) or not all(isinstance(s, str) for s in excluded):
+        return jsonify({'error': "'excluded_slots' must be a list of 'Day|Time' strings."}), 400
+    excluded_slots = {tuple(s.split('|')) for s in excluded}
+    allowed_slot_pool = [slot for slot in all_possible_slots_NO_SATURDAY if slot not in excluded_slots]
+
+    plans = _plan_bulk(groups, allowed_slot_pool, requested_batches, solver, bool(data.get('exclusive_rooms')))
+    export_format = request.args.get('format') or data.get('format')
+    if export_format in EXPORT_FORMATS: return _export_response(_bulk_sheets(plans), 'bulk_schedule', export_format)
+    return jsonify({
+        'status': 'success', 'requested_batches': requested_batches, 'exclusive_rooms': bool(data.get('exclusive_rooms')),
+        'partial': any(plan.get('partial') for plan in plans), 'summary': dict(Counter(plan['status'] for plan in plans)), 'groups': plans
+    })
+
+@app.route('/solutions/<token>', methods=['GET'])
+def get_solutions_page(token):
+    entry = result_handles.get(token)
+    if entry is None:
+        return jsonify({'error': 'These results have expired. Please run the search again.'}), 404
+    if entry[0] != DATA_VERSION:
+        return jsonify({'error': 'The timetable data has been updated since this search. Please run it again.'}), 404
+    result = entry[1]
+    try: page = max(int(request.args.get('page', 1)), 1)
+    except ValueError: return jsonify({'error': 'Invalid page number.'}), 400
+    start = (page - 1) * TOP_N_SOLUTIONS_TO_SHOW
+    total = len(result['ranked'])
+    return jsonify({
+        'solutions': _materialize_results(result, start, start + TOP_N_SOLUTIONS_TO_SHOW),
+        'page': page, 'page_size': TOP_N_SOLUTIONS_TO_SHOW, 'total_solutions': total,
+        'has_more': start + TOP_N_SOLUTIONS_TO_SHOW < total
+    })
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    # Progress while the job runs (live when this worker runs it), then the route's response under 'result'
+    job = job_store.refresh(job_id)
+    if job is None: return jsonify({'error': 'No such job (finished jobs expire).'}), 404
+    if job_id in running_jobs: job['progress'] = _job_progress(running_jobs[job_id])
+    del job['key'], job['pid']
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    # The search stops at its next deadline check and the job finishes as 'cancelled', with the options found so far
+    # (a walk running in the SEARCH_WORKERS processes cannot see this and goes on until the job's deadline)
+    job = job_store.cancel(job_id)
+    if job is None: return jsonify({'error': 'No such job (finished jobs expire).'}), 404
+    if job_id in running_jobs and running_jobs[job_id]['deadline'] is not None: cancelled_deadlines.add(running_jobs[job_id]['deadline'])
+    del job['key'], job['pid']
+    return jsonify(job)
+
+@app.route('/reload_data', methods=['POST'])
+def reload_data():
+    if RELOAD_TOKEN and request.headers.get('X-Reload-Token') != RELOAD_TOKEN: return jsonify({'error': 'Invalid reload token.'}), 403
+    try: return jsonify(reload_data_files(force=request.args.get('force') in ('1', 'true')))
+    except Exception as e: return jsonify({'error': f'Reload failed, keeping the loaded data: {e}'}), 500
+
+@app.cli.command('reload-data')
+@click.option('--url', help='Base URL of a running server to reload, e.g. http://127.0.0.1:8000 (each of its workers also picks the change up through its watcher).')
+@click.option('--force', is_flag=True, help='Rebuild even if the CSVs are unchanged.')
+def reload_data_command(url, force):
+    """Reloads students/timetable CSVs and prints what changed."""
+    if not url:
+        click.echo(json.dumps(reload_data_files(force), indent=2)) # in this process: checks the CSVs load
+        return
+    headers = {'X-Reload-Token': RELOAD_TOKEN} if RELOAD_TOKEN else {}
+    reload_request = urllib.request.Request(url.rstrip('/') + '/reload_data' + ('?force=1' if force else ''), method='POST', headers=headers)
+    with urllib.request.urlopen(reload_request) as response: click.echo(response.read().decode())
+
+@app.cli.command('build-snapshot')
+@click.option('--path', default=DATA_SNAPSHOT_DIR, show_default=True)
+def build_snapshot_command(path):
+    """Compiles the CSVs into the binary snapshot workers boot from."""
+    click.echo(json.dumps(build_data_snapshot(path), indent=2))
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'data_version': DATA_VERSION, **result_cache.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # This worker's counters and histograms (see Metrics), plus the result cache and the loaded data
+    stats = result_cache.stats()
+    extra = [(f"freestudents_result_cache_{name}_total", 'counter', {}, stats[name]) for name in ('hits', 'misses', 'evictions')]
+    extra += [('freestudents_result_cache_entries', 'gauge', {}, stats['entries']), ('freestudents_data_info', 'gauge', {'data_version': DATA_VERSION}, 1)]
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file that hands over what was written so far, so zipfile can write into a streamed response
+    def __init__(self): self.chunks = []
+
+    def writable(self): return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+def _sheet_names(names):
+    # Excel sheet names: at most 31 characters, none of []:*?/\, unique ignoring case (also safe as file names)
+    used, unique = set(), []
+    for name in names:
+        base = re.sub(r'[\[\]:*?/\\]', ' ', str(name)).strip()[:31] or 'Sheet'
+        name, copy = base, 1
+        while name.lower() in used:
+            copy += 1
+            name = f"{base[:31 - len(str(copy)) - 1]}~{copy}"
+        used.add(name.lower())
+        unique.append(name)
+    return unique
+
+def _batch_label(i):
+    # 'A'..'Z', then 'AA', 'AB', ... like spreadsheet columns, for the i-th batch of an option (0-based)
+    return get_column_letter(i + 1)
+
+def _export_row(row):
+    return [None if value != value else value for value in row] # NaN (a missing Branch, say) -> empty cell
+
+def _column_widths(headers, rows):
+    # Longest value per column, from the rows themselves rather than from the written cells
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        for i, value in enumerate(row):
+            if value is not None and len(str(value)) > widths[i]: widths[i] = len(str(value))
+    return [width + 2 for width in widths]
+
+@_span('export')
+def _xlsx_file(sheets):
+    """
+    sheets ([(name, headers, rows)]) as a write-only workbook: appended rows go straight to disk instead
+    of becoming cell objects, and nothing is read back to size the columns. Returns a rewound temporary file.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    for name, (_, headers, rows) in zip(_sheet_names(sheet[0] for sheet in sheets), sheets):
+        rows = [_export_row(row) for row in rows]
+        worksheet = workbook.create_sheet(name)
+        for column, width in enumerate(_column_widths(headers, rows), 1):
+            worksheet.column_dimensions[get_column_letter(column)].width = width
+        worksheet.append(headers)
+        for row in rows: worksheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+def _csv_chunks(headers, rows):
+    # UTF-8 CSV (with a BOM, so Excel gets the names right), EXPORT_CHUNK_ROWS rows at a time
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(_export_row(row))
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def _zip_chunks(sheets):
+    # One CSV per sheet, zipped on the fly: each piece is sent as soon as zipfile has written it
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, (_, headers, rows) in zip(_sheet_names(sheet[0] for sheet in sheets), sheets):
+            with archive.open(f'{name}.csv', 'w') as member:
+                for chunk in _csv_chunks(headers, rows):
+                    member.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
+
+def _export_response(sheets, basename, export_format='xlsx'):
+    """
+    Streams sheets ([(name, headers, rows)]) as basename.xlsx (one sheet each), or with export_format
+    'csv' as basename.csv (a single sheet) or basename.zip (one CSV per sheet). The rows are built
+    beforehand, so the response never reads the live data while it streams.
+    """
+    if export_format == 'csv':
+        if len(sheets) == 1:
+            return Response(_csv_chunks(*sheets[0][1:]), mimetype='text/csv', headers={'Content-Disposition': f'attachment; filename={basename}.csv'})
+        return Response(_zip_chunks(sheets), mimetype='application/zip', headers={'Content-Disposition': f'attachment; filename={basename}.zip'})
+    return send_file(_xlsx_file(sheets), mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=f'{basename}.xlsx')
+
+def _is_mis_list(value):
+    return isinstance(value, list) and all(isinstance(mis, str) for mis in value)
+
 @app.route('/download_list', methods=['POST'])
 def download_list():
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict): return jsonify({'error': 'The request body must be a JSON object.'}), 400
         mis_list = data.get('mis_list', [])
+        if not _is_mis_list(mis_list): return jsonify({'error': "'mis_list' must be a list of MIS numbers."}), 400
+        if data.get('subject') and data.get('division'): # a whole division
+            mis_list = [STUDENT_MIS_LIST[i] for i in group_members_map.get((data['subject'], data['division']), [])]
         if not mis_list:
             return jsonify({"error": "No student list provided."}), 400
 
-        # Filter the global dataframe
-        df_to_download = students_df_global[students_df_global['MIS'].isin(mis_list)].copy()
-        
-        # 1. Drop duplicates to get the unique students
-        df_to_download.drop_duplicates(subset=['MIS'], inplace=True)
-        
-        # 2. Sort by MIS number
-        df_to_download.sort_values(by='MIS', inplace=True)
-        
-        # 3. Select and reorder columns
-        df_to_download = df_to_download[['MIS', 'Name', 'Branch']]
+        # 1. Look up the unique students, sorted by MIS number
+        records = sorted(_get_student_records(mis_list), key=lambda r: r['MIS'])
         
-        # Create an in-memory Excel file
-        output = io.BytesIO()
-
-        # --- Auto-sizing logic ---
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_to_download.to_excel(writer, index=False, sheet_name='Students')
-            worksheet = writer.sheets['Students']
-            
-            for column_cells in worksheet.columns:
-                length = max(len(str(cell.value)) for cell in column_cells) + 2
-                column_letter = column_cells[0].column_letter
-                worksheet.column_dimensions[column_letter].width = length
-        
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name='student_list.xlsx'
-        )
+        # 2. Select and reorder columns, then stream the file (.xlsx, or .csv with 'format': 'csv')
+        rows = [[record['MIS'], record['Name'], record['Branch']] for record in records]
+        return _export_response([('Students', ['MIS', 'Name', 'Branch'], rows)], 'student_list', data.get('format', 'xlsx'))
     except Exception as e:
         print(f"Error generating download: {e}")
         return jsonify({"error": "Failed to generate file."}), 500
 
+@app.route('/download_solution', methods=['POST'])
+def download_solution():
+    # A whole option, one sheet per batch. JSON: {'batches': [{'day', 'time', 'room', 'mis_list'}], 'format': 'xlsx' or 'csv' (a ZIP)}
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict): return jsonify({'error': 'The request body must be a JSON object.'}), 400
+    batches = data.get('batches') or []
+    if not isinstance(batches, list) or not all(isinstance(batch, dict) for batch in batches):
+        return jsonify({'error': "'batches' must be a list of objects."}), 400
+    if not batches: return jsonify({"error": "No batches provided."}), 400
+    for batch in batches:
+        if not all(isinstance(batch.get(field), (str, type(None))) for field in ('day', 'time', 'room')):
+            return jsonify({'error': "A batch's 'day', 'time' and 'room' must be strings."}), 400
+        if not _is_mis_list(batch.get('mis_list') or []):
+            return jsonify({'error': "A batch's 'mis_list' must be a list of MIS numbers."}), 400
+    sheets = []
+    for i, batch in enumerate(batches):
+        label, room = _batch_label(i), batch.get('room') or ''
+        records = sorted(_get_student_records(batch.get('mis_list') or []), key=lambda r: r['MIS'])
+        rows = [[label, batch.get('day'), batch.get('time'), room, record['MIS'], record['Name'], record['Branch']] for record in records]
+        sheets.append((f"Batch {label} - {batch.get('day', '')}", SOLUTION_EXPORT_HEADERS, rows))
+    return _export_response(sheets, 'solution', data.get('format', 'xlsx'))
+
 @app.route('/')
 def index():
     return render_template('index.html', 
@@ -0,0 +1,413 @@
+"""
+Benchmarks for the scheduling solvers, run against the real CSV groups.
+
+    python benchmark.py solvers                  # every group, 2-5 batches, both solvers
+    python benchmark.py solvers --groups 10 --batches 3 4
+    python benchmark.py startup                  # worker boot time and RSS, CSV vs binary snapshot
+    python benchmark.py workers --workers 1 4 8  # per-worker memory under gunicorn, with and without preload
+    python benchmark.py generate --enrollments 100000 --out bench_data   # synthetic students/timetable/rooms CSVs
+    python benchmark.py modes --data bench_data --save-baseline baseline.json
+    python benchmark.py modes --data bench_data --baseline baseline.json  # exits 1 on a regression
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+import app
+
+
+def _real_groups(limit=None):
+    # Largest groups first: they are the ones that hit the gunicorn timeout
+    groups = sorted(app.group_mask_map.items(), key=lambda item: -int(item[1].sum()))
+    if limit: groups = groups[:limit]
+    return [(f"{subject} / {division}", {app.STUDENT_MIS_LIST[i] for i in np.flatnonzero(mask)}) for (subject, division), mask in groups]
+
+
+def _best_option(solutions):
+    # (std-dev, number of distinct days) of the top-ranked option
+    if not solutions: return None, None
+    return float(np.std([len(batch['students']) for batch in solutions[0]])), len({batch['day'] for batch in solutions[0]})
+
+
+def run_solvers(args):
+    print(f"{'group':<60} {'k':>2} {'students':>8} | {'greedy s':>8} {'std':>7} {'days':>4} | {'flow s':>8} {'std':>7} {'days':>4}")
+    totals = {solver: 0.0 for solver in app.SOLVER_OPTIONS}
+    better = 0
+    for name, target in _real_groups(args.groups):
+        availability_map = app._get_student_availability_index(target, app.all_possible_slots_NO_SATURDAY)
+        for num_batches in args.batches:
+            row = {}
+            for solver in ('greedy', 'flow'):
+                started = time.perf_counter()
+                solutions = app._find_balanced_solutions(target, num_batches, availability_map, solver)
+                elapsed = time.perf_counter() - started
+                totals[solver] += elapsed
+                row[solver] = (elapsed,) + _best_option(solutions)
+            greedy_rank, flow_rank = [(row[s][2] != num_batches, row[s][1]) if row[s][1] is not None else None for s in ('greedy', 'flow')]
+            if flow_rank and (not greedy_rank or flow_rank < greedy_rank): better += 1
+            cells = lambda r: f"{r[0]:>8.3f} {'-' if r[1] is None else f'{r[1]:.2f}':>7} {'-' if r[2] is None else r[2]:>4}"
+            print(f"{name[:60]:<60} {num_batches:>2} {len(target):>8} | {cells(row['greedy'])} | {cells(row['flow'])}")
+    print(f"\nTotal: greedy {totals['greedy']:.2f}s, flow {totals['flow']:.2f}s; flow ranked a better (or the only) option first in {better} runs")
+
+
+_BOOT_PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+rss = next(int(line.split()[1]) for line in open('/proc/self/status') if line.startswith('VmRSS'))
+print(json.dumps({'seconds': elapsed, 'rss_kb': rss}))
+"""
+
+
+def _boot(snapshot_dir):
+    env = dict(os.environ, DATA_SNAPSHOT_DIR=snapshot_dir, DATA_WATCH_INTERVAL_SECONDS='0')
+    output = subprocess.run([sys.executable, '-c', _BOOT_PROBE], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_startup(args):
+    if not os.path.isdir(app.DATA_SNAPSHOT_DIR) or app._read_data_snapshot()[0] is None:
+        print(f"Building the snapshot in {app.DATA_SNAPSHOT_DIR} first")
+        app.build_data_snapshot()
+    print(f"{'source':<10} {'boot s (best)':>13} {'boot s (mean)':>13} {'RSS MB':>8}")
+    for source, snapshot_dir in (('csv', ''), ('snapshot', app.DATA_SNAPSHOT_DIR)):
+        runs = [_boot(snapshot_dir) for _ in range(args.runs)]
+        seconds = [run['seconds'] for run in runs]
+        print(f"{source:<10} {min(seconds):>13.3f} {sum(seconds) / len(seconds):>13.3f} {max(run['rss_kb'] for run in runs) / 1024:>8.1f}")
+
+
+def _memory_kb(pid):
+    # Rss counts shared pages in full, Pss splits them between the processes sharing them, Private is the worker's own
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'): fields[name] = int(value.split()[0])
+    return {'rss': fields['Rss'], 'pss': fields['Pss'], 'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def _child_pids(pid):
+    children = []
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f: children += [int(child) for child in f.read().split()]
+    return children
+
+
+def _serve(num_workers, preload, port, requests_per_worker):
+    env = dict(os.environ, PRELOAD_DATA='1' if preload else '0', DATA_WATCH_INTERVAL_SECONDS='0')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(num_workers), '-b', f'127.0.0.1:{port}', 'app:app'],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f'http://127.0.0.1:{port}'
+        for _ in range(600):
+            try:
+                urllib.request.urlopen(f'{base}/cache_stats', timeout=5).read()
+                break
+            except OSError: time.sleep(0.1)
+        while len(_child_pids(server.pid)) < num_workers: time.sleep(0.1)
+        # A real search per request, so every worker touches the availability index and the student records
+        subject, division = sorted(app.group_members_map, key=lambda group: len(app.group_members_map[group]))[len(app.group_members_map) // 2]
+        form = urllib.parse.urlencode({'student_mode': 'by_group', 'subject': subject, 'division': division, 'num_batches': 2}).encode()
+        for _ in range(num_workers * requests_per_worker):
+            urllib.request.urlopen(f'{base}/mode_2_batch_finder', data=form, timeout=120).read()
+        workers = [_memory_kb(pid) for pid in _child_pids(server.pid)]
+        return _memory_kb(server.pid), workers
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_workers(args):
+    print(f"{'workers':>7} {'preload':>7} | {'worker RSS MB':>13} {'PSS MB':>7} {'private MB':>10} | {'total PSS MB':>12}")
+    for num_workers in args.workers:
+        for preload in (False, True):
+            master, workers = _serve(num_workers, preload, args.port, args.requests)
+            mean = lambda field: sum(worker[field] for worker in workers) / len(workers) / 1024
+            total = (master['pss'] + sum(worker['pss'] for worker in workers)) / 1024
+            print(f"{num_workers:>7} {'yes' if preload else 'no':>7} | {mean('rss'):>13.1f} {mean('pss'):>7.1f} {mean('private'):>10.1f} | {total:>12.1f}")
+
+
+
+# ## --- SYNTHETIC DATA (students1/timetable1/rooms1-shaped) --- ##
+SYNTHETIC_BRANCHES = {'Civil Engineering': 'CV', 'Computer Engineering': 'CS', 'Electrical Engineering': 'EE', 'Electronics and Telecommunication': 'ET',
+                      'Instrumentation and Control': 'IC', 'Mechanical Engineering': 'ME', 'Metallurgy': 'MT', 'Production Engineering': 'PE', 'Planning': 'PL',
+                      'Robotics and Artificial Intelligence': 'RA', 'Data Science': 'DS'} # branch -> subject code
+SYNTHETIC_NAMES = ['AARAV', 'ADITI', 'ANIKET', 'ANUSHKA', 'ARJUN', 'DEVIKA', 'GAURAV', 'ISHA', 'KUNAL', 'MEERA', 'NIKHIL', 'PRIYA', 'RAHUL', 'SAKSHI', 'TANVI', 'VIKRAM']
+SYNTHETIC_SURNAMES = ['DESHMUKH', 'JOSHI', 'KULKARNI', 'PATIL', 'PAWAR', 'SHINDE', 'JADHAV', 'KALE', 'MORE', 'GAIKWAD']
+SYNTHETIC_TIMES = ['08:30-09:30', '09:30-10:30', '10:30-11:30', '11:30-12:30', '01:30-02:30', '02:30-03:30', '03:30-04:30', '04:30-05:30', '05:30-06:30']
+SYNTHETIC_WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+CORE_SUBJECTS, ELECTIVES_PER_STUDENT, COHORT_SIZE, SESSIONS_PER_WEEK = 8, 5, 60, 2 # about 13 subjects per student, like students1.csv
+
+
+def generate_dataset(out_dir, enrollments, num_rooms, seed=0):
+    """
+    Writes students1.csv, timetable1.csv and rooms1.csv for about `enrollments` student rows into out_dir
+    (num_rooms=0: enough rooms for the timetable to leave some free in every slot).
+    Students come in branch cohorts sharing their core subjects (clash-free among themselves) and pick electives
+    by popularity, so group sizes and clash patterns spread out the way the real data does.
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    num_students = max(enrollments // (CORE_SUBJECTS + ELECTIVES_PER_STUDENT), 1)
+    num_rooms = num_rooms or max(num_students // 40, 60) # about three rooms for every two classes in a slot
+    weekday_slots = [(day, time_str) for day in SYNTHETIC_WEEKDAYS for time_str in SYNTHETIC_TIMES]
+    all_slots = weekday_slots + [('Saturday', time_str) for time_str in SYNTHETIC_TIMES[:3]]
+    rooms = [(f"R{i:03d}", rng.choice([30, 40, 60, 80, 120, 180])) for i in range(1, num_rooms + 1)]
+    booked = {slot: set() for slot in all_slots}
+    timetable, enrolled = [], {} # (subject, division) -> [mis]
+
+    def schedule(subject, division, slots):
+        for slot in slots:
+            free = [room for room, _ in rooms if room not in booked[slot]]
+            room = rng.choice(free) if free else rng.choice(rooms)[0]
+            booked[slot].add(room)
+            timetable.append([subject, division, slot[0], slot[1], room])
+
+    students = [(f"6125{i:05d}", rng.choice(list(SYNTHETIC_BRANCHES))) for i in range(num_students)]
+    for branch, code in SYNTHETIC_BRANCHES.items():
+        members = [mis for mis, student_branch in students if student_branch == branch]
+        for cohort in range(0, len(members), COHORT_SIZE):
+            division = f"Division {cohort // COHORT_SIZE + 1}"
+            slots = rng.sample(weekday_slots, CORE_SUBJECTS * SESSIONS_PER_WEEK)
+            for j in range(CORE_SUBJECTS):
+                subject = f"{code} Core {j + 1}"
+                enrolled[(subject, division)] = members[cohort:cohort + COHORT_SIZE]
+                schedule(subject, division, slots[j * SESSIONS_PER_WEEK:(j + 1) * SESSIONS_PER_WEEK])
+
+    num_electives = max(num_students * ELECTIVES_PER_STUDENT // 150, ELECTIVES_PER_STUDENT * 2)
+    popularity = [1 / (k + 1) ** 0.8 for k in range(num_electives)]
+    takers = [[] for _ in range(num_electives)]
+    for mis, _ in students:
+        picked = set()
+        while len(picked) < ELECTIVES_PER_STUDENT: picked.update(rng.choices(range(num_electives), popularity, k=ELECTIVES_PER_STUDENT - len(picked)))
+        for k in picked: takers[k].append(mis)
+    for k, members in enumerate(takers):
+        division_size = rng.randint(20, 220)
+        for start in range(0, len(members), division_size):
+            subject, division = f"Elective {k + 1}", f"Division {start // division_size + 1}"
+            enrolled[(subject, division)] = members[start:start + division_size]
+            schedule(subject, division, rng.sample(all_slots, SESSIONS_PER_WEEK))
+
+    branch_of, names = dict(students), {mis: (rng.choice(SYNTHETIC_NAMES), rng.choice(SYNTHETIC_NAMES), rng.choice(SYNTHETIC_SURNAMES)) for mis, _ in students}
+    rows = sorted([mis, *names[mis], branch_of[mis], subject, division] for (subject, division), members in enrolled.items() for mis in members)
+    for name, header, table in ((app.STUDENTS_CSV_PATH, ['MIS', 'FirstName', 'MiddleName', 'LastName', 'Branch', 'Subject', 'Division'], rows),
+                                (app.TIMETABLE_CSV_PATH, ['Subject', 'Division', 'Day', 'Time', 'Room'], timetable),
+                                (app.ROOMS_CSV_PATH, ['Room', 'Capacity'], rooms)):
+        with open(os.path.join(out_dir, os.path.basename(name)), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(table)
+    return {'students': num_students, 'enrollments': len(rows), 'groups': len(enrolled), 'timetable_rows': len(timetable), 'rooms': len(rooms)}
+
+
+def run_generate(args):
+    summary = generate_dataset(args.out, args.enrollments, args.rooms, args.seed)
+    print(f"Wrote {args.out}: " + ', '.join(f"{count} {name}" for name, count in summary.items()))
+
+
+# ## --- PER-MODE LATENCY AND MEMORY (Flask test client) --- ##
+BENCH_MODES = ['check_availability', 'mode_2_batch_finder', 'mode_3_advanced_finder', 'mode_4_planner', 'mode_5_day_finder', 'bulk_schedule', 'download_list', 'heatmap', 'what_if']
+
+
+def _load_dataset(data_dir):
+    # Points the app at data_dir and builds its state from the CSVs (no snapshot: that one is for the real data)
+    for setting in ('STUDENTS_CSV_PATH', 'TIMETABLE_CSV_PATH', 'ROOMS_CSV_PATH'):
+        setattr(app, setting, os.path.join(data_dir, os.path.basename(getattr(app, setting))))
+    started = time.perf_counter()
+    app._install_state(app._build_state(*app._read_data_files()))
+    return time.perf_counter() - started
+
+
+def _request_mix(mode, count, batches, solver, rng):
+    """
+    `count` canned requests for one route, as (path, test-client kwargs): the largest group first (the one that times out),
+    then groups picked at random, with the filters a user would set in that mode's form.
+    """
+    by_size = sorted(app.group_members_map, key=lambda group: -len(app.group_members_map[group]))
+    groups = by_size[:1] + rng.sample(by_size[1:], min(count - 1, len(by_size) - 1))
+    slot_strings = [f"{day}|{time_str}" for day, time_str in app.all_possible_slots_NO_SATURDAY]
+    weekdays, times = app.ALL_DAYS_OPTIONS_NO_SATURDAY, [time_str for _, time_str in app.TIMES_OPTIONS_FORMATTED]
+
+    def time_window():
+        start = rng.randrange(len(times) - 2)
+        return {'time_start': times[start], 'time_end': times[rng.randrange(start + 2, len(times))]}
+
+    mix = []
+    for subject, division in groups:
+        num_batches = rng.choice(batches)
+        form = {'student_mode': 'by_group', 'subject': subject, 'division': division, 'num_batches': num_batches, 'solver': solver}
+        if mode == 'check_availability':
+            mis_numbers = ' '.join(app.STUDENT_MIS_LIST[i] for i in app.group_members_map[(subject, division)])
+            day, time_str = rng.choice(slot_strings).split('|')
+            # Alternates the single-slot form and the whole-week matrix
+            slots = {'slots': slot_strings} if len(mix) % 2 else {'day': day, 'time': time_str}
+            mix.append(('/check_availability', {'data': {'mis_numbers': mis_numbers, **slots}}))
+        elif mode == 'mode_2_batch_finder':
+            mix.append(('/mode_2_batch_finder', {'data': {**form, 'excluded_slots': rng.sample(slot_strings, rng.randint(0, 3))}}))
+        elif mode == 'mode_3_advanced_finder':
+            window = {f"m3_{name}": value for name, value in time_window().items()}
+            mix.append(('/mode_3_advanced_finder', {'data': {**form, 'm3_days': rng.sample(weekdays, rng.randint(2, len(weekdays))), **window}}))
+        elif mode == 'mode_4_planner':
+            for i in range(num_batches):
+                form[f"m4_batch_{i}_days"] = rng.sample(weekdays, rng.randint(1, len(weekdays)))
+                form.update({f"m4_batch_{i}_{name}": value for name, value in time_window().items()})
+            mix.append(('/mode_4_planner', {'data': form}))
+        elif mode == 'mode_5_day_finder':
+            mix.append(('/mode_5_day_finder', {'data': {**form, 'm5_day': rng.choice(weekdays)}}))
+        elif mode == 'bulk_schedule':
+            bulk_groups = [f"{subject}|{division}"] + [f"{s}|{d}" for s, d in rng.sample(by_size, min(9, len(by_size)))]
+            mix.append(('/bulk_schedule', {'json': {'groups': bulk_groups, 'num_batches': num_batches, 'solver': solver, 'exclusive_rooms': rng.random() < 0.5}}))
+        elif mode == 'download_list':
+            mix.append(('/download_list', {'json': {'subject': subject, 'division': division, 'format': rng.choice(app.EXPORT_FORMATS)}}))
+        elif mode == 'heatmap':
+            # Alternates a precomputed group row and the same students as an MIS list
+            mis_numbers = ' '.join(app.STUDENT_MIS_LIST[i] for i in app.group_members_map[(subject, division)])
+            mix.append(('/heatmap', {'data': {'mis_numbers': mis_numbers} if len(mix) % 2 else {'group': f"{subject}|{division}"}}))
+        elif mode == 'what_if':
+            # Moves one of the timetable's lectures to another slot
+            subject, division, day, time_str, room = app._timetable_row(rng.randrange(len(app.timetable_columns['room'])))
+            day_to, time_to = rng.choice(slot_strings).split('|')
+            edit = {'from': {'Subject': subject, 'Division': division, 'Day': day, 'Time': time_str, 'Room': room}, 'to': {'Day': day_to, 'Time': time_to}}
+            mix.append(('/what_if', {'json': {'edits': [edit], 'groups': [f"{subject}|{division}"]}}))
+    return mix
+
+
+def _is_partial(payload):
+    # A search cut off by SEARCH_DEADLINE_SECONDS marks its result (or a suggestion, or a bulk group) 'partial'
+    if isinstance(payload, dict): return payload.get('partial') is True or any(_is_partial(value) for value in payload.values())
+    if isinstance(payload, list): return any(_is_partial(value) for value in payload)
+    return False
+
+
+def _run_mix(client, mix, trace_memory):
+    latencies, peak, partial, failed, errors = [], 0, 0, 0, 0
+    for path, kwargs in mix:
+        if trace_memory:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        response = client.post(path, **kwargs)
+        body = response.get_data() # drains streamed exports too
+        latencies.append(time.perf_counter() - started)
+        if trace_memory: peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        errors += response.status_code >= 400
+        if response.is_json:
+            payload = json.loads(body)
+            partial += _is_partial(payload)
+            failed += str(payload.get('status', '')).startswith('failure') # no option for the requested batches (suggestions count too)
+    return latencies, peak, partial, failed, errors
+
+
+def _compare(results, baseline, tolerance):
+    # A mode regresses when its p95 latency or its peak memory grew by more than `tolerance` (and by more than noise)
+    regressions = []
+    print(f"\n{'mode':<24} {'p95 base s':>10} {'p95 now s':>10} {'change':>8} | {'peak base MB':>12} {'peak now MB':>11} {'change':>8}")
+    for mode, now in results.items():
+        base = baseline['modes'].get(mode)
+        if not base:
+            print(f"{mode:<24} (not in the baseline)")
+            continue
+        change = lambda field: (now[field] - base[field]) / base[field] if base[field] else 0.0
+        slower = now['p95'] > base['p95'] * (1 + tolerance) and now['p95'] - base['p95'] > 0.01
+        bigger = now['peak_mb'] is not None and base['peak_mb'] is not None and now['peak_mb'] > base['peak_mb'] * (1 + tolerance) and now['peak_mb'] - base['peak_mb'] > 1
+        flag = ' REGRESSION' if slower or bigger else ''
+        if flag: regressions.append(mode)
+        peak_cells = f"{base['peak_mb']:>12.1f} {now['peak_mb']:>11.1f} {change('peak_mb'):>+8.0%}" if now['peak_mb'] is not None and base['peak_mb'] is not None else f"{'-':>12} {'-':>11} {'-':>8}"
+        print(f"{mode:<24} {base['p95']:>10.3f} {now['p95']:>10.3f} {change('p95'):>+8.0%} | {peak_cells}{flag}")
+    return regressions
+
+
+def run_modes(args):
+    # Cold searches: no result cache, no data watcher, and the search budget of the run
+    app.result_cache = app.ResultCache('off', None, 0, 0)
+    app.DATA_WATCH_INTERVAL_SECONDS = 0
+    if args.deadline is not None: app.SEARCH_DEADLINE_SECONDS = args.deadline
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = args.data
+        if args.enrollments:
+            data_dir = scratch
+            print(f"Generated {args.enrollments} enrollments: {generate_dataset(data_dir, args.enrollments, args.rooms, args.seed)}")
+        if data_dir: print(f"Loaded {data_dir} in {_load_dataset(data_dir):.2f}s")
+    dataset = {'data_version': app.DATA_VERSION, 'students': len(app.STUDENT_MIS_LIST), 'enrollments': len(app.students_df_global),
+               'groups': len(app.group_members_map), 'rooms': len(app.room_capacity) or len(app.AVAILABLE_ROOMS), 'slots': len(app.all_possible_slots)}
+    print(f"Dataset: {dataset}")
+    client = app.app.test_client()
+    results = {}
+    print(f"\n{'mode':<24} {'n':>4} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'max s':>8} {'peak MB':>8} {'partial':>7} {'failed':>6} {'errors':>6}")
+    for mode in args.modes:
+        mix = _request_mix(mode, args.requests, args.batches, args.solver, random.Random(f"{args.seed}-{mode}"))
+        _run_mix(client, mix[:1], trace_memory=False) # warm-up: thread pools and lazily built lists are not what is measured
+        latencies, _, partial, failed, errors = _run_mix(client, mix, trace_memory=False)
+        peak_mb = None
+        if args.memory: # a second pass: tracemalloc slows the requests down too much to time them in the same one
+            tracemalloc.start()
+            peak_mb = _run_mix(client, mix, trace_memory=True)[1] / 2 ** 20
+            tracemalloc.stop()
+        p50, p95, p99 = (float(value) for value in np.percentile(latencies, [50, 95, 99]))
+        results[mode] = {'n': len(mix), 'p50': p50, 'p95': p95, 'p99': p99, 'max': max(latencies), 'peak_mb': peak_mb, 'partial': partial, 'failed': failed, 'errors': errors}
+        print(f"{mode:<24} {len(mix):>4} {p50:>8.3f} {p95:>8.3f} {p99:>8.3f} {max(latencies):>8.3f} {'-' if peak_mb is None else f'{peak_mb:.1f}':>8} {partial:>7} {failed:>6} {errors:>6}")
+
+    settings = {'requests': args.requests, 'batches': args.batches, 'solver': args.solver, 'seed': args.seed, 'deadline': app.SEARCH_DEADLINE_SECONDS}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f: json.dump({'dataset': dataset, 'settings': settings, 'modes': results}, f, indent=2)
+        print(f"\nSaved the baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)
+        if baseline['dataset'] != dataset or baseline['settings'] != settings:
+            print("\nWarning: the baseline was taken on other data or settings, so the comparison is only indicative")
+        regressions = _compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    solvers_parser = subparsers.add_parser('solvers', help='greedy vs exact flow solver on real CSV groups')
+    solvers_parser.add_argument('--groups', type=int, default=None, help='only the N largest groups')
+    solvers_parser.add_argument('--batches', type=int, nargs='+', default=[2, 3, 4, 5])
+    solvers_parser.set_defaults(func=run_solvers)
+    startup_parser = subparsers.add_parser('startup', help='import time and RSS of a worker, CSV vs snapshot')
+    startup_parser.add_argument('--runs', type=int, default=5)
+    startup_parser.set_defaults(func=run_startup)
+    workers_parser = subparsers.add_parser('workers', help='per-worker RSS/PSS under gunicorn, with and without preload')
+    workers_parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    workers_parser.add_argument('--requests', type=int, default=5, help='searches per worker before measuring')
+    workers_parser.add_argument('--port', type=int, default=8765)
+    workers_parser.set_defaults(func=run_workers)
+    generate_parser = subparsers.add_parser('generate', help='write synthetic students/timetable/rooms CSVs')
+    generate_parser.add_argument('--enrollments', type=int, default=50000, help='student rows (students1.csv has about 20k)')
+    generate_parser.add_argument('--rooms', type=int, default=0, help='0: scaled to the number of students')
+    generate_parser.add_argument('--seed', type=int, default=0)
+    generate_parser.add_argument('--out', default='bench_data')
+    generate_parser.set_defaults(func=run_generate)
+    modes_parser = subparsers.add_parser('modes', help='p50/p95/p99 latency and peak memory per route, through the Flask test client')
+    modes_source = modes_parser.add_mutually_exclusive_group()
+    modes_source.add_argument('--data', help='a directory written by `generate` (default: the real CSVs)')
+    modes_source.add_argument('--enrollments', type=int, help='generate this many enrollments into a temporary directory first')
+    modes_parser.add_argument('--rooms', type=int, default=0, help='rooms to generate (with --enrollments), 0: scaled')
+    modes_parser.add_argument('--seed', type=int, default=0)
+    modes_parser.add_argument('--modes', nargs='+', choices=BENCH_MODES, default=BENCH_MODES)
+    modes_parser.add_argument('--requests', type=int, default=20, help='requests per mode')
+    modes_parser.add_argument('--batches', type=int, nargs='+', default=[2, 3, 4])
+    modes_parser.add_argument('--solver', choices=app.SOLVER_OPTIONS, default=app.DEFAULT_SOLVER)
+    modes_parser.add_argument('--deadline', type=float, default=None, help='SEARCH_DEADLINE_SECONDS for the run')
+    modes_parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the tracemalloc pass')
+    modes_parser.add_argument('--save-baseline', metavar='FILE')
+    modes_parser.add_argument('--baseline', metavar='FILE', help='compare with a saved baseline; exits 1 on a regression')
+    modes_parser.add_argument('--tolerance', type=float, default=0.25, help='allowed growth of p95 latency and peak memory')
+    modes_parser.set_defaults(func=run_modes)
+    args = parser.parse_args()
+    args.func(args)
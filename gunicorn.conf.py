@@ -0,0 +1,31 @@
+"""
+Gunicorn settings, picked up by `gunicorn app:app` from the project directory.
+
+PRELOAD_DATA=1 (the default) imports app.py once in the master, so the data is loaded before the
+workers are forked and they share it copy-on-write instead of each parsing the CSVs into their own copy.
+A worker that hot-reloads the data (see reload_data_files) builds a private copy of the new data.
+Per-worker memory: python benchmark.py workers
+"""
+import gc
+import os
+
+timeout = 120
+preload_app = os.environ.get('PRELOAD_DATA', '1') == '1'
+
+if preload_app:
+    # The fork-without-exec recipe from the gc docs: no collections in the master (they would leave freed
+    # holes in the loaded data's pages), freeze right before forking (so collections in the workers never
+    # write to the GC headers of the shared objects), collections back on in each worker.
+    gc.disable()
+
+    def pre_fork(server, worker):
+        gc.freeze()
+
+    def post_fork(server, worker):
+        gc.enable()
+
+
+def post_worker_init(worker):
+    # The app is loaded and the worker has no threads yet: the one safe moment to fork its search processes
+    import app
+    app._start_search_pool()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# app.py loads students1.csv / timetable1.csv from the working directory when it is imported
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,13 @@
+import app
+
+
+def test_index_matches_reference_map_for_every_group():
+    for members in app.group_members_map.values():
+        target_mis_set = {app.STUDENT_MIS_LIST[i] for i in members}
+        assert app._check_availability_index(target_mis_set, app.all_possible_slots)
+
+
+def test_index_matches_reference_map_with_unknown_students():
+    members = next(iter(app.group_members_map.values()))
+    target_mis_set = {app.STUDENT_MIS_LIST[i] for i in members} | {'NOT-A-STUDENT'}
+    assert app._check_availability_index(target_mis_set, app.all_possible_slots)
@@ -0,0 +1,75 @@
+import app
+
+
+def members_of():
+    # (Subject, Division) -> set of MIS, straight from students1.csv
+    members = {}
+    for mis, subject, division in zip(*(app.students_df_global[column].astype(object) for column in ('MIS', 'Subject', 'Division'))):
+        members.setdefault((subject, division), set()).add(mis)
+    return members
+
+
+def reference_clashes(mis, slot, members):
+    # Positions in the slot's timetable rows of the classes this student has then
+    rows = [(subject, division) for subject, division, day, time_str in zip(*(app.timetable_clash_global[column].astype(object) for column in ('Subject', 'Division', 'Day', 'Time'))) if (day, time_str) == slot]
+    return [k for k, group in enumerate(rows) if mis in members.get(group, ())]
+
+
+def double_booked_slot():
+    # A slot where some student has two classes at once, and that student
+    row, clashes = next(iter(app.extra_clashes.items()))
+    return app.INDEX_SLOTS[row], app.STUDENT_MIS_LIST[next(iter(clashes))]
+
+
+def post(data):
+    return app.app.test_client().post('/check_availability', data=data)
+
+
+def test_matrix_over_many_slots():
+    members = members_of()
+    busy_slot, double_booked = double_booked_slot()
+    students = app.STUDENT_MIS_LIST[::151] + [double_booked]
+    # Duplicates are dropped; a slot no class uses leaves everyone free
+    slots = [busy_slot, app.INDEX_SLOTS[0], app.INDEX_SLOTS[-1], ('Monday', app.LUNCH_SLOT), ('Sunday', '08:30-09:30'), app.INDEX_SLOTS[0]]
+    body = post({'mis_numbers': '\n'.join(students + ['NOT-A-STUDENT']), 'slots': ['|'.join(slot) for slot in slots]}).get_json()
+    slots = slots[:-1]
+    assert [(s['day'], s['time']) for s in body['slots']] == slots
+    assert body['unknown_mis'] == ['NOT-A-STUDENT']
+    # Students in students1.csv order
+    assert [row['MIS'] for row in body['students']] == [app.STUDENT_MIS_LIST[i] for i in sorted(app.student_index_map[mis] for mis in set(students))]
+    for j, slot in enumerate(slots):
+        classes = [{'Subject': s, 'Division': d, 'Room': r} for s, d, r in app.slot_classes_map.get(slot, [])]
+        assert body['slots'][j]['classes'] == classes
+        assert body['slots'][j]['free_count'] == sum(not row['clashes'][j] for row in body['students'])
+        for row in body['students']:
+            assert sorted(row['clashes'][j]) == reference_clashes(row['MIS'], slot, members)
+    assert len(next(row for row in body['students'] if row['MIS'] == double_booked)['clashes'][0]) > 1
+    assert body['slots'][4]['classes'] == [] and body['slots'][4]['free_count'] == len(body['students'])
+
+
+def test_single_slot_lists_free_and_busy_students():
+    members = members_of()
+    slot, double_booked = double_booked_slot()
+    students = app.STUDENT_MIS_LIST[::97] + [double_booked, 'NOT-A-STUDENT']
+    body = post({'mis_numbers': ', '.join(students), 'day': slot[0], 'time': slot[1]}).get_json()
+    known = [app.student_records[app.STUDENT_MIS_LIST[i]] for i in sorted(app.student_index_map[mis] for mis in students if mis in app.student_index_map)]
+    classes = app.slot_classes_map[slot]
+    expected_free = [{key: record[key] for key in ('MIS', 'Name', 'Branch')} for record in known if not reference_clashes(record['MIS'], slot, members)]
+    expected_busy = [{'MIS': record['MIS'], 'Name': record['Name'], 'Branch': record['Branch'], 'Subject': subject, 'Division': division, 'Room': room}
+                     for subject, division, room in classes for record in known if record['MIS'] in members.get((subject, division), ())]
+    assert body['free_results'] == expected_free
+    assert body['busy_results'] == expected_busy
+    assert sum(row['MIS'] == double_booked for row in body['busy_results']) > 1
+
+
+def test_matrix_for_every_student_and_slot():
+    body = post({'mis_numbers': ' '.join(app.STUDENT_MIS_LIST), 'slots': ['|'.join(slot) for slot in app.INDEX_SLOTS]}).get_json()
+    assert len(body['students']) == len(app.STUDENT_MIS_LIST) and len(body['slots']) == len(app.INDEX_SLOTS)
+    assert [s['free_count'] for s in body['slots']] == app.slot_free_matrix.sum(axis=1).tolist()
+    assert [s['free_count'] for s in body['slots']] == [sum(not row['clashes'][j] for row in body['students']) for j in range(len(app.INDEX_SLOTS))]
+
+
+def test_missing_fields():
+    assert post({'mis_numbers': '612501003'}).status_code == 400
+    assert post({'mis_numbers': '612501003', 'slots': ['Monday']}).status_code == 400
+    assert post({'mis_numbers': ' ', 'day': 'Monday', 'time': '08:30-09:30'}).status_code == 400
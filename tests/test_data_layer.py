@@ -0,0 +1,118 @@
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def frames():
+    # Plain object columns, whether the data came from the CSVs or the categorical snapshot
+    return app.students_df_global.astype(object), app.timetable_clash_global.astype(object)
+
+
+def reference_busy_slots():
+    # MIS -> busy (Day, Time) slots, the way the original load built student_schedule_map with a merge
+    students, timetable = frames()
+    enrollments = pd.merge(students, timetable, on=['Subject', 'Division'], how='inner')
+    busy = {mis: set() for mis in students['MIS'].unique()}
+    for mis, day, time_str in zip(enrollments['MIS'], enrollments['Day'], enrollments['Time']):
+        busy[mis].add((day, time_str))
+    return busy
+
+
+def test_intern():
+    codes, table = app._intern(pd.Series(['b', 'a', 'b', 'c', 'a']))
+    assert codes.dtype == np.int32 and codes.tolist() == [0, 1, 0, 2, 1] and table == ['b', 'a', 'c']
+    codes = app._intern(pd.Series(['c', 'x', 'a', None]), ['a', 'b', 'c'])
+    assert codes.dtype == np.int32 and codes.tolist() == [2, -1, 0, -1]
+
+
+def test_columns_round_trip_to_the_frames():
+    students, timetable = frames()
+    assert [app.STUDENT_MIS_LIST[i] for i in app.enrollment_columns['student']] == students['MIS'].tolist()
+    assert [app.SUBJECT_TABLE[i] for i in app.enrollment_columns['subject']] == students['Subject'].tolist()
+    assert [app.DIVISION_TABLE[i] for i in app.enrollment_columns['division']] == students['Division'].tolist()
+    rows = [app._timetable_row(i) for i in range(len(timetable))]
+    assert rows == list(zip(*(timetable[column].tolist() for column in app.WHAT_IF_FIELDS)))
+    assert all(app.student_index_map[mis] == i for i, mis in enumerate(app.STUDENT_MIS_LIST))
+
+
+def test_group_members_match_pandas_filters():
+    students, _ = frames()
+    expected = {(subject, division): sorted(set(group['MIS'])) for (subject, division), group in students.groupby(['Subject', 'Division'])}
+    assert set(app.group_members_map) == set(expected)
+    for group, members in app.group_members_map.items():
+        assert np.all(np.diff(members) > 0)
+        assert sorted(app.STUDENT_MIS_LIST[i] for i in members) == expected[group]
+
+
+def test_student_records_are_the_first_row_per_student():
+    students, _ = frames()
+    first_rows = students.drop_duplicates(subset=['MIS']).to_dict('records')
+    assert len(app.student_records) == len(first_rows)
+    assert all(app.student_records[record['MIS']] == record for record in first_rows)
+
+
+def test_slot_classes_follow_timetable_order():
+    _, timetable = frames()
+    expected = {}
+    for subject, division, day, time_str, room in zip(*(timetable[column] for column in app.WHAT_IF_FIELDS)):
+        expected.setdefault((day, time_str), []).append((subject, division, room))
+    assert app.slot_classes_map == expected
+    assert set(app.INDEX_SLOTS) == set(expected) and list(app.slot_index_map) == app.INDEX_SLOTS
+
+
+def test_get_student_records():
+    students, _ = frames()
+    picked = [app.STUDENT_MIS_LIST[i] for i in (40, 3, 17, 3)] + ['NOT-A-STUDENT']
+    expected = students[students['MIS'].isin(picked)].drop_duplicates(subset=['MIS']).to_dict('records')
+    # Known students only, once each, in students1.csv order
+    assert app._get_student_records(picked) == expected
+    assert app._get_student_records(['NOT-A-STUDENT']) == [] and app._get_student_records([]) == []
+
+
+def test_get_target_students():
+    students, _ = frames()
+    for subject, division in app.GROUP_KEYS[:20]:
+        expected = set(students[(students['Subject'] == subject) & (students['Division'] == division)]['MIS'])
+        assert app._get_target_students({'student_mode': 'by_group', 'subject': subject, 'division': division}) == expected
+    assert app._get_target_students({'student_mode': 'by_group', 'subject': 'No such subject', 'division': 'Division 1'}) == set()
+    assert app._get_target_students({'student_mode': 'by_mis', 'mis_numbers': ' 1, 2\n3  2 '}) == {'1', '2', '3'}
+    assert app._get_target_students({'student_mode': 'by_mis', 'mis_numbers': '  '}) == set()
+
+
+def test_schedule_view_matches_the_merge():
+    busy = reference_busy_slots()
+    assert len(app.student_schedule_map) == len(busy)
+    assert all(app.student_schedule_map[mis] == slots for mis, slots in busy.items())
+
+
+def test_availability_index_matches_the_merge():
+    busy = reference_busy_slots()
+    target_mis_set = set(app.STUDENT_MIS_LIST[::97]) | {'NOT-A-STUDENT'}
+    target_order = sorted(target_mis_set)
+    availability_map = app._get_student_availability_index(target_mis_set, app.all_possible_slots)
+    for slot in app.all_possible_slots:
+        free = {mis for mis in target_mis_set if slot not in busy.get(mis, set())}
+        if not free or not app.room_occupancy[slot]:
+            assert slot not in availability_map
+            continue
+        entry = availability_map[slot]
+        assert entry['free_students'] == free and entry['free_count'] == len(free)
+        assert entry['free_mask'] == sum(1 << j for j, mis in enumerate(target_order) if mis in free)
+        assert entry['available_rooms'] == app.room_occupancy[slot]
+    # Masks derived from the sets of the reference map agree with the index's own
+    slot_keys = list(availability_map)
+    reference = app._get_student_availability_map(target_mis_set, app.all_possible_slots)
+    assert app._get_slot_masks(target_order, reference, slot_keys) == app._get_slot_masks(target_order, availability_map, slot_keys)
+
+
+def test_download_list_by_group_matches_pandas():
+    students, _ = frames()
+    subject, division = app.GROUP_KEYS[3]
+    expected = students[(students['Subject'] == subject) & (students['Division'] == division)].drop_duplicates(subset=['MIS']).sort_values('MIS')
+    response = app.app.test_client().post('/download_list', json={'subject': subject, 'division': division, 'format': 'csv'})
+    rows = list(csv.reader(io.StringIO(response.data.decode('utf-8-sig'))))
+    assert rows[1:] == expected[['MIS', 'Name', 'Branch']].values.tolist()
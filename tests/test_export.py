@@ -0,0 +1,104 @@
+import csv
+import io
+import zipfile
+
+import openpyxl
+import pytest
+
+import app
+
+
+def group_students(n=0):
+    subject, division = app.GROUP_KEYS[n]
+    return subject, division, sorted(app.STUDENT_MIS_LIST[i] for i in app.group_members_map[(subject, division)])
+
+
+def read_csv(data):
+    return list(csv.reader(io.StringIO(data.decode('utf-8-sig'))))
+
+
+def test_batch_labels():
+    assert [app._batch_label(i) for i in (0, 1, 25, 26, 27, 51, 52, 701, 702)] == ['A', 'B', 'Z', 'AA', 'AB', 'AZ', 'BA', 'ZZ', 'AAA']
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2], 'batches', 5,
+    {'batches': [1]}, {'batches': 'x'}, {'batches': {'day': 'Monday'}},
+    {'batches': [{'day': 'Monday', 'mis_list': 'abc'}]},
+    {'batches': [{'day': 'Monday', 'mis_list': [1, 2]}]},
+    {'batches': [{'day': ['Monday'], 'mis_list': []}]},
+    {'batches': [{'day': 'Monday', 'room': 5, 'mis_list': []}]},
+])
+def test_download_solution_rejects_malformed_bodies(body):
+    response = app.app.test_client().post('/download_solution', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'x', {'mis_list': 'abc'}, {'mis_list': [1]}])
+def test_download_list_rejects_malformed_bodies(body):
+    response = app.app.test_client().post('/download_list', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_download_solution_xlsx_has_a_sheet_per_batch():
+    _, _, students = group_students()
+    # 28 batches: the labels go on past 'Z' to 'AA' and 'AB'
+    batches = [{'day': 'Monday', 'time': '08:30-09:30', 'room': 'NC01', 'mis_list': [students[i % len(students)]]} for i in range(28)]
+    batches[0]['mis_list'] = students[:3] + ['no-such-student']
+    response = app.app.test_client().post('/download_solution', json={'batches': batches})
+    assert response.status_code == 200 and response.mimetype == app.XLSX_MIMETYPE
+    workbook = openpyxl.load_workbook(io.BytesIO(response.data))
+    assert workbook.sheetnames[:2] == ['Batch A - Monday', 'Batch B - Monday']
+    assert workbook.sheetnames[-2:] == ['Batch AA - Monday', 'Batch AB - Monday']
+    rows = list(workbook['Batch A - Monday'].values)
+    assert list(rows[0]) == app.SOLUTION_EXPORT_HEADERS
+    assert [row[4] for row in rows[1:]] == students[:3]
+    assert {row[0] for row in rows[1:]} == {'A'} and rows[1][3] == 'NC01'
+    assert list(workbook['Batch AB - Monday'].values)[1][0] == 'AB'
+
+
+def test_download_solution_csv_is_a_zip_of_batches():
+    _, _, students = group_students()
+    batches = [{'day': 'Monday', 'time': '08:30-09:30', 'mis_list': students[:2]}, {'day': 'Tuesday', 'time': '09:30-10:30', 'mis_list': students[2:5]}]
+    response = app.app.test_client().post('/download_solution', json={'batches': batches, 'format': 'csv'})
+    assert response.mimetype == 'application/zip'
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert archive.namelist() == ['Batch A - Monday.csv', 'Batch B - Tuesday.csv']
+    rows = read_csv(archive.read('Batch B - Tuesday.csv'))
+    assert rows[0] == app.SOLUTION_EXPORT_HEADERS
+    assert [row[4] for row in rows[1:]] == students[2:5] and rows[1][:4] == ['B', 'Tuesday', '09:30-10:30', '']
+
+
+def test_download_list_csv_streams_in_chunks(monkeypatch):
+    monkeypatch.setattr(app, 'EXPORT_CHUNK_ROWS', 2)
+    subject, division, students = group_students()
+    response = app.app.test_client().post('/download_list', json={'subject': subject, 'division': division, 'format': 'csv'})
+    assert response.mimetype == 'text/csv'
+    chunks = list(response.response)
+    assert len(chunks) > 1
+    rows = read_csv(b''.join(chunks))
+    assert rows[0] == ['MIS', 'Name', 'Branch'] and [row[0] for row in rows[1:]] == students
+
+
+def test_bulk_schedule_exports():
+    groups = [list(app.GROUP_KEYS[0]), list(app.GROUP_KEYS[1])]
+    client = app.app.test_client()
+    plans = client.post('/bulk_schedule', json={'groups': groups, 'num_batches': 2}).get_json()['groups']
+    sheet_names = app._sheet_names(['Summary'] + [f"{subject} {division}" for subject, division in groups])
+
+    workbook = openpyxl.load_workbook(io.BytesIO(client.post('/bulk_schedule', json={'groups': groups, 'num_batches': 2, 'format': 'xlsx'}).data))
+    assert workbook.sheetnames == sheet_names
+    summary = list(workbook['Summary'].values)
+    assert list(summary[0]) == ['Subject', 'Division', 'Students', 'Status', 'Sessions']
+    assert [(row[0], row[1], row[2], row[3]) for row in summary[1:]] == [(plan['subject'], plan['division'], plan['num_students'], plan['status']) for plan in plans]
+    for name, plan in zip(sheet_names[1:], plans):
+        rows = list(workbook[name].values)[1:]
+        expected = [(app._batch_label(i), batch['day'], student['MIS']) for i, batch in enumerate(plan['batches']) for student in batch['students']]
+        assert [(row[0], row[1], row[4]) for row in rows] == expected
+
+    response = client.post('/bulk_schedule?format=csv', json={'groups': groups, 'num_batches': 2})
+    archive = zipfile.ZipFile(io.BytesIO(response.data))
+    assert archive.namelist() == [f'{name}.csv' for name in sheet_names]
+    assert len(read_csv(archive.read(f'{sheet_names[1]}.csv'))) == 1 + plans[0]['num_students']
@@ -0,0 +1,162 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+import app
+
+
+def members_of():
+    # (Subject, Division) -> set of MIS, straight from students1.csv
+    members = {}
+    for mis, subject, division in zip(*(app.students_df_global[column].astype(object) for column in ('MIS', 'Subject', 'Division'))):
+        members.setdefault((subject, division), set()).add(mis)
+    return members
+
+
+def busy_by_slot(members):
+    # (Day, Time) -> MIS of everyone with a class then, from the timetable rows
+    busy = {}
+    for subject, division, day, time_str in zip(*(app.timetable_clash_global[column].astype(object) for column in ('Subject', 'Division', 'Day', 'Time'))):
+        busy.setdefault((day, time_str), set()).update(members.get((subject, division), ()))
+    return busy
+
+
+def reference_counts(students, busy):
+    return [len(students - busy.get(slot, set())) for slot in app.INDEX_SLOTS]
+
+
+def test_group_matrix_matches_the_timetable():
+    members = members_of()
+    busy = busy_by_slot(members)
+    assert app.group_slot_free_counts.shape == (len(app.GROUP_KEYS), len(app.INDEX_SLOTS))
+    for group, row in app.group_row_map.items():
+        assert app.group_slot_free_counts[row].tolist() == reference_counts(members[group], busy)
+
+
+def test_heatmap_of_every_group():
+    body = app.app.test_client().get('/heatmap').get_json()
+    assert body['slots'] == [{'day': day, 'time': time_str, 'schedulable': time_str != app.LUNCH_SLOT} for day, time_str in app.INDEX_SLOTS]
+    assert [(row['subject'], row['division']) for row in body['rows']] == app.GROUP_KEYS
+    assert [row['free_counts'] for row in body['rows']] == app.group_slot_free_counts.tolist()
+    assert [row['size'] for row in body['rows']] == [len(app.group_members_map[group]) for group in app.GROUP_KEYS]
+    assert body['unknown_groups'] == []
+
+
+def test_heatmap_of_chosen_groups():
+    client = app.app.test_client()
+    first, second = app.GROUP_KEYS[0], app.GROUP_KEYS[5]
+    # Repeats are dropped, unknown groups are named
+    body = client.get('/heatmap', query_string={'group': ['|'.join(second), '|'.join(first), '|'.join(second), 'Nothing|Division 9']}).get_json()
+    assert [(row['subject'], row['division']) for row in body['rows']] == [second, first]
+    assert body['rows'][0]['free_counts'] == app.group_slot_free_counts[app.group_row_map[second]].tolist()
+    assert body['unknown_groups'] == ['Nothing|Division 9']
+    # A subject alone picks all of its divisions; with a division, just that one (also as a POST form)
+    subject = first[0]
+    body = client.get('/heatmap', query_string={'subject': subject}).get_json()
+    assert [(row['subject'], row['division']) for row in body['rows']] == [group for group in app.GROUP_KEYS if group[0] == subject]
+    body = client.post('/heatmap', data={'subject': subject, 'division': first[1]}).get_json()
+    assert [(row['subject'], row['division']) for row in body['rows']] == [first]
+    assert client.get('/heatmap', query_string={'subject': 'Nothing'}).status_code == 400
+    assert client.get('/heatmap', query_string={'group': 'Nothing|Division 9'}).status_code == 400
+
+
+def test_heatmap_of_a_student_list():
+    members = members_of()
+    busy = busy_by_slot(members)
+    students = set(app.STUDENT_MIS_LIST[::37])
+    body = app.app.test_client().post('/heatmap', data={'mis_numbers': ' '.join(sorted(students) + ['NOT-A-STUDENT'])}).get_json()
+    assert body['rows'] == [{'size': len(students), 'free_counts': reference_counts(students, busy)}]
+    assert body['unknown_mis'] == ['NOT-A-STUDENT']
+
+
+def test_slot_free_counts_use_the_group_row_only_for_a_whole_group():
+    group = app.GROUP_KEYS[2]
+    students = {app.STUDENT_MIS_LIST[i] for i in app.group_members_map[group]}
+    assert app._group_row(students) == app.group_row_map[group]
+    assert app._group_row(students - {min(students)}) is None
+    assert app._group_row(students | {'NOT-A-STUDENT'}) is None
+    assert app._group_row(set()) is None
+    for target_mis_set in (students, students - {min(students)}, students | {'NOT-A-STUDENT'}):
+        availability_map = app._get_student_availability_index(target_mis_set, app.all_possible_slots)
+        slot_keys = list(availability_map)
+        counts = app._slot_free_counts(target_mis_set, slot_keys, availability_map)
+        assert counts.tolist() == [availability_map[slot]['free_count'] for slot in slot_keys]
+
+
+def test_rank_slots_is_stable():
+    slots, counts = app._rank_slots(list('abcde'), np.array([2, 5, 2, 7, 5]))
+    assert slots == list('dbeac') and counts.tolist() == [7, 5, 5, 2, 2]
+
+
+def test_prune_slots_keeps_exactly_the_usable_slots():
+    rng = random.Random(20)
+    for _ in range(2000):
+        num_slots, num_batches, num_students = rng.randint(0, 7), rng.randint(1, 4), rng.randint(1, 30)
+        slot_keys = [f's{i}' for i in range(num_slots)]
+        counts = np.array([rng.randint(0, 12) for _ in slot_keys], dtype=np.int64)
+        kept = app._prune_slots(slot_keys, counts, num_students, num_batches)
+        if num_slots < num_batches:
+            assert kept == slot_keys
+            continue
+        usable = set()
+        for combo in itertools.combinations(range(num_slots), num_batches):
+            if counts[list(combo)].sum() >= num_students: usable.update(combo)
+        assert kept == [slot for i, slot in enumerate(slot_keys) if i in usable]
+
+
+def test_prune_slot_pools_keeps_exactly_the_usable_slots():
+    rng = random.Random(21)
+    for _ in range(2000):
+        # Never an empty pool: _rank_batch_plan stops before pruning when a batch has no usable slot
+        pools = [[f'p{p}s{i}' for i in range(rng.randint(1, 4))] for p in range(rng.randint(1, 3))]
+        pool_counts = [np.array([rng.randint(0, 12) for _ in pool], dtype=np.int64) for pool in pools]
+        num_students = rng.randint(1, 30)
+        usable = set()
+        for choice in itertools.product(*(range(len(pool)) for pool in pools)):
+            if sum(int(counts[i]) for counts, i in zip(pool_counts, choice)) >= num_students:
+                usable.update(pool[i] for pool, i in zip(pools, choice))
+        assert app._prune_slot_pools(pools, pool_counts, num_students) == [[slot for slot in pool if slot in usable] for pool in pools]
+
+
+@pytest.mark.parametrize('solver', app.SOLVER_OPTIONS)
+def test_pruning_leaves_the_ranked_options_unchanged(solver, monkeypatch):
+    # Each group's few best slots and its worst ones: the bound drops some of the latter, not all
+    cases = []
+    for group in app.GROUP_KEYS[8:16:2] + [max(app.GROUP_KEYS, key=lambda group: len(app.group_members_map[group]))]:
+        target = {app.STUDENT_MIS_LIST[i] for i in app.group_members_map[group]}
+        counts = dict(zip(app.all_possible_slots_NO_SATURDAY, app._slot_free_counts(target, app.all_possible_slots_NO_SATURDAY, None).tolist()))
+        ranked = sorted(counts, key=counts.get, reverse=True)
+        pool = [slot for slot in app.all_possible_slots_NO_SATURDAY if slot in ranked[:4] + ranked[-10:]]
+        cases += [(target, pool, num_batches) for num_batches in (1, 2, 3)]
+    prune_slots, prune_slot_pools = app._prune_slots, app._prune_slot_pools
+    dropped = []
+
+    def counting_prune_slots(slot_keys, *args):
+        kept = prune_slots(slot_keys, *args)
+        dropped.append(len(kept) and len(slot_keys) - len(kept))
+        return kept
+
+    def counting_prune_slot_pools(slot_pools, *args):
+        kept = prune_slot_pools(slot_pools, *args)
+        dropped.append(all(kept) and sum(map(len, slot_pools)) - sum(map(len, kept)))
+        return kept
+
+    def search():
+        monkeypatch.setattr(app, 'result_cache', app.ResultCache('memory', None, 64, 60))
+        found = []
+        with app.app.test_request_context():
+            for target, pool, num_batches in cases:
+                plan, error = app._rank_batch_plan(target, [pool[i::num_batches] for i in range(num_batches)], solver)
+                found.append((app._rank_for_pool(target, pool, num_batches, solver)['ranked'], error or plan['ranked']))
+        return found
+
+    monkeypatch.setattr(app, '_prune_slots', counting_prune_slots)
+    monkeypatch.setattr(app, '_prune_slot_pools', counting_prune_slot_pools)
+    pruned = search()
+    # Some searches ran on a pool the bound made smaller without emptying it, and found options
+    assert any(dropped) and any(ranked for pair in pruned for ranked in pair if isinstance(ranked, list))
+    monkeypatch.setattr(app, '_prune_slots', lambda slot_keys, *args: list(slot_keys))
+    monkeypatch.setattr(app, '_prune_slot_pools', lambda slot_pools, *args: [list(pool) for pool in slot_pools])
+    assert search() == pruned
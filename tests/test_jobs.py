@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    # A job store of its own, one job thread, and searches that are not cache hits
+    monkeypatch.setattr(app, 'job_store', app.JobStore(str(tmp_path / 'jobs.sqlite3'), 60))
+    monkeypatch.setattr(app, 'job_executor', ThreadPoolExecutor(max_workers=1, thread_name_prefix='jobs'))
+    monkeypatch.setattr(app, 'result_cache', app.ResultCache('memory', None, 8, 60))
+    monkeypatch.setattr(app, 'JOB_POLL_SECONDS', 0.02)
+    yield app.app.test_client()
+    app.job_executor.shutdown(wait=True)
+
+
+@pytest.fixture
+def held_search(monkeypatch):
+    # Searches that run until they are released or their deadline passes (a job's does when it is cancelled)
+    started, release = threading.Event(), threading.Event()
+    def search(target_order, slot_keys, slot_masks, num_batches, solver, top_n=None, deadline=None, *rest, **kwargs):
+        started.set()
+        while not release.is_set() and not app._deadline_passed(deadline): time.sleep(0.005)
+        return [], app._deadline_passed(deadline)
+    monkeypatch.setattr(app, '_search_slot_combinations', search)
+    yield started, release
+    release.set()
+
+
+def group_form(n=0, num_batches=2):
+    subject, division = app.GROUP_KEYS[n]
+    return {'student_mode': 'by_group', 'subject': subject, 'division': division, 'num_batches': str(num_batches)}
+
+
+def wait_for(client, job_id, statuses=('done', 'failed', 'cancelled')):
+    for _ in range(3000):
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] in statuses: return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} is still {job["status"]}')
+
+
+def test_job_returns_the_routes_response(jobs):
+    form = group_form()
+    response = jobs.post('/mode_2_batch_finder?async=1', data=form)
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body['status_url'] == f"/jobs/{body['job_id']}" and not body['deduplicated']
+    job = wait_for(jobs, body['job_id'])
+    assert job['status'] == 'done' and job['endpoint'] == 'mode_2_batch_finder'
+    assert job['started_at'] >= job['created_at'] and job['finished_at'] >= job['started_at']
+    assert job['progress']['combinations_evaluated'] > 0
+    expected = jobs.post('/mode_2_batch_finder', data=form).get_json()
+    assert job['result']['http_status'] == 200
+    assert job['result']['status'] == expected['status'] and job['result']['solutions'] == expected['solutions']
+    assert body['job_id'] not in app.running_jobs
+
+
+def test_job_reports_the_routes_errors(jobs):
+    body = jobs.post('/mode_2_batch_finder', data={**group_form(), 'async': '1', 'num_batches': '0'}).get_json()
+    job = wait_for(jobs, body['job_id'])
+    assert job['status'] == 'done' and job['result']['http_status'] == 400 and 'error' in job['result']
+
+
+def test_unknown_job(jobs):
+    assert jobs.get('/jobs/no-such-job').status_code == 404
+    assert jobs.delete('/jobs/no-such-job').status_code == 404
+
+
+def test_identical_requests_share_a_queued_job_until_it_is_cancelled(jobs):
+    busy = threading.Event()
+    app.job_executor.submit(busy.wait) # keeps the one job thread busy, so the jobs below stay queued
+    try:
+        first = jobs.post('/mode_2_batch_finder?async=1', data=group_form()).get_json()
+        again = jobs.post('/mode_2_batch_finder?async=1', data=group_form()).get_json()
+        other = jobs.post('/mode_2_batch_finder?async=1', data=group_form(num_batches=3)).get_json()
+        assert first['status'] == 'queued' and again == {**first, 'deduplicated': True}
+        assert other['job_id'] != first['job_id'] and not other['deduplicated']
+        # A queued job is cancelled at once, and the next identical request gets a job of its own
+        assert jobs.delete(f"/jobs/{first['job_id']}").get_json()['status'] == 'cancelled'
+        third = jobs.post('/mode_2_batch_finder?async=1', data=group_form()).get_json()
+        assert third['job_id'] != first['job_id'] and not third['deduplicated']
+    finally: busy.set()
+    assert wait_for(jobs, other['job_id'])['status'] == 'done'
+    assert wait_for(jobs, third['job_id'])['status'] == 'done'
+    cancelled = wait_for(jobs, first['job_id'])
+    assert cancelled['status'] == 'cancelled' and cancelled['started_at'] is None and cancelled['result'] is None
+
+
+def test_running_job_stops_when_another_worker_cancels_it(jobs, held_search, monkeypatch):
+    started, _ = held_search
+    monkeypatch.setattr(app, 'job_watcher_pid', None) # a watcher that polls at this test's JOB_POLL_SECONDS
+    job_id = jobs.post('/mode_2_batch_finder?async=1', data=group_form()).get_json()['job_id']
+    assert started.wait(10)
+    assert jobs.get(f'/jobs/{job_id}').get_json()['status'] == 'running'
+    # Through the shared store only, the way a DELETE answered by another worker arrives
+    assert app.job_store.cancel(job_id)['status'] == 'cancelling'
+    job = wait_for(jobs, job_id)
+    assert job['status'] == 'cancelled' and job['result']['http_status'] == 200
+    assert not app.cancelled_deadlines and job_id not in app.running_jobs
+
+
+def test_reload_while_a_job_runs_fails_it(jobs, held_search, monkeypatch):
+    started, release = held_search
+    monkeypatch.setattr(app, 'data_state', app.data_state)
+    job_id = jobs.post('/mode_2_batch_finder?async=1', data=group_form()).get_json()['job_id']
+    assert started.wait(10)
+    # Swaps in a new state without waiting for the job (it does not pin the data)
+    swap = threading.Thread(target=app._install_state, args=(dict(app.data_state),))
+    swap.start()
+    swap.join(5)
+    assert not swap.is_alive()
+    release.set()
+    job = wait_for(jobs, job_id)
+    assert job['status'] == 'failed' and job['result']['http_status'] == 409
+
+
+def test_one_job_watcher_per_process(monkeypatch):
+    started = []
+    monkeypatch.setattr(app, '_watch_jobs', lambda: started.append(threading.current_thread().name))
+    monkeypatch.setattr(app, 'job_watcher_pid', None)
+    # As when the request starting it holds the data while a reload waits for it: must not wait on either
+    app.data_lock.acquire_read()
+    app.reload_lock.acquire()
+    try:
+        callers = [threading.Thread(target=app._start_job_watcher) for _ in range(8)]
+        for caller in callers: caller.start()
+        for caller in callers: caller.join(5)
+        assert not any(caller.is_alive() for caller in callers)
+    finally:
+        app.reload_lock.release()
+        app.data_lock.release_read()
+    for _ in range(500):
+        if started: break
+        time.sleep(0.01)
+    assert started == ['job-watcher'] and app.job_watcher_pid == os.getpid()
+    # A forked worker inherits the parent's pid in job_watcher_pid, and starts a watcher of its own
+    monkeypatch.setattr(app, 'job_watcher_pid', os.getppid())
+    app._start_job_watcher()
+    for _ in range(500):
+        if len(started) == 2: break
+        time.sleep(0.01)
+    assert len(started) == 2
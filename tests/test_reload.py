@@ -0,0 +1,20 @@
+import shutil
+
+import app
+
+
+def test_reload_matches_full_load(tmp_path, monkeypatch):
+    for setting in ('STUDENTS_CSV_PATH', 'TIMETABLE_CSV_PATH'):
+        shutil.copy(getattr(app, setting), tmp_path)
+        monkeypatch.setattr(app, setting, str(tmp_path / getattr(app, setting)))
+    try:
+        app.reload_data_files(force=True)
+        # A class that only partly overlaps the 09:30-10:30 slot still takes the room for it
+        with open(app.TIMETABLE_CSV_PATH, 'a') as f: f.write('MAC,Division 1,Monday,09:00-10:00,NC14\n')
+        summary = app.reload_data_files()
+        assert summary['status'] == 'reloaded' and summary['data_version'] == app.DATA_VERSION
+        assert 'NC14' not in app.room_occupancy[('Monday', '09:30-10:30')]
+        assert app.room_occupancy == app._build_state(*app._read_data_files())['room_occupancy']
+    finally:
+        monkeypatch.undo()
+        app.reload_data_files(force=True)
@@ -0,0 +1,52 @@
+import app
+
+
+def group_form(group, num_batches):
+    return {'student_mode': 'by_group', 'subject': group[0], 'division': group[1], 'num_batches': str(num_batches)}
+
+
+def largest_group_students():
+    largest = max(app.group_members_map, key=lambda group: len(app.group_members_map[group]))
+    return largest, {app.STUDENT_MIS_LIST[i] for i in app.group_members_map[largest]}
+
+
+def test_a_search_keeps_one_page_by_default():
+    largest, _ = largest_group_students()
+    first = app.app.test_client().post('/mode_2_batch_finder', data=group_form(largest, 2)).get_json()
+    assert first['total_solutions'] == len(first['solutions']) <= app.MAX_RANKED_SOLUTIONS == app.TOP_N_SOLUTIONS_TO_SHOW
+    assert 'result_token' not in first
+
+
+def test_pages_come_back_from_the_shared_store():
+    client = app.app.test_client()
+    _, target_mis_set = largest_group_students()
+    # A deployment that raised MAX_RANKED_SOLUTIONS: more options than one page, so a paging handle
+    with app.app.test_request_context():
+        result = app._rank_for_pool(target_mis_set, app.all_possible_slots_NO_SATURDAY, 2, top_n=3 * app.TOP_N_SOLUTIONS_TO_SHOW)
+        first = app._solutions_payload(result)
+    token = first['result_token']
+
+    # A fresh store on the same file stands in for another worker
+    other_worker = app.ResultHandleStore(app.RESULT_HANDLE_DB_PATH, app.MAX_RESULT_HANDLES, app.RESULT_HANDLE_TTL_SECONDS)
+    data_version, stored = other_worker.get(token)
+    assert data_version == app.DATA_VERSION
+    assert app._materialize_results(stored, 0, app.TOP_N_SOLUTIONS_TO_SHOW) == first['solutions']
+
+    page = client.get(f'/solutions/{token}?page=2').get_json()
+    assert page['solutions'] == app._materialize_results(stored, app.TOP_N_SOLUTIONS_TO_SHOW, 2 * app.TOP_N_SOLUTIONS_TO_SHOW)
+    assert page['total_solutions'] == len(result['ranked']) and page['has_more'] == (len(result['ranked']) > 2 * app.TOP_N_SOLUTIONS_TO_SHOW)
+
+
+def test_unknown_token_has_expired():
+    response = app.app.test_client().get('/solutions/not-a-token?page=2')
+    assert response.status_code == 404
+
+
+def test_sqlite_cache_stores_json(tmp_path):
+    _, target_mis_set = largest_group_students()
+    result = app._rank_balanced_combinations(target_mis_set, 2, app._get_student_availability_index(target_mis_set, app.all_possible_slots))
+    cache = app.ResultCache('sqlite', str(tmp_path / 'cache.sqlite3'), 8, 60)
+    cache.set('key', result)
+    assert cache.get('key') == result
+    stored = cache._db().execute('SELECT value FROM lean_results').fetchone()[0]
+    assert isinstance(stored, str) and app._lean_result_from_json(stored) == result
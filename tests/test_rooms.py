@@ -0,0 +1,144 @@
+import itertools
+import random
+
+import pytest
+
+import app
+from test_solvers import covering_masks, union_of
+
+
+def exhaustive_capped_sum_of_squares(num_students, combo_masks, capacities):
+    # Smallest sum of squared batch sizes over every seating that keeps each batch within its capacity, or None
+    options = [[i for i, mask in enumerate(combo_masks) if mask >> j & 1] for j in range(num_students)]
+    best = None
+    for choice in itertools.product(*options):
+        sizes = [choice.count(i) for i in range(len(combo_masks))]
+        if any(capacity is not None and size > capacity for size, capacity in zip(sizes, capacities)): continue
+        score = sum(size ** 2 for size in sizes)
+        best = score if best is None else min(best, score)
+    return best
+
+
+@pytest.fixture
+def rooms(monkeypatch):
+    # Three sized rooms and one of unknown size
+    capacities = {'R10': 10, 'R20': 20, 'R40': 40, 'HALL': None}
+    monkeypatch.setattr(app, 'room_capacity', capacities)
+    return capacities
+
+
+def test_capped_flow_split_is_minimal():
+    rng = random.Random(5)
+    for _ in range(400):
+        num_students, num_batches = rng.randint(1, 8), rng.randint(1, 4)
+        masks = covering_masks(rng, num_students, num_batches)
+        capacities = [rng.choice([None, 0, 1, 2, 3, 4]) for _ in range(num_batches)]
+        expected = exhaustive_capped_sum_of_squares(num_students, masks, capacities)
+        pattern_groups = app._split_by_pattern(masks, (1 << num_students) - 1)
+        split = app._balanced_flow_split(pattern_groups, num_batches, capacities)
+        if expected is None:
+            assert split is None
+            continue
+        alloc, sizes = split
+        for pattern, counts in alloc.items():
+            assert sum(counts) == pattern_groups[pattern].bit_count()
+            assert all(pattern >> i & 1 for i, count in enumerate(counts) if count)
+        assert all(capacity is None or size <= capacity for size, capacity in zip(sizes, capacities))
+        assert sum(size ** 2 for size in sizes) == expected
+        for solver in app.SOLVER_OPTIONS:
+            assert (app._score_combination(num_students, masks, solver, capacities) is None) == (expected is None)
+        assert app._score_combination(num_students, masks, 'flow', capacities) == expected
+
+
+@pytest.mark.parametrize('solver', app.SOLVER_OPTIONS)
+def test_small_room_gets_a_smaller_batch(solver):
+    everyone = (1 << 10) - 1
+    assert app._score_combination(10, [everyone, everyone], solver, [3, 100]) == 3 ** 2 + 7 ** 2
+    assert app._score_combination(10, [everyone, everyone], solver, [3, 6]) is None
+    batches = app._assign_combination([str(j) for j in range(10)], [everyone, everyone], solver, [3, 100])
+    assert sorted(map(len, batches)) == [3, 7] and len(batches[0]) == 3
+
+
+@pytest.mark.parametrize('solver', app.SOLVER_OPTIONS)
+def test_combination_search_splits_within_capacity(solver):
+    rng = random.Random(6)
+    for _ in range(200):
+        num_students, num_batches = rng.randint(1, 8), rng.randint(1, 3)
+        slots = [(f"D{i % 3}", f"T{i}") for i in range(rng.randint(num_batches, 6))]
+        masks = {slot: rng.getrandbits(num_students) for slot in slots}
+        slot_capacities = {slot: rng.choice([None, 1, 2, 3, 5]) for slot in slots}
+        ranked = []
+        for combo in itertools.combinations(slots, num_batches):
+            combo_masks = [masks[slot] for slot in combo]
+            if union_of(combo_masks) != (1 << num_students) - 1: continue
+            capacities = [slot_capacities[slot] for slot in combo]
+            score = app._score_combination(num_students, combo_masks, solver, capacities)
+            if solver == 'flow': assert score == exhaustive_capped_sum_of_squares(num_students, combo_masks, capacities)
+            if score is None: continue
+            ranked.append((len({day for day, _ in combo}) < num_batches, score, combo))
+        expected = [combo for *_, combo in sorted(ranked, key=lambda e: e[:2])][:app.TOP_N_SOLUTIONS_TO_SHOW]
+        found, timed_out = app._search_slot_combinations([str(j) for j in range(num_students)], slots, masks, num_batches, solver, slot_capacities=slot_capacities)
+        assert not timed_out
+        assert list(found) == expected
+
+
+def test_rooms_csv_is_read(tmp_path, monkeypatch):
+    rooms_csv = tmp_path / 'rooms1.csv'
+    rooms_csv.write_text('Room,Capacity\nNC01,30\n NC02 ,abc\nNC01,99\n,5\nLAB1,60\n')
+    monkeypatch.setattr(app, 'ROOMS_CSV_PATH', str(rooms_csv))
+    students_df, timetable_df, rooms_df, data_version = app._read_data_files()
+    assert app.ROOMS_CSV_PATH in app._data_file_paths()
+    assert data_version != app.DATA_VERSION
+    # Blank rooms and repeats are dropped, spaces trimmed, a capacity that is not a number is unknown
+    assert app._room_capacities(rooms_df) == {'NC01': 30, 'NC02': None, 'LAB1': 60}
+    state = app._build_state(students_df, timetable_df, rooms_df, data_version)
+    assert state['room_capacity'] == {'NC01': 30, 'NC02': None, 'LAB1': 60}
+    assert all(set(free) <= {'NC01', 'NC02', 'LAB1'} for free in state['room_occupancy'].values())
+
+
+def test_without_rooms_csv_every_default_room_has_unknown_size(monkeypatch):
+    monkeypatch.setattr(app, 'ROOMS_CSV_PATH', 'no-such-rooms.csv')
+    assert app._data_file_paths() == (app.STUDENTS_CSV_PATH, app.TIMETABLE_CSV_PATH)
+    assert app._room_capacities(None) == {room: None for room in app.AVAILABLE_ROOMS}
+
+
+def test_slot_capacities(rooms):
+    availability_map = {
+        ('Monday', '08:30-09:30'): {'available_rooms': ['R10', 'R40']},
+        ('Monday', '09:30-10:30'): {'available_rooms': ['R10', 'HALL']},
+        ('Monday', '10:30-11:30'): {'available_rooms': []},
+    }
+    assert app._slot_capacities(availability_map, availability_map) == {
+        ('Monday', '08:30-09:30'): 40, ('Monday', '09:30-10:30'): None, ('Monday', '10:30-11:30'): None
+    }
+    assert app._slot_capacities(availability_map, [('Monday', '09:30-10:30')]) is None
+
+
+def test_assign_rooms(rooms):
+    available = {('Monday', '08:30-09:30'): ['R40', 'R20', 'R10', 'HALL'], ('Monday', '09:00-10:00'): ['R40', 'R20'], ('Tuesday', '08:30-09:30'): ['R10']}
+    # The biggest batch picks first and takes the smallest room it fits; overlapping batches never share a room
+    combo = [('Monday', '08:30-09:30'), ('Monday', '09:00-10:00')]
+    assert app._assign_rooms(combo, [8, 15], available) == ['R10', 'R20']
+    assert app._assign_rooms(combo, [15, 18], available) == ['R40', 'R20']
+    assert app._assign_rooms(combo, [35, 38], available) == ['HALL', 'R40']
+    # No free room big enough
+    assert app._assign_rooms([('Tuesday', '08:30-09:30')], [12], available) == [None]
+    # A room claimed for an overlapping time is skipped
+    claimed = app.RoomIntervalIndex([('R10', 'Monday', '09:00-09:45')])
+    assert app._assign_rooms([('Monday', '08:30-09:30')], [5], available, claimed) == ['R20']
+
+
+def test_materialized_batches_fit_their_rooms(rooms):
+    target_order = app.STUDENT_MIS_LIST[:25]
+    everyone = (1 << 25) - 1
+    slots = [('Monday', '08:30-09:30'), ('Tuesday', '08:30-09:30')]
+    availability_map = {slots[0]: {'free_students': set(target_order), 'available_rooms': ['R10']},
+                        slots[1]: {'free_students': set(target_order), 'available_rooms': ['R20', 'R40']}}
+    slot_masks = {slot: everyone for slot in slots}
+    for solver in app.SOLVER_OPTIONS:
+        ranked, _ = app._search_slot_combinations(target_order, slots, slot_masks, 2, solver, slot_capacities=app._slot_capacities(availability_map, slots))
+        assert ranked == [tuple(slots)]
+        result = app._lean_result(target_order, ranked, slot_masks, availability_map, solver)
+        option = app._materialize_option(result, ranked[0])
+        assert [len(batch['students']) for batch in option] == [10, 15]
+        assert [batch['room'] for batch in option] == ['R10', 'R20']
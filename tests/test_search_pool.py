@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+import random
+
+import pytest
+
+import app
+
+
+def die_in_search_process(*args):
+    # Kills any search process it runs in; in the test process itself it is the real walker
+    if multiprocessing.parent_process() is not None: os._exit(1)
+    return app._combinations_partition(*args)
+
+
+@pytest.fixture
+def search_pool(monkeypatch):
+    monkeypatch.setattr(app, 'SEARCH_WORKERS', 2)
+    monkeypatch.setattr(app, 'PARALLEL_MIN_COMBINATIONS', 1)
+    monkeypatch.setattr(app, 'search_pool', None)
+    yield
+    if app.search_pool is not None: app.search_pool.shutdown()
+
+
+def test_dead_search_process_falls_back_to_in_process(search_pool):
+    rng = random.Random(7)
+    num_students, slots = 8, [(f"D{i % 3}", f"T{i}") for i in range(8)]
+    masks = [rng.getrandbits(num_students) for _ in slots]
+    args = (num_students, slots, masks, 2, 'flow', app.TOP_N_SOLUTIONS_TO_SHOW, None)
+    expected = app._combinations_partition(*args, range(len(slots)), None)[0]
+    found, timed_out = app._run_partitioned(die_in_search_process, args, len(slots), 100, None)
+    assert found == [expected] and not timed_out
+    assert app.search_pool is None
+
+
+def test_forkserver_processes_do_not_reload_the_data(search_pool):
+    pool = app._start_search_pool('forkserver')
+    # A search process that had to import app itself (loading the CSVs again) would answer False:
+    # eval runs before anything is unpickled that could import it
+    assert all(pool.map(eval, ["'app' in __import__('sys').modules"] * 8))
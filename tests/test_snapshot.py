@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def same(a, b):
+    # Deep equality for the state dicts: frames by their values (a snapshot's columns are categoricals), arrays by content
+    if isinstance(a, pd.DataFrame):
+        return list(a.columns) == list(b.columns) and a.astype(object).fillna('').equals(b.astype(object).fillna(''))
+    if isinstance(a, np.ndarray): return a.dtype == b.dtype and np.array_equal(a, b)
+    if isinstance(a, dict): return type(b) is dict and a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)): return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, (app.StudentScheduleView, app.RoomIntervalIndex)): return same(vars(a), vars(b))
+    return type(a) is type(b) and a == b
+
+
+def mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap): return True
+        array = array.base
+    return False
+
+
+def test_snapshot_rebuilds_the_csv_state(tmp_path):
+    snapshot_dir = str(tmp_path / 'snapshot')
+    assert app.build_data_snapshot(snapshot_dir)['data_version'] == app.DATA_VERSION
+    snapshot, reason = app._read_data_snapshot(snapshot_dir)
+    assert reason is None
+    for frame in snapshot[:2]:
+        for column in frame.columns:
+            assert isinstance(frame[column].dtype, pd.CategoricalDtype) and mapped(frame[column].array.codes)
+    from_csv, from_snapshot = app._build_state(*app._read_data_files()), app._build_state(*snapshot)
+    assert from_csv.keys() == from_snapshot.keys()
+    assert [key for key in from_csv if not same(from_csv[key], from_snapshot[key])] == []
+    # The live frames keep the mapped codes too
+    assert mapped(from_snapshot['students_df_global']['Name'].array.codes)
+
+
+def test_stale_or_foreign_snapshots_are_ignored(tmp_path, monkeypatch):
+    snapshot_dir = str(tmp_path / 'snapshot')
+    app.build_data_snapshot(snapshot_dir)
+    assert app._read_data_snapshot(str(tmp_path / 'missing')) == (None, 'missing')
+    monkeypatch.setattr(app, 'SNAPSHOT_FORMAT', app.SNAPSHOT_FORMAT + 1)
+    assert app._read_data_snapshot(snapshot_dir) == (None, 'built by another version')
+    monkeypatch.undo()
+    monkeypatch.setattr(app, '_data_files_hash', lambda: 'something else')
+    assert app._read_data_snapshot(snapshot_dir) == (None, 'stale')
@@ -0,0 +1,97 @@
+import itertools
+import random
+
+import pytest
+
+import app
+
+
+def exhaustive_sum_of_squares(num_students, combo_masks):
+    # Smallest sum of squared batch sizes over every way of seating each student in a slot they are free for
+    options = [[i for i, mask in enumerate(combo_masks) if mask >> j & 1] for j in range(num_students)]
+    best = None
+    for choice in itertools.product(*options):
+        sizes = [choice.count(i) for i in range(len(combo_masks))]
+        score = sum(size ** 2 for size in sizes)
+        best = score if best is None else min(best, score)
+    return best
+
+
+def covering_masks(rng, num_students, num_batches):
+    full = (1 << num_students) - 1
+    while True:
+        masks = [rng.getrandbits(num_students) for _ in range(num_batches)]
+        if union_of(masks) == full: return masks
+
+
+def union_of(masks):
+    union = 0
+    for mask in masks: union |= mask
+    return union
+
+
+def test_flow_split_is_minimal():
+    rng = random.Random(2)
+    for _ in range(400):
+        num_students, num_batches = rng.randint(1, 8), rng.randint(1, 4)
+        masks = covering_masks(rng, num_students, num_batches)
+        pattern_groups = app._split_by_pattern(masks, (1 << num_students) - 1)
+        alloc, sizes = app._balanced_flow_split(pattern_groups, num_batches)
+        # A valid split: every student seated once, only in batches their pattern allows
+        for pattern, counts in alloc.items():
+            assert sum(counts) == pattern_groups[pattern].bit_count()
+            assert all(pattern >> i & 1 for i, count in enumerate(counts) if count)
+        assert sizes == [sum(counts[i] for counts in alloc.values()) for i in range(num_batches)]
+        expected = exhaustive_sum_of_squares(num_students, masks)
+        assert sum(size ** 2 for size in sizes) == expected
+        assert app._score_combination(num_students, masks, 'flow') == expected
+
+
+@pytest.mark.parametrize('solver', app.SOLVER_OPTIONS)
+def test_combination_search_matches_brute_force(solver):
+    rng = random.Random(3)
+    for _ in range(300):
+        num_students, num_batches = rng.randint(1, 9), rng.randint(1, 4)
+        slots = [(f"D{i % 3}", f"T{i}") for i in range(rng.randint(num_batches, 7))]
+        masks = {slot: rng.getrandbits(num_students) for slot in slots}
+        target_order = [str(j) for j in range(num_students)]
+        different_days, same_day = [], []
+        for combo in itertools.combinations(slots, num_batches):
+            combo_masks = [masks[slot] for slot in combo]
+            if union_of(combo_masks) != (1 << num_students) - 1: continue
+            score = app._score_combination(num_students, combo_masks, solver)
+            (different_days if len({day for day, _ in combo}) == num_batches else same_day).append((score, combo))
+        # Stable sorts: equal scores keep combinations() order
+        expected = [combo for _, combo in sorted(different_days, key=lambda e: e[0]) + sorted(same_day, key=lambda e: e[0])]
+        expected = expected[:app.TOP_N_SOLUTIONS_TO_SHOW]
+        found, timed_out = app._search_slot_combinations(target_order, slots, masks, num_batches, solver)
+        assert not timed_out
+        assert list(found) == expected
+
+
+@pytest.fixture(params=['in_process', 'search_pool'])
+def search_mode(request, monkeypatch):
+    if request.param == 'search_pool':
+        monkeypatch.setattr(app, 'SEARCH_WORKERS', 2)
+        monkeypatch.setattr(app, 'PARALLEL_MIN_COMBINATIONS', 1)
+    return request.param
+
+
+@pytest.mark.parametrize('solver', app.SOLVER_OPTIONS)
+def test_product_search_matches_brute_force(solver, search_mode):
+    rng = random.Random(4)
+    for _ in range(300 if search_mode == 'in_process' else 60):
+        num_students, num_batches = rng.randint(1, 9), rng.randint(1, 3)
+        slots = [(f"D{i % 3}", f"T{i}") for i in range(rng.randint(num_batches, 6))]
+        masks = {slot: rng.getrandbits(num_students) for slot in slots}
+        pools = [rng.sample(slots, rng.randint(1, len(slots))) for _ in range(num_batches)]
+        target_order = [str(j) for j in range(num_students)]
+        ranked = []
+        for combo in itertools.product(*pools):
+            combo_masks = [masks[slot] for slot in combo]
+            if len(set(combo)) < len(combo) or union_of(combo_masks) != (1 << num_students) - 1: continue
+            ranked.append((app._score_combination(num_students, combo_masks, solver), combo))
+        expected = [combo for _, combo in sorted(ranked, key=lambda e: e[0])][:app.TOP_N_SOLUTIONS_TO_SHOW]
+        found, timed_out = app._search_slot_product(target_order, pools, masks, solver)
+        assert not timed_out
+        assert list(found) == expected
@@ -0,0 +1,19 @@
+import json
+import re
+
+import app
+
+
+def test_streamed_search_reports_its_timing(monkeypatch):
+    monkeypatch.setattr(app, 'result_cache', app.ResultCache('memory', None, 8, 60)) # a search, not a cache hit
+    largest = max(app.group_members_map, key=lambda group: len(app.group_members_map[group]))
+    form = {'student_mode': 'by_group', 'subject': largest[0], 'division': largest[1], 'num_batches': '3'}
+    client = app.app.test_client()
+    response = client.post('/mode_2_batch_finder?stream=1', data=form)
+    done = json.loads(response.get_data(as_text=True).splitlines()[-1])
+    assert done['event'] == 'done' and done['http_status'] == 200
+    assert done['solutions'] == client.post('/mode_2_batch_finder', data=form).get_json()['solutions']
+    # The search ran on the stream's own thread, and still counted towards the request
+    assert {'availability', 'search', 'materialize', 'total'} <= set(re.findall(r'(\w+);dur=', done['server_timing']))
+    assert int(re.search(r'search;dur=[\d.]+;desc="(\d+) combinations"', done['server_timing']).group(1)) > 0
+    assert 'freestudents_stream_seconds_count{endpoint="mode_2_batch_finder"}' in client.get('/metrics').get_data(as_text=True)
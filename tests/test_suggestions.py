@@ -0,0 +1,32 @@
+import app
+
+
+def test_first_feasible_stops_at_the_first_option():
+    subject, division = app.GROUP_KEYS[0]
+    target = {app.STUDENT_MIS_LIST[i] for i in app.group_members_map[(subject, division)]}
+    pool = app.all_possible_slots_NO_SATURDAY
+    with app.app.test_request_context():
+        planner = app.SuggestionPlanner(target, [pool])
+        calls = []
+        rank = planner.rank
+        planner.rank = lambda *subproblem: calls.append(subproblem) or rank(*subproblem)
+        subproblems = [([], 1), (pool, 2), (pool, 3)]
+        position, result = planner.first_feasible(subproblems)
+        assert position == 1 and result['ranked']
+        assert calls == subproblems[:2]
+        # Each subproblem ranks exactly as a search of its own would
+        assert result['ranked'] == app._rank_for_pool(target, pool, 2)['ranked']
+        assert planner.first_feasible([([], 1), (pool[:1], 2)]) == (None, None)
+        assert [bool(r['ranked']) for r in planner.rank_all(subproblems)] == [False, True, True]
+
+
+def test_mode_2_suggests_more_batches():
+    # A slot everyone in a random crowd is free for is rare, while a few batches cover them
+    students = app.STUDENT_MIS_LIST[::7][:150]
+    response = app.app.test_client().post('/mode_2_batch_finder', data={'student_mode': 'by_mis', 'mis_numbers': ' '.join(students), 'num_batches': '1'})
+    body = response.get_json()
+    assert body['status'] == 'failure_with_suggestion' and body['requested_batches'] == 1
+    suggested_batches = len(body['suggestion']['solutions'][0])
+    assert suggested_batches > 1
+    option = body['suggestion']['solutions'][0]
+    assert sorted(student['MIS'] for batch in option for student in batch['students']) == sorted(students)
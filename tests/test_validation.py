@@ -0,0 +1,55 @@
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2], 'MAC', 5,
+    {'groups': [5]}, {'groups': 'MAC|Division 1'}, {'groups': [['MAC']]},
+    {'subjects': 'MAC'}, {'subjects': [5]},
+    {'groups': ['MAC|Division 1'], 'excluded_slots': 'Monday|08:30-09:30'},
+    {'groups': ['MAC|Division 1'], 'num_batches': 'two'},
+])
+def test_bulk_schedule_rejects_malformed_bodies(body):
+    response = app.app.test_client().post('/bulk_schedule', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2], 'edits', 5,
+    {'edits': 'move'}, {'edits': [5]}, {'edits': [{'from': 'MAC'}]},
+    {'edits': [{'to': {'Subject': 'MAC'}}]},
+    {'edits': [{'from': {'Subject': 'No such subject', 'Division': 'A', 'Day': 'Monday', 'Time': '08:30-09:30'}}]},
+])
+def test_what_if_rejects_malformed_bodies(body):
+    response = app.app.test_client().post('/what_if', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('num_batches', ['0', '-1', 'two'])
+@pytest.mark.parametrize('route', ['/mode_2_batch_finder', '/mode_3_advanced_finder', '/mode_5_day_finder'])
+def test_search_routes_reject_bad_batch_counts(route, num_batches):
+    subject, division = app.GROUP_KEYS[0]
+    form = {'student_mode': 'by_group', 'subject': subject, 'division': division, 'num_batches': num_batches, 'm5_day': 'Monday'}
+    response = app.app.test_client().post(route, data=form)
+    assert response.status_code == 400
+    assert 'num_batches' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('num_batches', [0, -2])
+def test_bulk_schedule_rejects_bad_batch_counts(num_batches):
+    subject, division = app.GROUP_KEYS[0]
+    response = app.app.test_client().post('/bulk_schedule', json={'groups': [[subject, division]], 'num_batches': num_batches})
+    assert response.status_code == 400
+    assert 'num_batches' in response.get_json()['error']
+
+
+@pytest.mark.parametrize('num_batches', ['0', '-1', 'two'])
+def test_mode_4_rejects_bad_batch_counts(num_batches):
+    subject, division = app.GROUP_KEYS[0]
+    form = {'student_mode': 'by_group', 'subject': subject, 'division': division, 'num_batches': num_batches}
+    response = app.app.test_client().post('/mode_4_planner', data=form)
+    assert response.status_code == 400
+    assert 'num_batches' in response.get_json()['error']